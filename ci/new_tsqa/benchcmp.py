@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+'''
+Store benchmark baselines and compare benchmark results against them
+
+    benchcmp.py save [NAME]     store the results of the current source tree
+                                as baseline NAME (default "default")
+    benchcmp.py compare [NAME]  compare the results of the current source tree
+                                against baseline NAME, exits 1 on a
+                                significant regression
+
+Results of the current tree are all results in the results file with its
+source hash, so repeated runs (make bench REPEAT=5) add up. Only results from
+hosts with the same fingerprint and with the same configure flags are
+compared. Throughput, p99 latency and start-up time are compared with a
+bootstrap confidence interval on the relative change of the mean.
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'))
+
+import baseline
+import bench
+
+log = logging.getLogger('benchcmp')
+
+
+def current_records(results):
+    '''
+    Return the results of the current source tree on this host
+    '''
+    metadata = baseline.run_metadata()
+    return [r for r in baseline.load(results)
+            if r.get('source_hash') == metadata['source_hash'] and
+            r.get('host_fingerprint') == metadata['host_fingerprint']]
+
+
+def save(args):
+    records = current_records(args.results)
+    if not records:
+        log.error('no results for the current source tree in {0}'.format(args.results))
+        return 2
+    baseline.save_baseline(args.name, records)
+    runs = len(set(r.get('run_id') for r in records))
+    log.info('saved {0} results from {1} runs as baseline {2}'.format(len(records), runs, args.name))
+    return 0
+
+
+def compare(args):
+    fingerprint = baseline.run_metadata()['host_fingerprint']
+    stored = baseline.load(baseline.baseline_path(args.name))
+    base_records = [r for r in stored if r.get('host_fingerprint') == fingerprint]
+    if not base_records:
+        if stored:
+            log.warning('baseline {0} was recorded on a different host, not comparing'.format(args.name))
+        else:
+            log.warning('no baseline {0}'.format(args.name))
+        return 0 if args.if_baseline else 2
+
+    records = current_records(args.results)
+    if not records:
+        log.warning('no results for the current source tree in {0}'.format(args.results))
+        return 0 if args.if_baseline else 2
+
+    comparisons = baseline.compare(base_records, records,
+                                   confidence=args.confidence,
+                                   threshold=args.threshold,
+                                   min_baseline_runs=args.min_baseline_runs,
+                                   )
+    print('{0:<90} {1:>4} {2:>4} {3:>8} {4:>18}  {5}'.format('metric', 'base', 'new', 'change', 'interval', 'status'))
+    for c in comparisons:
+        if c.change is None:
+            change = interval = '-'
+        else:
+            change = '{0:+.1%}'.format(c.change)
+            interval = '[{0:+.1%}, {1:+.1%}]'.format(c.low, c.high)
+        print('{0:<90} {1:>4} {2:>4} {3:>8} {4:>18}  {5}'.format(c.name[-90:], len(c.baseline), len(c.candidate),
+                                                                 change, interval, c.status))
+
+    regressions = [c for c in comparisons if c.regression]
+    log.info('{0} metrics compared, {1} regressions'.format(len(comparisons), len(regressions)))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--results', default=bench.RESULTS_FILE,
+                        help='benchmark results file')
+    subparsers = parser.add_subparsers()
+
+    save_parser = subparsers.add_parser('save', help='store the current results as a baseline')
+    save_parser.add_argument('name', nargs='?', default='default')
+    save_parser.set_defaults(func=save)
+
+    compare_parser = subparsers.add_parser('compare', help='compare the current results to a baseline')
+    compare_parser.add_argument('name', nargs='?', default='default')
+    compare_parser.add_argument('--confidence', type=float, default=0.95,
+                                help='confidence level of the bootstrap intervals')
+    compare_parser.add_argument('--threshold', type=float, default=0.05,
+                                help='smallest relative change that counts as a regression')
+    compare_parser.add_argument('--min-baseline-runs', type=int, default=3,
+                                help='baseline runs needed before a metric is compared')
+    compare_parser.add_argument('--if-baseline', action='store_true',
+                                help='succeed when there is nothing to compare against')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''
+Summarize squid format access logs: hit ratios, latency percentiles, and
+requests and bytes per cache code, status and host
+
+    logstats.py squid.log [squid.log_host.*.old ...]
+    logstats.py --logdir /path/to/logs
+
+Files are memory mapped, parsed into numpy columns and split across a pool
+of processes. Parsing runs at about 200k lines (25MB) a second per process,
+so a GB of log takes some seconds on a many core machine and a minute or so
+on a few cores.
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'))
+
+import squidlog
+
+log = logging.getLogger('logstats')
+
+
+def print_table(title, groups, count):
+    print('\n{0:<50} {1:>12} {2:>16}'.format(title, 'requests', 'bytes'))
+    top = sorted(groups.iteritems(), key=lambda item: item[1]['requests'], reverse=True)[:count]
+    for key, entry in top:
+        print('{0:<50} {1:>12} {2:>16}'.format(str(key)[:50], entry['requests'], entry['bytes']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='log files')
+    parser.add_argument('--logdir', help='analyze squid.log and its rolled logs in this directory')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of processes (default one per cpu)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of hosts to list')
+    parser.add_argument('--json', action='store_true',
+                        help='print the summary as JSON')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    paths = args.paths + (squidlog.log_files(args.logdir) if args.logdir else [])
+    if not paths:
+        parser.error('no log files')
+
+    start = time.time()
+    stats = squidlog.analyze(paths, processes=args.processes)
+    log.info('analyzed {0} requests in {1} files in {2:.2f}s'.format(stats.requests, len(paths), time.time() - start))
+
+    if args.json:
+        print(json.dumps(stats.to_dict(), sort_keys=True, indent=2))
+        return
+    print('requests        {0}'.format(stats.requests))
+    print('hit ratio       {0}'.format(stats.hit_ratio))
+    print('byte hit ratio  {0}'.format(stats.byte_hit_ratio))
+    print('latency (ms)    {0}'.format(' '.join('{0}={1}'.format(k, v) for k, v in sorted(stats.percentiles().items()))))
+    print_table('cache code', stats.cache_codes, len(stats.cache_codes))
+    print_table('status', stats.statuses, len(stats.statuses))
+    print_table('host', stats.hosts, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+'''
+Run the tsqa test classes in parallel
+
+Every test class is run by its own nosetests process. Up to --jobs of them
+run at once, each worker with its own temp (and therefore layout) directory
+and its own port range. Classes which bind the same fixed ports (their
+fixed_ports attribute) never run at the same time. The per-class xunit
+reports are merged into one.
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import glob
+import imp
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+log = logging.getLogger('runtests')
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+
+# worker N allocates ports from PORT_BASE + N * PORT_SPAN. Up to MAX_JOBS
+# workers this stays below the linux ephemeral range (32768-60999 by default),
+# so the kernel won't hand them out to anyone else
+PORT_BASE = 10000
+PORT_SPAN = 500
+EPHEMERAL_PORT_LOW = 32768
+MAX_JOBS = (EPHEMERAL_PORT_LOW - PORT_BASE) // PORT_SPAN
+
+# xunit attributes which are summed when merging reports
+COUNTERS = ('tests', 'errors', 'failures', 'skip')
+
+
+def discover(names=None):
+    '''
+    Return {"module:Class": fixed ports} for every test class in TESTS_DIR,
+    optionally limited to modules/classes in names
+    '''
+    sys.path.insert(0, TESTS_DIR)
+    ret = {}
+    for path in sorted(glob.glob(os.path.join(TESTS_DIR, 'test_*.py'))):
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        module = imp.load_source(module_name, path)
+        loader = unittest.TestLoader()
+        for attr in sorted(dir(module)):
+            cls = getattr(module, attr)
+            if not isinstance(cls, type) or not issubclass(cls, unittest.TestCase):
+                continue
+            # only classes defined in the module, not ones it imported
+            if cls.__module__ != module_name or not loader.getTestCaseNames(cls):
+                continue
+            name = '{0}:{1}'.format(module_name, attr)
+            if names and module_name not in names and name not in names:
+                continue
+            ret[name] = frozenset(getattr(cls, 'fixed_ports', ()))
+    return ret
+
+
+class Runner(object):
+    def __init__(self, jobs, tmp_dir, report, nose_args):
+        self.jobs = jobs
+        self.tmp_dir = tmp_dir
+        self.report = report
+        self.nose_args = nose_args
+        self.output_dir = os.path.join(tmp_dir, 'runtests')
+        self.runtimes_path = os.path.join(tmp_dir, 'runtimes.json')
+        self.results = {}
+        # classes not started yet, and the fixed ports of the running ones
+        self._pending = []
+        self._held = set()
+        self._cond = threading.Condition()
+        self.run_id = '{0:.0f}-{1}'.format(time.time(), os.getpid())
+        self._lock = threading.Lock()
+
+    def _load_runtimes(self):
+        try:
+            with open(self.runtimes_path) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def _take(self, names):
+        '''
+        Return the next pending class whose fixed ports aren't held by a running
+        one (waiting for one to finish if needed), None when all were started
+        '''
+        with self._cond:
+            while self._pending:
+                for name in self._pending:
+                    if not names[name] & self._held:
+                        self._pending.remove(name)
+                        self._held.update(names[name])
+                        return name
+                self._cond.wait()
+            return None
+
+    def _release(self, names, name):
+        with self._cond:
+            self._held.difference_update(names[name])
+            self._cond.notify_all()
+
+    def _worker(self, slot, names):
+        worker_tmp = os.path.join(self.tmp_dir, 'workers', str(slot))
+        if not os.path.isdir(worker_tmp):
+            os.makedirs(worker_tmp)
+        env = dict(os.environ)
+        env.update({'TMPDIR': worker_tmp,
+                    # so benchmark results of all workers count as one run
+                    'TSQA_RUN_ID': self.run_id,
+                    'TSQA_TMP_DIR': self.tmp_dir,
+                    'TSQA_PORT_RANGE': '{0}-{1}'.format(PORT_BASE + slot * PORT_SPAN,
+                                                        PORT_BASE + (slot + 1) * PORT_SPAN - 1),
+                    })
+        while True:
+            name = self._take(names)
+            if name is None:
+                return
+            xunit = os.path.join(self.output_dir, name.replace(':', '.') + '.xml')
+            output = os.path.join(self.output_dir, name.replace(':', '.') + '.log')
+            cmd = ['nosetests', '--with-xunit', '--xunit-file={0}'.format(xunit)]
+            cmd.extend(self.nose_args)
+            cmd.append(os.path.join(TESTS_DIR, name.replace(':', '.py:')))
+            start = time.time()
+            with open(output, 'w') as fh:
+                ret = subprocess.call(cmd, cwd=TESTS_DIR, env=env, stdout=fh, stderr=subprocess.STDOUT)
+            elapsed = time.time() - start
+            self._release(names, name)
+            log.info('{0} {1} in {2:.1f}s (worker {3})'.format(name, 'ok' if ret == 0 else 'FAILED', elapsed, slot))
+            with self._lock:
+                self.results[name] = {'returncode': ret, 'elapsed': elapsed, 'xunit': xunit, 'output': output}
+
+    def run(self, names):
+        '''
+        Run the classes of names, the discover() dict
+        '''
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        # start the slowest classes first so the run ends close to the time
+        # of the slowest one
+        runtimes = self._load_runtimes()
+        self._pending = sorted(names, key=lambda n: runtimes.get(n, float('inf')), reverse=True)
+
+        threads = []
+        for slot in xrange(min(self.jobs, len(names))):
+            t = threading.Thread(target=self._worker, args=(slot, names))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        runtimes.update(dict((n, r['elapsed']) for n, r in self.results.iteritems()))
+        with open(self.runtimes_path, 'w') as fh:
+            json.dump(runtimes, fh, indent=2, sort_keys=True)
+
+        self.merge_reports()
+        return all(r['returncode'] == 0 for r in self.results.itervalues())
+
+    def merge_reports(self):
+        '''
+        Merge the per-class xunit files into self.report
+        '''
+        merged = ElementTree.Element('testsuite', name='nosetests')
+        totals = dict((c, 0) for c in COUNTERS)
+        for name in sorted(self.results):
+            result = self.results[name]
+            try:
+                suite = ElementTree.parse(result['xunit']).getroot()
+            except (IOError, ElementTree.ParseError):
+                # nosetests died before writing a report, record that as an error
+                case = ElementTree.SubElement(merged, 'testcase', classname=name.replace(':', '.'), name='runtests')
+                ElementTree.SubElement(case, 'error', message='no report, see {0}'.format(result['output']))
+                totals['tests'] += 1
+                totals['errors'] += 1
+                continue
+            for c in COUNTERS:
+                totals[c] += int(suite.get(c, 0))
+            for case in suite:
+                merged.append(case)
+        for c in COUNTERS:
+            merged.set(c, str(totals[c]))
+        ElementTree.ElementTree(merged).write(self.report, encoding='utf-8', xml_declaration=True)
+        log.info('{tests} tests, {failures} failures, {errors} errors, {skip} skipped'.format(**totals))
+        log.info('merged report written to {0}'.format(self.report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-j', '--jobs', type=int, default=min(multiprocessing.cpu_count(), MAX_JOBS),
+                        help='number of test classes to run at once (at most {0})'.format(MAX_JOBS))
+    parser.add_argument('--report', default='nosetests.xml',
+                        help='where to write the merged xunit report')
+    parser.add_argument('--tmp-dir', default=os.environ.get('TSQA_TMP_DIR', os.path.join(tempfile.gettempdir(), 'tsqa')),
+                        help='shared tsqa temp dir (build cache, per worker layouts)')
+    parser.add_argument('--nose-arg', action='append', default=['-sv', '--logging-level=INFO'],
+                        help='extra argument to pass to each nosetests process')
+    parser.add_argument('tests', nargs='*',
+                        help='modules (test_example) or classes (test_example:TestBootstrap) to run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if args.jobs > MAX_JOBS:
+        parser.error('more than {0} jobs would allocate ports from the ephemeral range'.format(MAX_JOBS))
+
+    names = discover(args.tests)
+    if not names:
+        parser.error('no test classes found')
+    log.info('running {0} test classes with {1} workers'.format(len(names), args.jobs))
+
+    runner = Runner(args.jobs, args.tmp_dir, os.path.abspath(args.report), args.nose_arg)
+    sys.exit(0 if runner.run(names) else 1)
+
+
+if __name__ == '__main__':
+    main()
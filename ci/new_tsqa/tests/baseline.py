@@ -0,0 +1,241 @@
+'''
+Benchmark run metadata, baseline storage and statistical comparison
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+
+import build_cache
+import helpers
+
+SOURCE_DIR = os.path.realpath(os.path.join(__file__, '..', '..', '..', '..'))
+
+# where named baselines are stored (one JSON lines file each)
+BASELINE_DIR = os.environ.get('TSQA_BASELINE_DIR', os.path.join(helpers.TMP_DIR, 'baselines'))
+
+HIGHER_IS_BETTER = 1
+LOWER_IS_BETTER = -1
+
+# (field, direction) of the result fields which are compared, nested fields
+# are separated by dots
+METRICS = (('rps', HIGHER_IS_BETTER),
+           ('latency_ms.p99', LOWER_IS_BETTER),
+           ('startup_seconds', LOWER_IS_BETTER),
+           )
+
+_metadata = None
+
+
+def git_revision(source_dir=SOURCE_DIR):
+    try:
+        return build_cache._git(source_dir, 'rev-parse', 'HEAD').strip()
+    except (RuntimeError, OSError):
+        return 'unknown'
+
+
+def host_info():
+    '''
+    Return what describes the hardware (and kernel) benchmarks ran on
+    '''
+    ret = {'hostname': socket.gethostname(),
+           'kernel': os.uname()[2],
+           'cpus': multiprocessing.cpu_count(),
+           }
+    try:
+        with open('/proc/cpuinfo') as fh:
+            for line in fh:
+                if line.startswith('model name'):
+                    ret['cpu'] = line.partition(':')[2].strip()
+                    break
+        with open('/proc/meminfo') as fh:
+            for line in fh:
+                if line.startswith('MemTotal:'):
+                    ret['memory_kb'] = int(line.split()[1])
+                    break
+    except IOError:
+        pass
+    return ret
+
+
+def host_fingerprint(info):
+    '''
+    Hash of everything in host_info() but the hostname, so identical machines
+    share baselines
+    '''
+    relevant = dict((k, v) for k, v in info.iteritems() if k != 'hostname')
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True)).hexdigest()[:12]
+
+
+def run_metadata():
+    '''
+    Return the fields recorded with every result of this run. runtests.py sets
+    TSQA_RUN_ID so all its workers share one run id.
+    '''
+    global _metadata
+    if _metadata is None:
+        host = host_info()
+        _metadata = {'run_id': os.environ.get('TSQA_RUN_ID', '{0:.0f}-{1}'.format(time.time(), os.getpid())),
+                     'revision': git_revision(),
+                     'source_hash': build_cache.source_hash(SOURCE_DIR),
+                     'host': host,
+                     'host_fingerprint': host_fingerprint(host),
+                     }
+    return _metadata
+
+
+def load(path):
+    '''
+    Return the records of a results (or baseline) file
+    '''
+    ret = []
+    try:
+        fh = open(path)
+    except IOError:
+        return ret
+    with fh:
+        for line in fh:
+            try:
+                ret.append(json.loads(line))
+            except ValueError:
+                continue
+    return ret
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, '{0}.json'.format(name))
+
+
+def save_baseline(name, records):
+    if not os.path.isdir(BASELINE_DIR):
+        os.makedirs(BASELINE_DIR)
+    tmp = baseline_path(name) + '.tmp'
+    with open(tmp, 'w') as fh:
+        for record in records:
+            fh.write(json.dumps(record, sort_keys=True) + '\n')
+    os.rename(tmp, baseline_path(name))
+
+
+def metric_value(record, field):
+    value = record
+    for part in field.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def group(records):
+    '''
+    Return {(test, scenario, configure): [record]}
+    '''
+    ret = {}
+    for record in records:
+        key = (record.get('test'), record.get('scenario'), json.dumps(record.get('configure')))
+        ret.setdefault(key, []).append(record)
+    return ret
+
+
+def _mean(values):
+    return sum(values) / float(len(values))
+
+
+def bootstrap_ci(baseline, candidate, confidence=0.95, iterations=10000, rng=None):
+    '''
+    Return (change, low, high): the relative change of the candidate mean over
+    the baseline mean and its bootstrap confidence interval
+    '''
+    rng = rng or random.Random(0)
+    change = _mean(candidate) / _mean(baseline) - 1
+    samples = []
+    for _ in xrange(iterations):
+        b = _mean([rng.choice(baseline) for _ in baseline])
+        c = _mean([rng.choice(candidate) for _ in candidate])
+        if b:
+            samples.append(c / b - 1)
+    samples.sort()
+    alpha = 1 - confidence
+    low = samples[int(alpha / 2 * len(samples))]
+    high = samples[min(int((1 - alpha / 2) * len(samples)), len(samples) - 1)]
+    return change, low, high
+
+
+class Comparison(object):
+    '''
+    Result of comparing one metric of one scenario against the baseline
+    '''
+    def __init__(self, key, field, direction, baseline, candidate):
+        self.key = key
+        self.field = field
+        self.direction = direction
+        self.baseline = baseline
+        self.candidate = candidate
+        self.change = self.low = self.high = None
+        self.status = 'ok'
+
+    @property
+    def name(self):
+        test, scenario, _ = self.key
+        return '{0} {1} {2}'.format(test, scenario, self.field)
+
+    def evaluate(self, confidence, threshold, min_baseline_runs):
+        if len(self.baseline) < min_baseline_runs:
+            self.status = 'too few baseline runs'
+            return
+        if not _mean(self.baseline):
+            self.status = 'zero baseline'
+            return
+        self.change, self.low, self.high = bootstrap_ci(self.baseline, self.candidate, confidence)
+        # only significant if the whole interval is on one side of 0, and
+        # only interesting if the change is bigger than threshold
+        worse = self.high < 0 if self.direction == HIGHER_IS_BETTER else self.low > 0
+        better = self.low > 0 if self.direction == HIGHER_IS_BETTER else self.high < 0
+        if worse and abs(self.change) >= threshold:
+            self.status = 'REGRESSION'
+        elif better and abs(self.change) >= threshold:
+            self.status = 'improvement'
+
+    @property
+    def regression(self):
+        return self.status == 'REGRESSION'
+
+
+def compare(baseline_records, candidate_records, confidence=0.95, threshold=0.05, min_baseline_runs=3):
+    '''
+    Compare every metric of every scenario present on both sides, return a
+    list of Comparison
+    '''
+    ret = []
+    baseline_groups = group(baseline_records)
+    for key, records in sorted(group(candidate_records).iteritems()):
+        if key not in baseline_groups:
+            continue
+        for field, direction in METRICS:
+            candidate = [v for v in (metric_value(r, field) for r in records) if v is not None]
+            baseline = [v for v in (metric_value(r, field) for r in baseline_groups[key]) if v is not None]
+            if not candidate or not baseline:
+                continue
+            comparison = Comparison(key, field, direction, baseline, candidate)
+            comparison.evaluate(confidence, threshold, min_baseline_runs)
+            ret.append(comparison)
+    return ret
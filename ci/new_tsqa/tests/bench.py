@@ -0,0 +1,368 @@
+'''
+Load generation and latency accounting for the benchmark tests
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import contextlib
+import httplib
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import baseline
+import helpers
+import metrics
+import procstats
+import startup
+import waiters
+# also used as bench.percentile() and friends by the tests
+from percentiles import PERCENTILES, percentile, percentile_name
+
+log = logging.getLogger(__name__)
+
+# where load results are appended (one JSON object per line)
+RESULTS_FILE = os.environ.get('TSQA_BENCH_OUTPUT', os.path.join(helpers.TMP_DIR, 'benchmarks.json'))
+
+
+def unique_paths(prefix):
+    '''
+    Return a callable which generates a never repeating path under prefix,
+    so every request is a cache miss
+    '''
+    counter = itertools.count()
+    return lambda: '{0}{1}'.format(prefix, next(counter))
+
+
+class LoadResult(object):
+    '''
+    Aggregated results of a single load run
+    '''
+    def __init__(self, scenario, latencies, statuses, errors, elapsed):
+        self.scenario = scenario
+        self.latencies = sorted(latencies)
+        self.statuses = statuses
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def rps(self):
+        if not self.elapsed:
+            return 0.0
+        return self.requests / self.elapsed
+
+    def percentiles(self):
+        '''
+        Return a dict of percentile name -> latency in milliseconds
+        '''
+        ret = {}
+        for pct in PERCENTILES:
+            value = percentile(self.latencies, pct)
+            ret[percentile_name(pct)] = value * 1000 if value is not None else None
+        return ret
+
+    def to_dict(self):
+        return {'scenario': self.scenario,
+                'requests': self.requests,
+                'errors': self.errors,
+                'elapsed': self.elapsed,
+                'rps': self.rps,
+                'statuses': dict((str(k), v) for k, v in self.statuses.iteritems()),
+                'latency_ms': self.percentiles(),
+                }
+
+
+class Generator(object):
+    '''
+    Base for load generators: runs "concurrency" threads of _worker() which
+    claim work with _take() and report back with _merge()
+    '''
+    def __init__(self, concurrency=10):
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+
+    def _next(self):
+        '''
+        Return the next unit of work (called with the lock held)
+        '''
+        return True
+
+    def _take(self):
+        '''
+        Claim the next request from the budget, returning what _next() gives
+        or None if the run is over
+        '''
+        with self._lock:
+            if self._deadline is not None and time.time() >= self._deadline:
+                return None
+            if self._remaining is not None:
+                if self._remaining <= 0:
+                    return None
+                self._remaining -= 1
+            return self._next()
+
+    def _merge(self, latencies, statuses, errors):
+        with self._lock:
+            self._latencies.extend(latencies)
+            self._errors += errors
+            for status, count in statuses.iteritems():
+                self._statuses[status] = self._statuses.get(status, 0) + count
+
+    def _worker(self):
+        raise NotImplementedError()
+
+    def run(self, scenario, requests=None, duration=None):
+        '''
+        Run until "requests" requests have been sent or "duration" seconds
+        have passed (whichever comes first) and return a LoadResult
+        '''
+        if requests is None and duration is None:
+            raise ValueError('Either requests or duration must be set')
+        self._remaining = requests
+        self._latencies = []
+        self._statuses = {}
+        self._errors = 0
+
+        start = time.time()
+        self._deadline = start + duration if duration is not None else None
+        threads = [threading.Thread(target=self._worker) for _ in xrange(self.concurrency)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+
+        return LoadResult(scenario, self._latencies, self._statuses, self._errors, elapsed)
+
+
+class LoadGenerator(Generator):
+    '''
+    Drive concurrent HTTP GETs at address and record the latency of each one
+
+    paths is either a list of paths (requested round-robin) or a callable
+    which returns the next path to request.
+    '''
+    def __init__(self, address, paths, concurrency=10, keepalive=True, headers=None, timeout=10):
+        Generator.__init__(self, concurrency)
+        self.address = address
+        self.keepalive = keepalive
+        self.headers = dict(headers or {})
+        if not keepalive:
+            self.headers['Connection'] = 'close'
+        self.timeout = timeout
+
+        if callable(paths):
+            self._next = paths
+        else:
+            cycle = itertools.cycle(paths)
+            self._next = lambda: next(cycle)
+
+    def _worker(self):
+        latencies = []
+        statuses = {}
+        errors = 0
+        conn = None
+        while True:
+            path = self._take()
+            if path is None:
+                break
+            start = time.time()
+            try:
+                if conn is None:
+                    conn = httplib.HTTPConnection(self.address[0], self.address[1], timeout=self.timeout)
+                conn.request('GET', path, headers=self.headers)
+                resp = conn.getresponse()
+                resp.read()
+            except (socket.error, httplib.HTTPException) as e:
+                log.debug('request for {0} failed: {1}'.format(path, e))
+                errors += 1
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                continue
+            latencies.append(time.time() - start)
+            statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            if not self.keepalive or resp.will_close:
+                conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+        self._merge(latencies, statuses, errors)
+
+
+def write_result(result, **extra):
+    '''
+    Append result.to_dict() (plus any extra fields and the run's metadata,
+    see baseline.run_metadata()) to RESULTS_FILE as a JSON line
+    '''
+    record = result.to_dict()
+    record.update(baseline.run_metadata())
+    record.update(extra)
+    record['timestamp'] = time.time()
+    dirname = os.path.dirname(RESULTS_FILE)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(RESULTS_FILE, 'a') as fh:
+        fh.write(json.dumps(record, sort_keys=True) + '\n')
+    return record
+
+
+class BenchmarkCase(helpers.EnvironmentCase):
+    '''
+    EnvironmentCase with helpers to run load through traffic_server and record
+    the results. Load size can be changed with TSQA_BENCH_CONCURRENCY and
+    TSQA_BENCH_REQUESTS
+    '''
+    concurrency = int(os.environ.get('TSQA_BENCH_CONCURRENCY', 16))
+    requests = int(os.environ.get('TSQA_BENCH_REQUESTS', 2000))
+
+    @property
+    def proxy_address(self):
+        # server_ports may have other (ssl etc.) ports appended, the first is plain http
+        port = str(self.configs['records.config']['CONFIG']['proxy.config.http.server_ports']).split()[0]
+        return ('127.0.0.1', int(port))
+
+    def timed_restart(self, address=None, timeout=600):
+        '''
+        Restart traffic_server and return the seconds until address (default
+        the http port) accepts connections again
+        '''
+        self.environment.stop()
+        start = time.time()
+        self.environment.start()
+        self.assertTrue(waiters.wait_for_port(address or self.proxy_address, timeout=timeout))
+        return time.time() - start
+
+    def profile_restart(self, address=None, timeout=600):
+        '''
+        Restart traffic_server, record and return a startup.StartupProfile of
+        the time from exec until address (default the http port) accepted a
+        connection
+        '''
+        layout = self.environment.layout
+        offset = startup.log_offset(layout)
+        self.environment.stop()
+        self.environment.start()
+        self.assertTrue(waiters.wait_for_port(address or self.proxy_address, timeout=timeout, interval=0.005))
+        accepted = time.time()
+
+        with open(os.path.join(layout.sysconfdir, 'plugin.config')) as fh:
+            plugins = startup.plugin_entries(fh.read())
+        profile = startup.StartupProfile(startup.exec_time(procstats.server_pid(layout)),
+                                         accepted,
+                                         startup.wait_for_notes(layout, offset),
+                                         plugins,
+                                         )
+        self.record_result(profile)
+        log.info('start-up profile:\n{0}'.format(profile.report()))
+        return profile
+
+    def proxy_cpu_seconds(self):
+        '''
+        Return the CPU seconds traffic_server has used, None if it isn't running
+        '''
+        try:
+            return procstats.cpu_seconds(procstats.server_pid(self.environment.layout))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def cpu_stats(self, cpu_start, result):
+        '''
+        Return the CPU traffic_server used since proxy_cpu_seconds() returned
+        cpu_start, in total and per request of result
+        '''
+        cpu_end = self.proxy_cpu_seconds()
+        if cpu_start is None or cpu_end is None:
+            return {'proxy_cpu_seconds': None, 'proxy_cpu_us_per_request': None}
+        cpu = cpu_end - cpu_start
+        return {'proxy_cpu_seconds': cpu,
+                'proxy_cpu_us_per_request': cpu / result.requests * 1e6 if result.requests else None,
+                }
+
+    @contextlib.contextmanager
+    def sample_metrics(self, interval=0.1, pattern=metrics.DEFAULT_PATTERN):
+        '''
+        Sample records while the block runs, yields the metrics.TimeSeries.
+        Add metrics.SYNC_CONFIG to records.config for sub-second resolution.
+        '''
+        sampler = metrics.MetricsSampler(self.environment.layout, pattern=pattern, interval=interval)
+        sampler.start()
+        try:
+            yield sampler.series
+        finally:
+            sampler.stop()
+
+    def run_load(self, scenario, paths, extra=None, **kwargs):
+        '''
+        Run a LoadGenerator against the proxy, record and return its LoadResult
+        along with the CPU traffic_server used (see cpu_stats(), also set as
+        the result's proxy_cpu). Fails if
+        traffic_server grew more than the memory bounds allow (see
+        EnvironmentCase.assertMemoryGrowth())
+
+        extra is recorded along with the result, it may be a dict or a callable
+        returning one (called with the LoadResult once the run is over)
+        '''
+        requests = kwargs.pop('requests', self.requests)
+        duration = kwargs.pop('duration', None)
+        kwargs.setdefault('concurrency', self.concurrency)
+        gen = LoadGenerator(self.proxy_address, paths, **kwargs)
+        mark = self.memory_mark()
+        cpu_start = self.proxy_cpu_seconds()
+        result = gen.run(scenario, requests=requests, duration=duration)
+        cpu = self.cpu_stats(cpu_start, result)
+        result.proxy_cpu = dict(cpu)
+        if callable(extra):
+            extra = extra(result)
+        growth = self.memory_growth(mark)
+        cpu.update(extra or {})
+        self.record_result(result,
+                           concurrency=gen.concurrency,
+                           keepalive=gen.keepalive,
+                           rss_growth=growth,
+                           **cpu
+                           )
+        # without keepalive every request is a new connection
+        connections = gen.concurrency if gen.keepalive else result.requests
+        self.assertMemoryGrowth(growth, requests=result.requests, connections=connections)
+        return result
+
+    def tearDown(self):
+        super(BenchmarkCase, self).tearDown()
+        self.record_result(procstats.MemoryProfile(self.memory.series))
+        if self.cpu_profile is not None:
+            self.record_result(self.cpu_profile)
+
+    def record_result(self, result, **extra):
+        '''
+        Write a LoadResult (from any generator) or anything else with a
+        to_dict() to the results file
+        '''
+        write_result(result, test=self.id(), configure=self.configure_flags(), **extra)
+        if isinstance(result, LoadResult):
+            cpu = extra.get('proxy_cpu_us_per_request')
+            log.info('{0}: {1:.1f}/s {2}{3}'.format(result.scenario, result.rps, result.percentiles(),
+                                                    ' {0:.1f}us CPU/request'.format(cpu) if cpu is not None else ''))
@@ -0,0 +1,293 @@
+'''
+Persistent, content addressed cache of traffic_server builds
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import contextlib
+import copy
+import fcntl
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import tsqa.environment
+import tsqa.utils
+
+log = logging.getLogger(__name__)
+
+# source paths (relative to the source dir) which don't affect the build
+IGNORED_PATHS = ('ci/', 'doc/')
+
+# environment variables which affect the build, everything else in the
+# environment (TMPDIR, TSQA_PORT_RANGE, ...) is left out of the cache key
+BUILD_ENV = ('CC', 'CXX', 'CPP', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS', 'LIBS', 'PKG_CONFIG_PATH')
+
+# parallel make jobs, one per cpu unless TSQA_MAKE_JOBS says otherwise
+MAKE_JOBS = int(os.environ.get('TSQA_MAKE_JOBS', multiprocessing.cpu_count()))
+
+# default size cap of the cache in MB (TSQA_BUILD_CACHE_MB)
+DEFAULT_MAX_SIZE_MB = 10240
+
+
+def _git(source_dir, *args):
+    proc = subprocess.Popen(['git'] + list(args), cwd=source_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError('git {0} failed: {1}'.format(' '.join(args), stderr))
+    return stdout
+
+
+def _ignored(path):
+    return path.startswith(IGNORED_PATHS)
+
+
+def source_hash(source_dir):
+    '''
+    Return a hash of the build relevant content of source_dir: the blob ids of
+    everything tracked plus the content of modified and untracked files
+    '''
+    h = hashlib.sha1()
+    for line in _git(source_dir, 'ls-files', '-s', '-z').split('\0'):
+        if not line:
+            continue
+        # "<mode> <sha> <stage>\t<path>"
+        meta, path = line.split('\t', 1)
+        if not _ignored(path):
+            h.update(path + '\0' + meta + '\0')
+
+    changed = _git(source_dir, 'ls-files', '-m', '-o', '--exclude-standard', '-z').split('\0')
+    for path in sorted(set(p for p in changed if p and not _ignored(p))):
+        h.update(path + '\0')
+        full_path = os.path.join(source_dir, path)
+        if os.path.isfile(full_path):
+            with open(full_path, 'rb') as fh:
+                h.update(hashlib.sha1(fh.read()).hexdigest())
+        else:
+            h.update('deleted')
+    return h.hexdigest()
+
+
+def configure_args(configure):
+    '''
+    Turn a configure dict into arguments ({'enable-spdy': None} -> --enable-spdy)
+    '''
+    ret = []
+    for k, v in sorted(configure.iteritems()):
+        if v is None:
+            ret.append('--{0}'.format(k))
+        else:
+            ret.append('--{0}={1}'.format(k, v))
+    return ret
+
+
+def _du(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class BuildCache(object):
+    '''
+    Drop-in replacement for tsqa.environment.EnvironmentFactory which keeps
+    installed builds across runs
+
+    Installs are keyed on the source tree hash plus the normalized configure
+    flags (and build relevant environment). Every flag set also keeps its
+    build directory, so when the sources change only the changed objects are
+    recompiled. Builds and installs are evicted least recently used first once
+    the cache grows past max_size bytes.
+
+    Layout of cache_dir:
+        installs/<key>/      make install DESTDIR
+        builds/<flags key>/  persistent (VPATH) build directories
+        index.json           size and last use of every entry
+    '''
+    # keys which failed to build in this process, shared by every instance
+    # (EnvironmentCase makes one per test class) so a broken flag set is only
+    # built once
+    negative_cache = {}
+
+    def __init__(self,
+                 source_dir,
+                 cache_dir,
+                 default_configure=None,
+                 default_env=None,
+                 max_size=None,
+                 ):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self.default_configure = default_configure or {}
+        self.default_env = default_env if default_env is not None else copy.copy(os.environ)
+        if max_size is None:
+            max_size = int(os.environ.get('TSQA_BUILD_CACHE_MB', DEFAULT_MAX_SIZE_MB)) * 1024 * 1024
+        self.max_size = max_size
+
+        for d in ('installs', 'builds', 'locks'):
+            path = os.path.join(cache_dir, d)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self.index_path = os.path.join(cache_dir, 'index.json')
+
+    @contextlib.contextmanager
+    def _lock(self, name):
+        '''
+        Hold an exclusive (cross process) lock called name
+        '''
+        with open(os.path.join(self.cache_dir, 'locks', name), 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {'installs': {}, 'builds': {}}
+
+    def _write_index(self, index):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(index, fh, indent=2, sort_keys=True)
+        os.rename(tmp, self.index_path)
+
+    def _normalize(self, configure_override=None, env_override=None):
+        '''
+        Return the merged (configure, env) and the canonical form used in keys
+        '''
+        configure = copy.copy(self.default_configure)
+        configure.update(configure_override or {})
+        env = copy.copy(self.default_env)
+        env.update(env_override or {})
+        canonical = {'configure': configure_args(configure),
+                     'env': dict((k, env[k]) for k in BUILD_ENV if k in env),
+                     }
+        return configure, env, json.dumps(canonical, sort_keys=True)
+
+    def _touch(self, kind, key, path, **extra):
+        with self._lock('index'):
+            index = self._read_index()
+            entry = index[kind].setdefault(key, {})
+            entry.update(extra)
+            entry['last_used'] = time.time()
+            entry['size'] = _du(path)
+            self._write_index(index)
+
+    def _build(self, flags_key, install_dir, configure, env):
+        builddir = os.path.join(self.cache_dir, 'builds', flags_key)
+        kwargs = {'cwd': builddir,
+                  'env': env,
+                  'stdout': subprocess.PIPE,
+                  'stderr': subprocess.PIPE,
+                  }
+        if not os.path.isfile(os.path.join(self.source_dir, 'configure')):
+            with self._lock('autoreconf'):
+                if not os.path.isfile(os.path.join(self.source_dir, 'configure')):
+                    tsqa.utils.run_sync_command(['autoreconf', '-if'], cwd=self.source_dir)
+
+        if not os.path.isfile(os.path.join(builddir, 'config.status')):
+            if not os.path.isdir(builddir):
+                os.makedirs(builddir)
+            log.info('Configuring {0} in {1}'.format(configure, builddir))
+            args = [os.path.join(self.source_dir, 'configure'), '--prefix=/'] + configure_args(configure)
+            tsqa.utils.run_sync_command(args, **kwargs)
+
+        # make only rebuilds what changed since this build dir was last used
+        log.info('Building {0}'.format(builddir))
+        tsqa.utils.run_sync_command(['make', '-j{0}'.format(MAKE_JOBS)], **kwargs)
+
+        tmp_install = tempfile.mkdtemp(dir=os.path.join(self.cache_dir, 'installs'))
+        try:
+            tsqa.utils.run_sync_command(['make', 'install', 'DESTDIR={0}'.format(tmp_install)], **kwargs)
+            os.rename(tmp_install, install_dir)
+        except Exception:
+            shutil.rmtree(tmp_install, ignore_errors=True)
+            raise
+        self._touch('builds', flags_key, builddir)
+
+    def _evict(self, keep):
+        '''
+        Remove least recently used entries until the cache fits in max_size
+        '''
+        with self._lock('index'):
+            index = self._read_index()
+            entries = []
+            for kind in ('installs', 'builds'):
+                for key, entry in index[kind].iteritems():
+                    entries.append((entry.get('last_used', 0), kind, key, entry.get('size', 0)))
+            total = sum(e[3] for e in entries)
+            for _, kind, key, size in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if key in keep:
+                    continue
+                # a build in progress holds the lock, so don't pull the rug
+                # out from under it
+                with open(os.path.join(self.cache_dir, 'locks', key), 'a') as fh:
+                    try:
+                        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except IOError:
+                        continue
+                    log.info('Evicting {0} {1} ({2} bytes)'.format(kind, key, size))
+                    shutil.rmtree(os.path.join(self.cache_dir, kind, key), ignore_errors=True)
+                    del index[kind][key]
+                    total -= size
+            self._write_index(index)
+
+    def get_environment(self, configure=None, env=None):
+        '''
+        Return an environment cloned from a (cached) build with configure/env
+        '''
+        configure, env, canonical = self._normalize(configure, env)
+        flags_key = hashlib.sha1(canonical).hexdigest()
+        key = hashlib.sha1(source_hash(self.source_dir) + canonical).hexdigest()
+        if key in self.negative_cache:
+            raise self.negative_cache[key]
+
+        install_dir = os.path.join(self.cache_dir, 'installs', key)
+        # the build directory is shared by every install with these flags
+        with self._lock(flags_key), self._lock(key):
+            if not os.path.isdir(install_dir):
+                try:
+                    self._build(flags_key, install_dir, configure, env)
+                except Exception as e:
+                    self.negative_cache[key] = e
+                    raise
+            else:
+                log.info('Using cached build {0}'.format(install_dir))
+            self._touch('installs', key, install_dir, configure=configure)
+
+            # clone while we hold the lock, so no one can evict it under us
+            layout = tsqa.environment.Layout(install_dir)
+            ret = tsqa.environment.Environment()
+            ret.clone(layout=layout)
+        self._evict(keep=(key, flags_key))
+        return ret
@@ -0,0 +1,323 @@
+'''
+Sampling CPU profiles of traffic_server, as folded stacks
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import collections
+import distutils.spawn
+import logging
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+import procstats
+
+log = logging.getLogger(__name__)
+
+PERF = distutils.spawn.find_executable('perf')
+GDB = distutils.spawn.find_executable('gdb')
+
+# how perf unwinds stacks, traffic_server needs -fno-omit-frame-pointer for fp
+PERF_CALL_GRAPH = os.environ.get('TSQA_CPU_PROFILE_CALL_GRAPH', 'fp')
+
+# functions in the profile tables
+TOP = int(os.environ.get('TSQA_CPU_PROFILE_TOP', 20))
+
+# seconds between checks for a restarted traffic_server (perf follows one pid)
+PID_INTERVAL = 0.5
+
+# "	    7f0c5e0a8800 EThread::execute (/opt/ats/lib/libtsutil.so.5)"
+_PERF_FRAME = re.compile(r'^\s+[0-9a-f]+\s+(?P<sym>.+?)(?:\s+\([^)]*\))?$')
+# "Thread 3 (Thread 0x7f0c5e0a8800 (LWP 1236)):", newer gdbs add the name
+_GDB_THREAD = re.compile(r'^Thread \d+ \(.*\(LWP (?P<lwp>\d+)\)')
+# "#1  0x000055d1c4a0 in EThread::execute (this=0x7f0c5e0a8800) at UnixEThread.cc:232"
+_GDB_FRAME = re.compile(r'^#\d+\s+(?:0x[0-9a-f]+ in )?(?P<func>.+?) \(')
+
+
+def frame_name(name):
+    '''
+    Make name usable in folded stacks, whose frames are separated by ;
+    '''
+    name = re.sub(r'\+0x[0-9a-f]+$', '', name.strip())
+    return name.replace(';', ':') or '[unknown]'
+
+
+def fold_perf_script(lines):
+    '''
+    Return a Counter of folded stacks ("thread;root;...;leaf") from the
+    output of perf script -F comm,ip,sym
+    '''
+    ret = collections.Counter()
+    comm = None
+    frames = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.strip():
+            if comm is not None:
+                ret[';'.join([frame_name(comm)] + frames[::-1])] += 1
+            comm = None
+            frames = []
+            continue
+        m = _PERF_FRAME.match(line)
+        if comm is not None and m is not None:
+            frames.append(frame_name(m.group('sym')))
+        else:
+            comm = line
+    if comm is not None:
+        ret[';'.join([frame_name(comm)] + frames[::-1])] += 1
+    return ret
+
+
+def fold_gdb_backtraces(text, states):
+    '''
+    Return a Counter of folded stacks from gdb's "thread apply all bt" of a
+    process with procstats.thread_states() states, only threads which were
+    running
+    '''
+    ret = collections.Counter()
+    stacks = {}
+    frames = None
+    for line in text.splitlines():
+        m = _GDB_THREAD.match(line)
+        if m is not None:
+            frames = stacks.setdefault(int(m.group('lwp')), [])
+            continue
+        m = _GDB_FRAME.match(line)
+        if m is not None and frames is not None:
+            frames.append(frame_name(m.group('func')))
+    for tid, frames in stacks.iteritems():
+        name, state = states.get(tid, (None, None))
+        if state == 'R' and frames:
+            ret[';'.join([frame_name(name)] + frames[::-1])] += 1
+    return ret
+
+
+class CpuProfile(object):
+    '''
+    Folded stacks (with the thread name as the root frame) and how many
+    samples ended in each
+    '''
+    def __init__(self, stacks=None, method=None):
+        self.stacks = collections.Counter(stacks or {})
+        self.method = method
+        self.path = None
+
+    @property
+    def samples(self):
+        return sum(self.stacks.itervalues())
+
+    def top(self, n=TOP):
+        '''
+        Return [(function, self, total)] samples of the n functions most
+        samples ended in, total counts the samples a function was anywhere in
+        '''
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.iteritems():
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(func, count, total[func]) for func, count in own.most_common(n)]
+
+    def write_folded(self, path):
+        '''
+        Write the stacks in the folded format flamegraph.pl reads
+        '''
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(path, 'w') as fh:
+            for stack, count in sorted(self.stacks.iteritems()):
+                fh.write('{0} {1}\n'.format(stack, count))
+        self.path = path
+
+    def report(self, n=TOP):
+        '''
+        Return the top() functions as a human readable table
+        '''
+        samples = float(self.samples) or 1
+        lines = ['{0:<60} {1:>8} {2:>8}'.format('function ({0} samples)'.format(self.samples), 'self %', 'total %')]
+        for func, own, total in self.top(n):
+            lines.append('{0:<60} {1:>8.1f} {2:>8.1f}'.format(func[:60], own * 100 / samples, total * 100 / samples))
+        return '\n'.join(lines)
+
+    def to_dict(self, n=TOP):
+        return {'scenario': 'cpu_profile',
+                'method': self.method,
+                'samples': self.samples,
+                'folded_file': self.path,
+                'top': [{'function': func, 'self': own, 'total': total} for func, own, total in self.top(n)],
+                }
+
+
+class PerfRecord(object):
+    '''
+    perf record of one pid into path
+    '''
+    def __init__(self, pid, path, frequency):
+        self.pid = pid
+        self.path = path
+        self._log = open(path + '.log', 'w')
+        self.proc = subprocess.Popen([PERF, 'record',
+                                      '-F', str(frequency),
+                                      '--call-graph', PERF_CALL_GRAPH,
+                                      '-p', str(pid),
+                                      '-o', path,
+                                      ],
+                                     stdout=self._log,
+                                     stderr=subprocess.STDOUT,
+                                     )
+
+    def failed(self, timeout=1):
+        '''
+        Return whether perf exited with an error within timeout seconds of
+        being started (not allowed to, no such pid ...)
+        '''
+        end = time.time() + timeout
+        while time.time() < end:
+            if self.proc.poll() is not None:
+                return self.proc.returncode != 0
+            time.sleep(0.05)
+        return False
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+        self.proc.wait()
+        self._log.close()
+
+    def fold(self):
+        '''
+        Return the folded stacks recorded, and remove perf's files
+        '''
+        if not os.path.isfile(self.path):
+            return collections.Counter()
+        proc = subprocess.Popen([PERF, 'script', '-i', self.path, '-F', 'comm,ip,sym'],
+                                stdout=subprocess.PIPE,
+                                stderr=open(os.devnull, 'w'),
+                                )
+        ret = fold_perf_script(proc.stdout)
+        proc.wait()
+        for path in (self.path, self.path + '.log'):
+            os.unlink(path)
+        return ret
+
+
+def gdb_sample(pid):
+    '''
+    Return the folded stacks of the running threads of pid, from one
+    backtrace of every thread (pid is stopped while gdb attaches)
+    '''
+    states = procstats.thread_states(pid)
+    with open(os.devnull, 'w') as devnull:
+        output = subprocess.Popen([GDB, '-batch', '-nx', '-p', str(pid),
+                                   '-ex', 'set pagination off',
+                                   '-ex', 'thread apply all bt',
+                                   ],
+                                  stdout=subprocess.PIPE,
+                                  stderr=devnull,
+                                  ).communicate()[0]
+    return fold_gdb_backtraces(output, states)
+
+
+class CpuProfiler(threading.Thread):
+    '''
+    Profile the running traffic_server until stop(), which returns the
+    CpuProfile. method is 'perf' (perf record at frequency Hz), 'gdb' (a
+    backtrace of every running thread, as often as gdb manages up to
+    frequency times a second; traffic_server is stopped while gdb attaches)
+    or 'auto', perf if it can record and gdb otherwise. Like MemorySampler
+    this follows traffic_server across restarts. perf's data files go in
+    directory.
+    '''
+    def __init__(self, layout, directory, method='auto', frequency=99):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.layout = layout
+        self.directory = directory
+        self.method = method
+        self.frequency = frequency
+        self.stacks = collections.Counter()
+        self._records = []
+        self._stop_event = threading.Event()
+
+        if self.method in ('auto', 'perf') and PERF is None:
+            log.warning('perf is not installed')
+            self.method = 'gdb' if self.method == 'auto' else None
+        if self.method == 'gdb' and GDB is None:
+            log.warning('gdb is not installed, not profiling')
+            self.method = None
+
+    def _pid(self):
+        try:
+            return procstats.server_pid(self.layout)
+        except (IOError, OSError, ValueError):
+            # traffic_server is (re)starting
+            return None
+
+    def _record(self, pid):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        record = PerfRecord(pid, os.path.join(self.directory, 'perf.{0}.{1}.data'.format(pid, len(self._records))),
+                            self.frequency)
+        self._records.append(record)
+        if record.failed():
+            with open(record.path + '.log') as fh:
+                log.warning('perf record failed: {0}'.format(fh.read().strip()))
+            record.stop()
+            self._records.remove(record)
+            for path in (record.path, record.path + '.log'):
+                if os.path.exists(path):
+                    os.unlink(path)
+            # perf_event_paranoid and such, it won't work for the next pid either
+            self.method = 'gdb' if self.method == 'auto' and GDB is not None else None
+
+    def run(self):
+        pid = None
+        interval = 1.0 / self.frequency
+        while self.method is not None and not self._stop_event.is_set():
+            current = self._pid()
+            if self.method == 'gdb':
+                if current is not None:
+                    try:
+                        self.stacks.update(gdb_sample(current))
+                    except (IOError, OSError) as e:
+                        log.debug('gdb sample failed: {0}'.format(e))
+                self._stop_event.wait(interval)
+                continue
+            if current is not None and current != pid:
+                pid = current
+                self._record(pid)
+            self._stop_event.wait(PID_INTERVAL)
+
+    def stop(self):
+        '''
+        Stop profiling, return the CpuProfile
+        '''
+        self._stop_event.set()
+        self.join()
+        for record in self._records:
+            record.stop()
+            self.stacks.update(record.fold())
+        return CpuProfile(self.stacks, method=self.method)
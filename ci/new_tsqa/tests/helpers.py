@@ -13,15 +13,80 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import logging
 import os
+import socket
 import tempfile
+import time
 
-import tsqa.environment
+import build_cache
+import cpuprofile
+import procstats
 import tsqa.test_cases
 import tsqa.utils
 
 unittest = tsqa.utils.import_unittest()
 
+log = logging.getLogger(__name__)
+
+# base directory for everything tsqa writes (build cache, layouts, results).
+# runtests.py points every worker at the same one so builds are shared
+TMP_DIR = os.environ.get('TSQA_TMP_DIR', os.path.join(tempfile.gettempdir(), 'tsqa'))
+
+# configure flags every environment is built with
+DEFAULT_CONFIGURE = {'enable-example-plugins': None,
+                     'enable-test-tools': None,
+                     }
+
+# seconds between samples of traffic_server's memory during every test
+MEMORY_INTERVAL = float(os.environ.get('TSQA_MEM_INTERVAL', 0.5))
+
+# how much traffic_server may grow (in bytes) in EnvironmentCase.assertMemoryGrowth():
+# once (a cold cache, RAM cache and freelists fill up on the first run) and
+# on top of that per request and per connection, 0 disables a check
+MEMORY_BASE = int(os.environ.get('TSQA_MEM_BASE', 64 * 1024 * 1024))
+MEMORY_PER_REQUEST = int(os.environ.get('TSQA_MEM_PER_REQUEST', 64 * 1024))
+MEMORY_PER_CONNECTION = int(os.environ.get('TSQA_MEM_PER_CONNECTION', 1024 * 1024))
+
+# profile traffic_server's CPU during every test with perf, gdb or auto (see
+# cpuprofile.CpuProfiler), classes can opt in by setting cpu_profile_method.
+# The folded stacks of each test go in CPU_PROFILE_DIR
+CPU_PROFILE = os.environ.get('TSQA_CPU_PROFILE') or None
+CPU_PROFILE_HZ = int(os.environ.get('TSQA_CPU_PROFILE_HZ', 99))
+CPU_PROFILE_DIR = os.environ.get('TSQA_CPU_PROFILE_DIR', os.path.join(TMP_DIR, 'profiles'))
+
+# ports (from TSQA_PORT_RANGE) that this process already handed out
+_allocated_ports = set()
+
+
+def bind_unused_port(interface=''):
+    '''
+    Like tsqa.utils.bind_unused_port, but only picks ports from TSQA_PORT_RANGE
+    ("low-high") and never hands the same port out twice. This keeps parallel
+    workers from racing each other for the same (closed and later re-bound)
+    ports.
+    '''
+    low, high = (int(p) for p in os.environ['TSQA_PORT_RANGE'].split('-'))
+    for port in xrange(low, high + 1):
+        if port in _allocated_ports:
+            continue
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((interface, port))
+        except socket.error:
+            sock.close()
+            continue
+        sock.listen(5)
+        _allocated_ports.add(port)
+        return sock, port
+    raise RuntimeError('No free ports left in TSQA_PORT_RANGE={0}'.format(os.environ['TSQA_PORT_RANGE']))
+
+# when running under runtests.py each worker gets its own port range, make
+# sure everything (including tsqa itself) allocates from it
+if 'TSQA_PORT_RANGE' in os.environ:
+    tsqa.utils.bind_unused_port = bind_unused_port
+
 # TODO: check that the given path is relative
 def tests_file_path(path):
     '''
@@ -34,23 +99,86 @@ class EnvironmentCase(tsqa.test_cases.EnvironmentCase):
     '''
     This class will get an environment (which is unique) but won't start it
     '''
+    # None (no profile), perf, gdb or auto, see CPU_PROFILE
+    cpu_profile_method = CPU_PROFILE
+
     @classmethod
     def getEnv(cls):
         '''
         This function is responsible for returning an environment
         '''
         SOURCE_DIR = os.path.realpath(os.path.join(__file__, '..', '..', '..', '..'))
-        TMP_DIR = os.path.join(tempfile.gettempdir(), 'tsqa')
-        ef = tsqa.environment.EnvironmentFactory(SOURCE_DIR,
-                                                 os.path.join(TMP_DIR, 'base_envs'),
-                                                 default_configure={'enable-example-plugins': None,
-                                                                    'enable-test-tools': None,
-                                                                    'enable-example-plugins': None,
-                                                                    },
-                                                 )
+        ef = build_cache.BuildCache(SOURCE_DIR,
+                                    os.environ.get('TSQA_BUILD_CACHE_DIR', os.path.join(TMP_DIR, 'build_cache')),
+                                    default_configure=DEFAULT_CONFIGURE,
+                                    )
         # TODO: figure out a way to determine why the build didn't fail and
         # not skip all build failures?
         try:
             return ef.get_environment(cls.environment_factory.get('configure'), cls.environment_factory.get('env'))
         except Exception as e:
             raise unittest.SkipTest(e)
+
+    @classmethod
+    def configure_flags(cls):
+        '''
+        Return the configure arguments this class' environment is built with
+        '''
+        configure = dict(DEFAULT_CONFIGURE)
+        configure.update(cls.environment_factory.get('configure') or {})
+        return build_cache.configure_args(configure)
+
+    def setUp(self):
+        super(EnvironmentCase, self).setUp()
+        self.memory = procstats.MemorySampler(self.environment.layout, interval=MEMORY_INTERVAL)
+        self.memory.start()
+        self.cpu_profile = None
+        self._profiler = None
+        if self.cpu_profile_method:
+            self._profiler = cpuprofile.CpuProfiler(self.environment.layout,
+                                                    os.path.join(CPU_PROFILE_DIR, 'perf'),
+                                                    method=self.cpu_profile_method,
+                                                    frequency=CPU_PROFILE_HZ,
+                                                    )
+            self._profiler.start()
+
+    def tearDown(self):
+        self.memory.stop()
+        log.info('{0} memory:\n{1}'.format(self.id(), procstats.MemoryProfile(self.memory.series).report()))
+        if self._profiler is not None:
+            self.cpu_profile = self._profiler.stop()
+            self.cpu_profile.write_folded(os.path.join(CPU_PROFILE_DIR, self.id() + '.folded'))
+            log.info('{0} CPU profile ({1}):\n{2}'.format(self.id(), self.cpu_profile.path, self.cpu_profile.report()))
+        super(EnvironmentCase, self).tearDown()
+
+    def memory_mark(self):
+        '''
+        Sample traffic_server's memory now, returns the time to pass to
+        memory_growth()
+        '''
+        self.memory.sample()
+        return time.time()
+
+    def memory_growth(self, since):
+        '''
+        Return how many bytes traffic_server's rss grew since memory_mark()
+        returned since (None if it couldn't be sampled)
+        '''
+        self.memory.sample()
+        if 'rss' not in self.memory.series.columns:
+            return None
+        return self.memory.series.delta('rss', since)
+
+    def assertMemoryGrowth(self, growth, requests=0, connections=0):
+        '''
+        Fail if growth (bytes) is more than MEMORY_BASE plus MEMORY_PER_REQUEST
+        per request or plus MEMORY_PER_CONNECTION per connection
+        '''
+        if growth is None:
+            return
+        if MEMORY_PER_REQUEST and requests:
+            self.assertLessEqual(growth, MEMORY_BASE + MEMORY_PER_REQUEST * requests,
+                                 'rss grew {0:.0f} bytes over {1} requests'.format(growth, requests))
+        if MEMORY_PER_CONNECTION and connections:
+            self.assertLessEqual(growth, MEMORY_BASE + MEMORY_PER_CONNECTION * connections,
+                                 'rss grew {0:.0f} bytes over {1} connections'.format(growth, connections))
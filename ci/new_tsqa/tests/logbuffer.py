@@ -0,0 +1,359 @@
+'''
+Read binary (.blog) logs: the LogBuffers of proxy/logging as written to disk
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import mmap
+import os
+import socket
+import struct
+
+import numpy
+
+import squidlog
+
+# from proxy/logging/LogBuffer.h
+LOG_SEGMENT_COOKIE = 0xaceface
+LOG_SEGMENT_VERSION = 2
+
+# LogBufferHeader and LogEntryHeader, in native byte order like the proxy writes them
+BUFFER_HEADER = struct.Struct('=8IQ6I')
+ENTRY_HEADER = struct.Struct('=qiI')
+
+# INK_MIN_ALIGN, every field is padded to it
+ALIGN = 8
+
+# how fields are marshalled by LogAccess
+INT, STRING, IP, VERSION, TEXT, RECORD = range(6)
+
+# timestamp fields only reserve their space, the value is the entry's
+# timestamp (see LogBuffer::to_ascii()). cqtq has milliseconds.
+TIME_FIELDS = frozenset(('cqts', 'cqth', 'cqtq', 'cqtn', 'cqtd', 'cqtt'))
+
+STRING_FIELDS = frozenset(('pitag', 'cqhm', 'cqu', 'cquc', 'cquuc', 'cquup', 'cquuh', 'cqus', 'cqup',
+                           'caun', 'psct', 'pqsn', 'phn', 'shn'))
+IP_FIELDS = frozenset(('chi', 'chih', 'pqsi', 'phi', 'shi'))
+VERSION_FIELDS = frozenset(('cqhv', 'sshv', 'csshv'))
+# header and config containers ({Host}cqh) are strings, records are fixed size strings
+STRING_CONTAINERS = frozenset(('cqh', 'psh', 'pqh', 'ssh', 'cssh', 'ecqh', 'epsh', 'epqh', 'essh', 'ecssh', 'scfg'))
+MARSHAL_RECORD_LENGTH = 32
+
+# the alias maps of Log.cc, by the (character) codes of proxy/hdrs/HTTP.h
+CACHE_CODES = dict(zip(map(ord, '012.3456789abcdf[]<>ghijklmnopqrstuvwxyzABCDEGHIZ'), (
+    'UNDEFINED TCP_HIT TCP_DISK_HIT TCP_MEM_HIT TCP_MISS TCP_EXPIRED_MISS TCP_REFRESH_HIT '
+    'TCP_REFRESH_FAIL_HIT TCP_REFRESH_MISS TCP_CLIENT_REFRESH_MISS TCP_IMS_HIT TCP_IMS_MISS '
+    'TCP_SWAPFAIL_MISS TCP_DENIED TCP_WEBFETCH_MISS TCP_FUTURE_2 TCP_HIT_REDIRECT TCP_MISS_REDIRECT '
+    'TCP_HIT_X_REDIRECT TCP_MISS_X_REDIRECT UDP_HIT UDP_WEAK_HIT UDP_HIT_OBJ UDP_MISS UDP_DENIED '
+    'UDP_INVALID UDP_RELOADING UDP_FUTURE_1 UDP_FUTURE_2 ERR_READ_TIMEOUT ERR_LIFETIME_EXP '
+    'ERR_NO_CLIENTS_BIG_OBJ ERR_READ_ERROR ERR_CLIENT_ABORT ERR_CONNECT_FAIL ERR_INVALID_REQ '
+    'ERR_UNSUP_REQ ERR_INVALID_URL ERR_NO_FDS ERR_DNS_FAIL ERR_NOT_IMPLEMENTED ERR_CANNOT_FETCH '
+    'ERR_NO_RELAY ERR_DISK_IO ERR_ZERO_SIZE_OBJECT ERR_PROXY_DENIED ERR_WEBFETCH_DETECTED '
+    'ERR_FUTURE_1 ERR_UNKNOWN').split()))
+HIERARCHY_CODES = dict(zip(map(ord, '0123456789abcdefghijklmnopqrstuvwxyz'), (
+    'EMPTY NONE DIRECT SIBLING_HIT PARENT_HIT DEFAULT_PARENT SINGLE_PARENT FIRST_UP_PARENT '
+    'NO_PARENT_DIRECT FIRST_PARENT_MISS LOCAL_IP_DIRECT FIREWALL_IP_DIRECT NO_DIRECT_FAIL '
+    'SOURCE_FASTEST SIBLING_UDP_HIT_OBJ PARENT_UDP_HIT_OBJ PASSTHROUGH_PARENT SSL_PARENT_MISS '
+    'INVALID_CODE TIMEOUT_DIRECT TIMEOUT_SIBLING_HIT TIMEOUT_PARENT_HIT TIMEOUT_DEFAULT_PARENT '
+    'TIMEOUT_SINGLE_PARENT TIMEOUT_FIRST_UP_PARENT TIMEOUT_NO_PARENT_DIRECT TIMEOUT_FIRST_PARENT_MISS '
+    'TIMEOUT_LOCAL_IP_DIRECT TIMEOUT_FIREWALL_IP_DIRECT TIMEOUT_NO_DIRECT_FAIL TIMEOUT_SOURCE_FASTEST '
+    'TIMEOUT_SIBLING_UDP_HIT_OBJ TIMEOUT_PARENT_UDP_HIT_OBJ TIMEOUT_PASSTHROUGH_PARENT '
+    'TIMEOUT_TIMEOUT_SSL_PARENT_MISS INVALID_ASSIGNED_CODE').split()))
+FINISH_CODES = {0: 'FIN', 1: 'INTR', 2: 'TIMEOUT'}
+ALIASES = {'crc': CACHE_CODES,
+           'phr': HIERARCHY_CODES,
+           'cfsc': FINISH_CODES,
+           'pfsc': FINISH_CODES,
+           }
+
+_INT64 = struct.Struct('=q')
+_FAMILY = struct.Struct('=H')
+
+
+class LogBufferError(Exception):
+    pass
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) & ~(ALIGN - 1)
+
+
+def field_kind(symbol):
+    '''
+    Return how the field symbol (as in a format's field list) is marshalled
+    '''
+    if symbol.startswith('{'):
+        container = symbol.rpartition('}')[2]
+        if container == 'record':
+            return RECORD
+        return STRING if container in STRING_CONTAINERS else INT
+    if '(' in symbol:
+        # aggregates (SUM(psql) ...) are all integers
+        return INT
+    if symbol in STRING_FIELDS:
+        return STRING
+    if symbol in IP_FIELDS:
+        return IP
+    if symbol in VERSION_FIELDS:
+        return VERSION
+    if symbol == 'cqtx':
+        return TEXT
+    return INT
+
+
+def _read_str(data, offset):
+    end = data.find('\0', offset)
+    return data[offset:end], offset + _aligned(end - offset + 1)
+
+
+def _read_int(data, offset):
+    return _INT64.unpack_from(data, offset)[0], offset + ALIGN
+
+
+def _read_ip(data, offset):
+    family, = _FAMILY.unpack_from(data, offset)
+    # LogFieldIp4 and LogFieldIp6 put the address after 2 bytes of padding
+    if family == socket.AF_INET:
+        return socket.inet_ntop(socket.AF_INET, data[offset + 4:offset + 8]), offset + _aligned(8)
+    if family == socket.AF_INET6:
+        return socket.inet_ntop(socket.AF_INET6, data[offset + 4:offset + 20]), offset + _aligned(20)
+    return '0', offset + ALIGN
+
+
+def _read_version(data, offset):
+    major, offset = _read_int(data, offset)
+    minor, offset = _read_int(data, offset)
+    return 'HTTP/{0}.{1}'.format(major, minor), offset
+
+
+def _read_text(data, offset):
+    method, offset = _read_str(data, offset)
+    url, offset = _read_str(data, offset)
+    version, offset = _read_version(data, offset)
+    return '{0} {1} {2}'.format(method, url, version), offset
+
+
+def _read_record(data, offset):
+    return data[offset:offset + MARSHAL_RECORD_LENGTH].partition('\0')[0], offset + MARSHAL_RECORD_LENGTH
+
+
+_READERS = {INT: _read_int,
+            STRING: _read_str,
+            IP: _read_ip,
+            VERSION: _read_version,
+            TEXT: _read_text,
+            RECORD: _read_record,
+            }
+
+
+class LogFormat(object):
+    '''
+    Decoder for the entries of a field list (the fmt_fieldlist of a buffer)
+    '''
+    _cache = {}
+
+    def __init__(self, fieldlist):
+        self.fieldlist = fieldlist
+        self.symbols = fieldlist.split(',') if fieldlist else []
+        self.kinds = [field_kind(s) for s in self.symbols]
+        self._readers = [_READERS[k] for k in self.kinds]
+        # all ints: every entry has the same layout, which numpy can map directly
+        self.fixed = all(k == INT for k in self.kinds)
+        self.time_fields = [i for i, s in enumerate(self.symbols) if s in TIME_FIELDS]
+
+    @classmethod
+    def get(cls, fieldlist):
+        ret = cls._cache.get(fieldlist)
+        if ret is None:
+            ret = cls._cache[fieldlist] = cls(fieldlist)
+        return ret
+
+    @property
+    def dtype(self):
+        '''
+        numpy dtype of a whole entry (LogEntryHeader included), fixed formats only
+        '''
+        return numpy.dtype([('timestamp', '=i8'), ('timestamp_usec', '=i4'), ('entry_len', '=u4')] +
+                           [(s, '=i8') for s in self.symbols])
+
+    def decode(self, data, offset):
+        '''
+        Return the field values of the entry data starting at offset
+        '''
+        values = []
+        for reader in self._readers:
+            value, offset = reader(data, offset)
+            values.append(value)
+        return values
+
+
+class LogBuffer(object):
+    '''
+    One LogBuffer segment of a binary log, read in place from data (a string
+    or mmap) at offset
+    '''
+    def __init__(self, data, offset=0):
+        if len(data) - offset < BUFFER_HEADER.size:
+            raise LogBufferError('truncated buffer header at {0}'.format(offset))
+        (self.cookie, self.version, self.format_type, self.byte_count, self.entry_count,
+         self.low_timestamp, self.high_timestamp, self.flags, self.signature,
+         fmt_name, fmt_fieldlist, fmt_printf, src_hostname, log_filename, self.data_offset,
+         ) = BUFFER_HEADER.unpack_from(data, offset)
+        if self.cookie != LOG_SEGMENT_COOKIE:
+            raise LogBufferError('bad buffer cookie {0:#x} at {1}'.format(self.cookie, offset))
+        if self.version != LOG_SEGMENT_VERSION:
+            raise LogBufferError('unsupported buffer version {0} at {1}'.format(self.version, offset))
+        if self.byte_count < BUFFER_HEADER.size or offset + self.byte_count > len(data):
+            raise LogBufferError('bad buffer size {0} at {1}'.format(self.byte_count, offset))
+        self.data = data
+        self.offset = offset
+
+        def header_str(str_offset):
+            return _read_str(data, offset + str_offset)[0] if str_offset else None
+        self.format_name = header_str(fmt_name)
+        self.fieldlist = header_str(fmt_fieldlist)
+        self.printf = header_str(fmt_printf)
+        self.hostname = header_str(src_hostname)
+        self.filename = header_str(log_filename)
+        self.format = LogFormat.get(self.fieldlist)
+
+    @property
+    def end(self):
+        return self.offset + self.byte_count
+
+    def entries(self):
+        '''
+        Yield (timestamp, [field values]) of every entry
+        '''
+        data = self.data
+        offset = self.offset + self.data_offset
+        for _ in xrange(self.entry_count):
+            seconds, usec, entry_len = ENTRY_HEADER.unpack_from(data, offset)
+            timestamp = seconds + usec / 1e6
+            values = self.format.decode(data, offset + ENTRY_HEADER.size)
+            for i in self.format.time_fields:
+                values[i] = timestamp if self.format.symbols[i] == 'cqtq' else seconds
+            yield timestamp, values
+            offset += entry_len
+
+    def array(self):
+        '''
+        Return the entries of a fixed format buffer as a numpy record array
+        viewing the buffer, without copying
+        '''
+        return numpy.frombuffer(self.data, dtype=self.format.dtype, count=self.entry_count,
+                                offset=self.offset + self.data_offset)
+
+
+class BinaryLog(object):
+    '''
+    A binary log file, memory mapped. Iterating yields its LogBuffers; a
+    buffer still being written at the end of the file is left out.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, 'rb')
+        size = os.fstat(self._fh.fileno()).st_size
+        self.data = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else ''
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        data = self.data
+        offset = 0
+        while offset + BUFFER_HEADER.size <= len(data):
+            # the last buffer may not be completely written yet
+            byte_count, = struct.unpack_from('=I', data, offset + 12)
+            if offset + byte_count > len(data):
+                return
+            buf = LogBuffer(data, offset)
+            yield buf
+            offset = buf.end
+
+    def records(self, aliases=True):
+        '''
+        Yield every entry as a dict of symbol -> value, plus its timestamp.
+        With aliases cache, hierarchy and finish codes are decoded to their names.
+        '''
+        for buf in self:
+            symbols = buf.format.symbols
+            maps = [(i, ALIASES[s]) for i, s in enumerate(symbols) if aliases and s in ALIASES]
+            for timestamp, values in buf.entries():
+                for i, names in maps:
+                    values[i] = names.get(values[i], values[i])
+                record = dict(zip(symbols, values))
+                record['timestamp'] = timestamp
+                yield record
+
+    def columns(self, aliases=True):
+        '''
+        Return a dict of symbol -> numpy array (int64 for integer fields,
+        strings otherwise) of every entry, plus a float64 timestamp array.
+        Buffers of all-integer formats are read through numpy without
+        decoding every entry.
+        '''
+        parts = {}
+        for buf in self:
+            if buf.format.fixed:
+                entries = buf.array()
+                timestamps = entries['timestamp'] + entries['timestamp_usec'] / 1e6
+                fields = [entries[s] for s in buf.format.symbols]
+                for i in buf.format.time_fields:
+                    fields[i] = timestamps if buf.format.symbols[i] == 'cqtq' else entries['timestamp']
+            else:
+                decoded = list(buf.entries())
+                timestamps = numpy.array([t for t, _ in decoded], dtype=numpy.float64)
+                fields = [[v[i] for _, v in decoded] for i in xrange(len(buf.format.symbols))]
+            parts.setdefault('timestamp', []).append(timestamps)
+            for symbol, kind, values in zip(buf.format.symbols, buf.format.kinds, fields):
+                if symbol == 'cqtq':
+                    values = numpy.array(values, dtype=numpy.float64)
+                else:
+                    values = numpy.array(values, dtype=numpy.int64 if kind == INT else None)
+                if aliases and symbol in ALIASES:
+                    names = ALIASES[symbol]
+                    values = numpy.array([names.get(v, str(v)) for v in values.tolist()])
+                parts.setdefault(symbol, []).append(values)
+        return dict((symbol, numpy.concatenate(arrays)) for symbol, arrays in parts.iteritems())
+
+
+def squid_columns(path):
+    '''
+    Return the columns of a squid format binary log as squidlog.parse_chunk()
+    does for an ASCII one, so squidlog.LogStats can summarize it
+    '''
+    with BinaryLog(path) as blog:
+        columns = blog.columns()
+    if not columns:
+        return squidlog.parse_chunk('')
+    return {'timestamp': columns['timestamp'],
+            'elapsed': columns['ttms'],
+            'cache_code': columns['crc'],
+            'status': columns['pssc'].astype(numpy.int32),
+            'bytes': columns['psql'],
+            'method': columns['cqhm'],
+            'host': squidlog.url_hosts(columns['cquc']),
+            }
@@ -0,0 +1,158 @@
+'''
+Follow access logs as traffic_server writes them, and measure how long
+entries take to reach the disk
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import glob
+import logging
+import os
+import struct
+import threading
+import time
+
+import logbuffer
+
+log = logging.getLogger(__name__)
+
+
+class _Follower(object):
+    '''
+    Reads whatever was appended to one log file since the last read, and
+    carries on with the new file when the log is rolled
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.fh = open(path, 'rb')
+        self.pending = ''
+
+    def read(self):
+        data = self.fh.read()
+        if not data:
+            try:
+                rolled = os.stat(self.path).st_ino != os.fstat(self.fh.fileno()).st_ino
+            except OSError:
+                rolled = False
+            if rolled:
+                # everything before the roll has been read, start on the new file
+                self.fh.close()
+                self.fh = open(self.path, 'rb')
+                self.pending = ''
+                data = self.fh.read()
+        self.pending += data
+
+    def close(self):
+        self.fh.close()
+
+
+def _ascii_timestamps(follower):
+    '''
+    Timestamps of the complete lines read so far, the first field must be
+    cqtq (as in the squid format)
+    '''
+    end = follower.pending.rfind('\n')
+    if end < 0:
+        return []
+    lines, follower.pending = follower.pending[:end], follower.pending[end + 1:]
+    ret = []
+    for line in lines.split('\n'):
+        try:
+            ret.append(float(line.split(' ', 1)[0]))
+        except ValueError:
+            continue
+    return ret
+
+
+def _binary_timestamps(follower):
+    '''
+    Timestamps of the entries of the complete buffers read so far
+    '''
+    data = follower.pending
+    offset = 0
+    ret = []
+    while len(data) - offset >= logbuffer.BUFFER_HEADER.size:
+        byte_count, = struct.unpack_from('=I', data, offset + 12)
+        if len(data) - offset < byte_count:
+            break
+        buf = logbuffer.LogBuffer(data, offset)
+        ret.extend(timestamp for timestamp, _ in buf.entries())
+        offset = buf.end
+    follower.pending = data[offset:]
+    return ret
+
+
+class LogTail(threading.Thread):
+    '''
+    Follow every file matching pattern (files which show up later too) and
+    record, for every entry, the time from its timestamp until it could be
+    read from disk. Entries of ASCII logs must start with cqtq, which like
+    the entry timestamps of binary logs is taken when the entry is logged.
+    Latencies are only as precise as interval.
+    '''
+    def __init__(self, pattern, binary=False, interval=0.02):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.pattern = pattern
+        self.interval = interval
+        self._timestamps = _binary_timestamps if binary else _ascii_timestamps
+        self._followers = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.latencies = []
+
+        # only entries written from now on count
+        for path in glob.glob(pattern):
+            follower = self._followers[path] = _Follower(path)
+            follower.fh.seek(0, os.SEEK_END)
+
+    @property
+    def entries(self):
+        return len(self.latencies)
+
+    def poll(self):
+        for path in glob.glob(self.pattern):
+            if path not in self._followers:
+                try:
+                    self._followers[path] = _Follower(path)
+                except IOError:
+                    continue
+        now = time.time()
+        latencies = []
+        for follower in self._followers.itervalues():
+            follower.read()
+            latencies.extend(now - ts for ts in self._timestamps(follower))
+        with self._lock:
+            self.latencies.extend(latencies)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except (IOError, logbuffer.LogBufferError) as e:
+                log.warning('reading {0} failed: {1}'.format(self.pattern, e))
+            self._stop_event.wait(self.interval)
+        for follower in self._followers.itervalues():
+            follower.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def sorted_latencies(self):
+        with self._lock:
+            return sorted(self.latencies)
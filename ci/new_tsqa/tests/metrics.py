@@ -0,0 +1,272 @@
+'''
+Read records over the management API socket and sample them over time
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import array
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# OpType values from mgmt/api/NetworkMessage.h
+RECORD_GET = 3
+RECORD_MATCH_GET = 23
+
+# TSRecordT values from mgmt/api/include/mgmtapi.h
+TS_REC_INT = 0
+TS_REC_COUNTER = 1
+TS_REC_FLOAT = 2
+TS_REC_STRING = 3
+TS_REC_UNDEFINED = 4
+
+# everything the sampler collects by default
+DEFAULT_PATTERN = r'^proxy\.(process|node)\.'
+
+# records.config settings to publish stats every 100ms instead of every 5s,
+# otherwise samples only change every 5s
+SYNC_CONFIG = {'proxy.config.raw_stat_sync_interval_ms': 100,
+               'proxy.config.remote_sync_interval_ms': 100,
+               }
+
+
+class MgmtError(Exception):
+    pass
+
+
+class MgmtClient(object):
+    '''
+    Persistent connection to traffic_manager's management API socket, the
+    same one traffic_line uses. Messages are marshalled as in
+    mgmt/utils/MgmtMarshall.cc: native byte order ints, and strings and data
+    as a 4 byte length followed by the bytes.
+    '''
+    def __init__(self, layout, timeout=10):
+        self.path = os.path.join(layout.runtimedir, 'mgmtapisocket')
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.path)
+
+    def close(self):
+        self.sock.close()
+
+    def _recv_exactly(self, size):
+        buf = []
+        while size:
+            data = self.sock.recv(size)
+            if not data:
+                raise MgmtError('connection to {0} closed'.format(self.path))
+            buf.append(data)
+            size -= len(data)
+        return ''.join(buf)
+
+    def _request(self, optype, name):
+        # the request is a data object holding an int optype and a string
+        payload = struct.pack('=ii', optype, len(name) + 1) + name + '\0'
+        self.sock.sendall(struct.pack('=i', len(payload)) + payload)
+
+    def _reply(self):
+        '''
+        Read a record reply, return (type, name, value)
+        '''
+        length, = struct.unpack('=i', self._recv_exactly(4))
+        reply = self._recv_exactly(length)
+        err, rec_type, name_len = struct.unpack_from('=iii', reply)
+        if err != 0:
+            raise MgmtError('management API error {0}'.format(err))
+        offset = 12
+        name = reply[offset:offset + name_len].rstrip('\0')
+        offset += name_len
+        value_len, = struct.unpack_from('=i', reply, offset)
+        value = reply[offset + 4:offset + 4 + value_len]
+
+        if rec_type in (TS_REC_INT, TS_REC_COUNTER):
+            value, = struct.unpack('=q', value)
+        elif rec_type == TS_REC_FLOAT:
+            value, = struct.unpack('=f', value)
+        elif rec_type == TS_REC_STRING:
+            value = value.rstrip('\0')
+        return rec_type, name, value
+
+    def get(self, name):
+        '''
+        Return the value of the record name
+        '''
+        self._request(RECORD_GET, name)
+        return self._reply()[2]
+
+    def match(self, pattern):
+        '''
+        Return [(name, type, value)] of the records matching the (unanchored,
+        case insensitive) regex pattern
+        '''
+        self._request(RECORD_MATCH_GET, pattern)
+        ret = []
+        while True:
+            rec_type, name, value = self._reply()
+            if rec_type == TS_REC_UNDEFINED:
+                return ret
+            ret.append((name, rec_type, value))
+
+
+class TimeSeries(object):
+    '''
+    Columnar store of numeric samples: one array of timestamps and one array
+    of doubles per record. Records which show up after the first sample are
+    backfilled with NaN.
+    '''
+    def __init__(self):
+        self.times = array.array('d')
+        self.columns = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def names(self):
+        return sorted(self.columns)
+
+    def append(self, timestamp, values):
+        '''
+        Add a sample, values is a dict of name -> number
+        '''
+        with self._lock:
+            n = len(self.times)
+            self.times.append(timestamp)
+            for name, value in values.iteritems():
+                column = self.columns.get(name)
+                if column is None:
+                    column = self.columns[name] = array.array('d', [float('nan')]) * n
+                column.append(value)
+            for name, column in self.columns.iteritems():
+                if len(column) == n:
+                    column.append(float('nan'))
+
+    def column(self, name):
+        return self.columns[name]
+
+    def _index(self, timestamp):
+        '''
+        Index of the last sample taken at or before timestamp
+        '''
+        lo, hi = 0, len(self.times)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[mid] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def deltas(self, name):
+        '''
+        Return the change in name between consecutive samples
+        '''
+        column = self.columns[name]
+        return array.array('d', (column[i] - column[i - 1] for i in xrange(1, len(column))))
+
+    def rates(self, name):
+        '''
+        Return the per second rate of change of name between consecutive samples
+        '''
+        column = self.columns[name]
+        times = self.times
+        return array.array('d', ((column[i] - column[i - 1]) / (times[i] - times[i - 1])
+                                 for i in xrange(1, len(column))))
+
+    def delta(self, name, start=None, end=None):
+        '''
+        Return the change in name between the samples closest to (but not
+        after) start and end, default the whole series
+        '''
+        column = self.columns[name]
+        first = self._index(start) if start is not None else 0
+        last = self._index(end) if end is not None else len(column) - 1
+        return column[last] - column[first]
+
+    def rate(self, name, start=None, end=None):
+        '''
+        Return the average per second rate of change of name between start and end
+        '''
+        first = self._index(start) if start is not None else 0
+        last = self._index(end) if end is not None else len(self.times) - 1
+        if last <= first:
+            return 0.0
+        return self.delta(name, self.times[first], self.times[last]) / (self.times[last] - self.times[first])
+
+    def to_dict(self):
+        with self._lock:
+            return {'times': self.times.tolist(),
+                    'columns': dict((name, column.tolist()) for name, column in self.columns.iteritems()),
+                    }
+
+    def write(self, path):
+        with open(path, 'w') as fh:
+            json.dump(self.to_dict(), fh)
+
+
+class MetricsSampler(threading.Thread):
+    '''
+    Sample every numeric record matching pattern each interval seconds into a
+    TimeSeries, over a single management API connection. Values only change
+    as often as traffic_server publishes them, see SYNC_CONFIG.
+    '''
+    def __init__(self, layout, pattern=DEFAULT_PATTERN, interval=0.1):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.layout = layout
+        self.pattern = pattern
+        self.interval = interval
+        self.series = TimeSeries()
+        self._stop_event = threading.Event()
+
+    def sample(self, client):
+        values = {}
+        for name, rec_type, value in client.match(self.pattern):
+            if rec_type != TS_REC_STRING:
+                values[name] = value
+        self.series.append(time.time(), values)
+
+    def run(self):
+        client = None
+        next_sample = time.time()
+        while not self._stop_event.is_set():
+            try:
+                # traffic_manager may be restarting, keep trying
+                if client is None:
+                    client = MgmtClient(self.layout)
+                self.sample(client)
+            except (socket.error, MgmtError) as e:
+                log.debug('metrics sample failed: {0}'.format(e))
+                if client is not None:
+                    client.close()
+                    client = None
+            next_sample += self.interval
+            self._stop_event.wait(max(next_sample - time.time(), 0))
+        if client is not None:
+            client.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
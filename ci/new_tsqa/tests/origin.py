@@ -0,0 +1,530 @@
+'''
+Event loop driven HTTP origin for load tests
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import collections
+import errno
+import heapq
+import httplib
+import logging
+import resource
+import select
+import socket
+import struct
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# how long the loop may block before checking if it was asked to stop
+POLL_INTERVAL = 0.1
+
+# what a fault route can do to a connection instead of sending bytes, see
+# FaultRoute.schedule()
+HOLD = object()
+RESET = object()
+
+# misbehaviours of FaultRoute
+FAULTS = ('first_byte', 'trickle', 'reset', 'no_end', 'silent')
+
+_BODY_PATTERN = '0123456789abcdef'
+_bodies = {}
+
+
+def body_bytes(size):
+    '''
+    Return a deterministic body of "size" bytes, so truncation and mixups are
+    detectable by the client
+    '''
+    if size not in _bodies:
+        _bodies[size] = (_BODY_PATTERN * (size // len(_BODY_PATTERN) + 1))[:size]
+    return _bodies[size]
+
+
+def raise_nofile_limit():
+    '''
+    Raise the soft open file limit as far as we are allowed to, so the origin
+    can hold tens of thousands of connections
+    '''
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, resource.error) as e:
+            log.warning('Unable to raise RLIMIT_NOFILE: {0}'.format(e))
+
+
+class Route(object):
+    '''
+    How the origin answers requests under a path prefix
+
+    If body_size is None the body is the number of requests seen so far on
+    the connection (like test_keepalive's KeepaliveTCPHandler), otherwise it
+    is body_size deterministic bytes. latency (in seconds) is injected before
+    the response is sent.
+    '''
+    def __init__(self,
+                 body_size=None,
+                 chunked=False,
+                 chunk_size=4096,
+                 latency=0,
+                 cache_control=None,
+                 status=200,
+                 headers=None,
+                 ):
+        self.body_size = body_size
+        self.chunked = chunked
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.cache_control = cache_control
+        self.status = status
+        self.headers = headers or {}
+
+    def body(self, path, conn_requests, request_headers=None):
+        if self.body_size is None:
+            return str(conn_requests)
+        return body_bytes(self.body_size)
+
+    def response_status(self, path, request_headers=None):
+        return self.status
+
+    def response_cache_control(self, path, request_headers=None):
+        return self.cache_control
+
+    def render(self, path, conn_requests, keepalive, request_headers=None):
+        '''
+        Return the full response for the conn_requests'th request on a
+        connection. request_headers has the (lower cased) request headers.
+        '''
+        body = self.body(path, conn_requests, request_headers)
+        status = self.response_status(path, request_headers)
+        cache_control = self.response_cache_control(path, request_headers)
+        lines = ['HTTP/1.1 {0} {1}'.format(status, httplib.responses.get(status, 'Unknown')),
+                 'Content-Type: text/plain',
+                 'Connection: {0}'.format('keep-alive' if keepalive else 'close'),
+                 ]
+        if cache_control is not None:
+            lines.append('Cache-Control: {0}'.format(cache_control))
+        for k, v in self.headers.iteritems():
+            lines.append('{0}: {1}'.format(k, v))
+
+        if self.chunked:
+            lines.append('Transfer-Encoding: chunked')
+            chunks = []
+            for offset in xrange(0, len(body), self.chunk_size):
+                chunk = body[offset:offset + self.chunk_size]
+                chunks.append('{0:x}\r\n{1}\r\n'.format(len(chunk), chunk))
+            chunks.append('0\r\n\r\n')
+            body = ''.join(chunks)
+        else:
+            lines.append('Content-Length: {0}'.format(len(body)))
+        return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+    def schedule(self, path, conn_requests, keepalive, request_headers, now):
+        '''
+        Return what to do on the connection for this request: a list of (time,
+        data) in order, data is bytes to send or HOLD or RESET
+        '''
+        return [(now + self.latency, self.render(path, conn_requests, keepalive, request_headers))]
+
+
+class FaultRoute(Route):
+    '''
+    A Route which misbehaves like slow and broken origins do, after waiting
+    delay seconds:
+
+    first_byte  sends the response (a slow first byte, like latency)
+    trickle     sends the headers, then trickle_size bytes of the body every
+                interval seconds
+    reset       sends the headers and reset_after bytes of the body, then
+                resets the connection
+    no_end      sends a keepalive response without Content-Length, so the
+                body never ends, and never closes the connection
+    silent      never answers and never closes the connection
+    '''
+    def __init__(self, fault, delay=0, trickle_size=64, interval=1, reset_after=0, **kwargs):
+        if fault not in FAULTS:
+            raise ValueError('Unknown fault {0!r}, expected one of {1}'.format(fault, ', '.join(FAULTS)))
+        kwargs.setdefault('body_size', 4096)
+        Route.__init__(self, **kwargs)
+        self.fault = fault
+        self.delay = delay
+        self.trickle_size = trickle_size
+        self.interval = interval
+        self.reset_after = reset_after
+
+    def schedule(self, path, conn_requests, keepalive, request_headers, now):
+        start = now + self.delay
+        if self.fault == 'silent':
+            return [(start, HOLD)]
+        response = self.render(path, conn_requests, keepalive, request_headers)
+        if self.fault == 'first_byte':
+            return [(start, response)]
+
+        head, _, body = response.partition('\r\n\r\n')
+        head += '\r\n\r\n'
+        if self.fault == 'trickle':
+            return [(start, head)] + [(start + (i + 1) * self.interval, body[offset:offset + self.trickle_size])
+                                      for i, offset in enumerate(xrange(0, len(body), self.trickle_size))]
+        if self.fault == 'reset':
+            return [(start, head + body[:self.reset_after]), (start, RESET)]
+        # no_end
+        head = '\r\n'.join(line for line in head.split('\r\n')
+                            if not line.lower().startswith(('content-length:', 'transfer-encoding:')))
+        return [(start, head + body), (start, HOLD)]
+
+
+class ConnectionRecord(object):
+    '''
+    What the ledger knows about one origin connection
+    '''
+    __slots__ = ('opened', 'closed', 'requests', 'mark', 'held')
+
+    def __init__(self, opened):
+        self.opened = opened
+        self.closed = None
+        self.requests = 0
+        # when the origin stopped answering on the connection (see HOLD)
+        self.held = None
+        # requests already served when ConnectionLedger.mark() was last called
+        self.mark = 0
+
+    @property
+    def lifetime(self):
+        return (self.closed or time.time()) - self.opened
+
+
+class ConnectionLedger(object):
+    '''
+    Records every TCP connection made to the origin, how many requests were
+    served on it and how long it lived. This is how tests see how well the
+    proxy reuses server sessions.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = []
+        self._mark_time = 0
+
+    def opened(self):
+        record = ConnectionRecord(time.time())
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def mark(self):
+        '''
+        Start a new measurement window, summary() only covers what happens
+        after the last mark
+        '''
+        with self._lock:
+            self._mark_time = time.time()
+            for record in self.records:
+                record.mark = record.requests
+
+    def summary(self):
+        '''
+        Return connection/request counts, requests per connection and the
+        reuse ratio (fraction of requests which didn't need a new connection)
+        since the last mark()
+        '''
+        with self._lock:
+            records = [r for r in self.records if r.closed is None or r.closed >= self._mark_time]
+        new_connections = [r for r in records if r.opened >= self._mark_time]
+        requests = sum(r.requests - r.mark for r in records)
+        per_connection = sorted(r.requests for r in new_connections)
+        lifetimes = sorted(r.lifetime for r in new_connections if r.closed is not None)
+
+        ret = {'connections_opened': len(new_connections),
+               'connections_open': sum(1 for r in records if r.closed is None),
+               'requests': requests,
+               'reuse_ratio': 1 - float(len(new_connections)) / requests if requests else None,
+               'requests_per_connection_max': per_connection[-1] if per_connection else None,
+               'requests_per_connection_mean': float(sum(per_connection)) / len(per_connection) if per_connection else None,
+               'lifetime_p50': lifetimes[len(lifetimes) // 2] if lifetimes else None,
+               'lifetime_max': lifetimes[-1] if lifetimes else None,
+               }
+        return ret
+
+    def release_times(self):
+        '''
+        Return the sorted seconds the proxy kept held connections (see HOLD)
+        open after the origin stopped answering, since the last mark()
+        '''
+        with self._lock:
+            return sorted(r.closed - r.held for r in self.records
+                          if r.held is not None and r.closed is not None and r.held >= self._mark_time)
+
+    def held(self):
+        '''
+        Return how many held connections the proxy has not closed yet
+        '''
+        with self._lock:
+            return sum(1 for r in self.records if r.held is not None and r.closed is None)
+
+
+class _Connection(object):
+    __slots__ = ('sock', 'record', 'inbuf', 'outbuf', 'pending', 'timer', 'closing', 'held')
+
+    def __init__(self, sock, record):
+        self.sock = sock
+        self.record = record
+        self.inbuf = ''
+        self.outbuf = ''
+        # responses waiting for their injected latency, in request order
+        self.pending = collections.deque()
+        # when the loop will next flush pending
+        self.timer = None
+        self.closing = False
+        # the origin stopped answering, only the proxy closes the connection
+        self.held = False
+
+
+class OriginDaemon(threading.Thread):
+    '''
+    Single threaded, epoll driven HTTP/1.1 origin
+
+    Supports keepalive, pipelining, chunked and Content-Length bodies, per
+    path latency and faults (see FaultRoute) without a thread per connection. Has the same
+    start()/ready/port interface as tsqa.endpoint.SocketServerDaemon.
+    '''
+    def __init__(self, port=0, backlog=4096, default_route=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        raise_nofile_limit()
+
+        self.routes = {}
+        self.default_route = default_route or Route()
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(('127.0.0.1', port))
+        self._listener.listen(backlog)
+        self._listener.setblocking(0)
+        self.port = self._listener.getsockname()[1]
+
+        self.ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._conns = {}
+        self._timers = []
+
+        # total requests answered
+        self.requests = 0
+        self.ledger = ConnectionLedger()
+
+    def add_route(self, prefix, route=None, **kwargs):
+        '''
+        Answer requests whose path starts with prefix using route (or a Route
+        built from kwargs). The longest matching prefix wins.
+        '''
+        self.routes[prefix] = route or Route(**kwargs)
+        return self.routes[prefix]
+
+    def route(self, path):
+        match = None
+        for prefix in self.routes:
+            if path.startswith(prefix) and (match is None or len(prefix) > len(match)):
+                match = prefix
+        if match is None:
+            return self.default_route
+        return self.routes[match]
+
+    @property
+    def connections(self):
+        return len(self._conns)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        self._poller = select.epoll()
+        self._poller.register(self._listener.fileno(), select.EPOLLIN)
+        self.ready.set()
+        try:
+            while not self._stop_event.is_set():
+                timeout = POLL_INTERVAL
+                if self._timers:
+                    timeout = min(timeout, max(self._timers[0][0] - time.time(), 0))
+                try:
+                    events = self._poller.poll(timeout)
+                except IOError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                for fd, event in events:
+                    if fd == self._listener.fileno():
+                        self._accept()
+                        continue
+                    conn = self._conns.get(fd)
+                    if conn is None:
+                        continue
+                    if event & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+                        self._read(conn)
+                    if event & select.EPOLLOUT and fd in self._conns:
+                        self._write(conn)
+                self._run_timers()
+        finally:
+            for conn in self._conns.values():
+                self._close(conn)
+            self._poller.close()
+            self._listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if e.errno in (errno.EMFILE, errno.ENFILE):
+                    log.error('Out of file descriptors with {0} connections'.format(len(self._conns)))
+                    return
+                raise
+            sock.setblocking(0)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._conns[sock.fileno()] = _Connection(sock, self.ledger.opened())
+            self._poller.register(sock.fileno(), select.EPOLLIN)
+
+    def _close(self, conn):
+        fd = conn.sock.fileno()
+        if self._conns.pop(fd, None) is None:
+            return
+        conn.record.closed = time.time()
+        try:
+            self._poller.unregister(fd)
+        except (IOError, ValueError):
+            pass
+        conn.sock.close()
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            self._close(conn)
+            return
+        if conn.closing or conn.held:
+            # we already answered a "Connection: close" request or stopped
+            # answering, ignore the rest
+            return
+        conn.inbuf += data
+        self._parse(conn)
+        self._flush(conn)
+
+    def _parse(self, conn):
+        while not conn.closing and not conn.held:
+            end = conn.inbuf.find('\r\n\r\n')
+            if end < 0:
+                return
+            lines = conn.inbuf[:end].split('\r\n')
+            try:
+                method, path, version = lines[0].split(' ', 2)
+            except ValueError:
+                log.warning('Bad request line {0!r}, closing connection'.format(lines[0]))
+                conn.inbuf = ''
+                conn.closing = True
+                return
+            headers = {}
+            for line in lines[1:]:
+                k, _, v = line.partition(':')
+                headers[k.strip().lower()] = v.strip()
+            body_len = int(headers.get('content-length', 0))
+            if len(conn.inbuf) < end + 4 + body_len:
+                # wait for the rest of the request body
+                return
+            conn.inbuf = conn.inbuf[end + 4 + body_len:]
+
+            connection = headers.get('connection', '').lower()
+            if version == 'HTTP/1.1':
+                keepalive = connection != 'close'
+            else:
+                keepalive = connection == 'keep-alive'
+
+            conn.record.requests += 1
+            self.requests += 1
+            route = self.route(path)
+            conn.pending.extend(route.schedule(path, conn.record.requests, keepalive, headers, time.time()))
+            if not keepalive:
+                conn.closing = True
+
+    def _flush(self, conn):
+        '''
+        Move responses whose latency has passed into the output buffer and
+        try to send it
+        '''
+        now = time.time()
+        while conn.pending and conn.pending[0][0] <= now:
+            data = conn.pending.popleft()[1]
+            if data is RESET:
+                self._reset(conn)
+                return
+            if data is HOLD:
+                conn.held = True
+                conn.record.held = now
+                conn.pending.clear()
+                break
+            conn.outbuf += data
+        if conn.pending and conn.timer != conn.pending[0][0]:
+            conn.timer = conn.pending[0][0]
+            heapq.heappush(self._timers, (conn.timer, conn.sock.fileno()))
+        if conn.outbuf:
+            self._write(conn)
+        elif conn.closing and not conn.pending and not conn.held:
+            self._close(conn)
+
+    def _reset(self, conn):
+        '''
+        Send what we can of the output buffer, then close the connection with
+        a RST instead of a FIN
+        '''
+        try:
+            conn.sock.send(conn.outbuf)
+        except socket.error:
+            pass
+        conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        self._close(conn)
+
+    def _write(self, conn):
+        fd = conn.sock.fileno()
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                sent = 0
+            else:
+                self._close(conn)
+                return
+        conn.outbuf = conn.outbuf[sent:]
+        if conn.outbuf:
+            self._poller.modify(fd, select.EPOLLIN | select.EPOLLOUT)
+            return
+        self._poller.modify(fd, select.EPOLLIN)
+        if conn.closing and not conn.pending and not conn.held:
+            self._close(conn)
+
+    def _run_timers(self):
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            _, fd = heapq.heappop(self._timers)
+            conn = self._conns.get(fd)
+            if conn is not None:
+                self._flush(conn)
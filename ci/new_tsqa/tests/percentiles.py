@@ -0,0 +1,42 @@
+'''
+Latency percentiles as every result reports them, with no dependencies so
+tools outside the tsqa environment (logstats.py) can use them
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import math
+
+# latency percentiles reported for every load run
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentile(values, pct):
+    '''
+    Return the nearest-rank percentile "pct" of the already sorted "values"
+    '''
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def percentile_name(pct):
+    '''
+    Name used for a percentile in results (50 -> p50, 99.9 -> p99.9)
+    '''
+    return 'p{0:g}'.format(pct)
@@ -0,0 +1,194 @@
+'''
+Attribute throughput, latency and CPU cost to each plugin.config entry and
+to each of its hooks, from runs of the same load with different plugin sets
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+
+import bench
+import startup
+
+# how plugins which can choose their hooks (like tcpinfo.so) are told which
+HOOKS_OPTION = re.compile(r'(--hooks=)(\S*)')
+
+# what is measured for every variant, and whether more of it is better
+MEASURES = (('rps', True),
+            ('p50', False),
+            ('p99', False),
+            ('proxy_cpu_us_per_request', False),
+            )
+
+
+def read_plugin_config(path):
+    '''
+    Return the active entries of the plugin.config at path, in load order
+    '''
+    with open(path) as fh:
+        return startup.plugin_entries(fh.read())
+
+
+def entry_name(index, entry):
+    '''
+    Name of the index'th plugin.config entry, the same plugin may be loaded
+    more than once
+    '''
+    return '{0}#{1}'.format(os.path.basename(entry.split()[0]), index)
+
+
+def entry_hooks(entry):
+    '''
+    Return the hooks given to an entry with --hooks=, [] for other plugins
+    '''
+    match = HOOKS_OPTION.search(entry)
+    if match is None:
+        return []
+    return [hook for hook in match.group(2).split(',') if hook]
+
+
+def with_hooks(entry, hooks):
+    '''
+    Return entry with its --hooks= replaced by hooks
+    '''
+    return HOOKS_OPTION.sub(lambda match: match.group(1) + ','.join(hooks), entry)
+
+
+def without_name(name):
+    return 'without {0}'.format(name)
+
+
+def only_name(name, hook):
+    return '{0} only {1}'.format(name, hook)
+
+
+def variants(entries):
+    '''
+    Return [(name, entries)] of the plugin sets to run: 'all' and 'none',
+    each entry removed in turn ('without <entry>'), and for entries with
+    more than one hook each of them on its own ('<entry> only <hook>') with
+    the other entries unchanged
+    '''
+    ret = [('all', list(entries)), ('none', [])]
+    for i, entry in enumerate(entries):
+        name = entry_name(i, entry)
+        before, after = list(entries[:i]), list(entries[i + 1:])
+        ret.append((without_name(name), before + after))
+        hooks = entry_hooks(entry)
+        if len(hooks) > 1:
+            for hook in hooks:
+                ret.append((only_name(name, hook), before + [with_hooks(entry, [hook])] + after))
+    return ret
+
+
+def measure(result):
+    '''
+    Return the MEASURES of a LoadResult from BenchmarkCase.run_load()
+    '''
+    return {'rps': result.rps,
+            'p50': bench.percentile(result.latencies, 50),
+            'p99': bench.percentile(result.latencies, 99),
+            'proxy_cpu_us_per_request': result.proxy_cpu['proxy_cpu_us_per_request'],
+            }
+
+
+def median(samples):
+    '''
+    Return the median of each measure over repeated runs of a variant
+    '''
+    ret = {}
+    for name, _ in MEASURES:
+        values = sorted(sample[name] for sample in samples if sample.get(name) is not None)
+        ret[name] = values[len(values) // 2] if values else None
+    return ret
+
+
+def cost(with_plugin, without_plugin):
+    '''
+    Return what adding a plugin (or hook) costs for every measure: lost
+    requests/sec, added latency and CPU. None where either side is missing
+    '''
+    ret = {}
+    for name, higher_is_better in MEASURES:
+        a, b = with_plugin.get(name), without_plugin.get(name)
+        if a is None or b is None:
+            ret[name] = None
+        else:
+            ret[name] = b - a if higher_is_better else a - b
+    return ret
+
+
+class PluginCosts(object):
+    '''
+    Costs of each plugin.config entry and hook, from the measures of every
+    variants() run ({name: measure()})
+
+    An entry costs what the full set measures against the set without it,
+    a hook what the set with only that hook of the entry measures against the
+    set without the entry. Hook costs don't have to add up to their entry's:
+    what is left over is the cost of the plugin being loaded at all, or of
+    hooks together.
+    '''
+    def __init__(self, entries, results):
+        self.entries = list(entries)
+        self.results = results
+
+    def costs(self):
+        '''
+        Return [(plugin, hook, cost)]: 'all' first (the whole set against
+        none), then every entry followed by its hooks. hook is None for entries
+        '''
+        full = self.results['all']
+        ret = [('all', None, cost(full, self.results['none']))]
+        for i, entry in enumerate(self.entries):
+            name = entry_name(i, entry)
+            without = self.results.get(without_name(name))
+            if without is None:
+                continue
+            ret.append((name, None, cost(full, without)))
+            for hook in entry_hooks(entry):
+                only = self.results.get(only_name(name, hook))
+                if only is not None:
+                    ret.append((name, hook, cost(only, without)))
+        return ret
+
+    def report(self):
+        '''
+        Return the costs as a human readable table (latencies in ms, CPU in us
+        per request)
+        '''
+        def fmt(value, scale=1):
+            return '{0:>10.2f}'.format(value * scale) if value is not None else '{0:>10}'.format('-')
+
+        lines = ['{0:<40} {1:>10} {2:>10} {3:>10} {4:>10}'.format('plugin', 'lost rps', '+p50 ms', '+p99 ms', '+cpu us')]
+        for plugin, hook, c in self.costs():
+            name = plugin if hook is None else '  ' + hook
+            lines.append('{0:<40} {1} {2} {3} {4}'.format(name[:40],
+                                                           fmt(c['rps']),
+                                                           fmt(c['p50'], 1000),
+                                                           fmt(c['p99'], 1000),
+                                                           fmt(c['proxy_cpu_us_per_request']),
+                                                           ))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'scenario': 'plugin_costs',
+                'plugins': self.entries,
+                'variants': self.results,
+                'costs': [dict(c, plugin=plugin, hook=hook) for plugin, hook, c in self.costs()],
+                }
@@ -0,0 +1,245 @@
+'''
+Look at the traffic_server process through /proc
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import re
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# "7f0c5e0a8000-7f0c5e0a9000 rw-p 00000000 00:00 0          [heap]"
+_MAPPING = re.compile(r'^[0-9a-f]+-[0-9a-f]+ \S+ \S+ \S+ \S+\s*(?P<path>.*)$')
+
+# memory fields sampled by MemorySampler
+MEMORY_FIELDS = ('rss', 'pss', 'swap', 'heap', 'anon', 'file', 'stack', 'other')
+
+
+def server_pid(layout):
+    '''
+    Return the pid of the running traffic_server (from its lock file)
+    '''
+    with open(os.path.join(layout.runtimedir, 'server.lock')) as fh:
+        return int(fh.read().strip())
+
+
+def status(pid):
+    '''
+    Return /proc/<pid>/status as a dict of strings
+    '''
+    ret = {}
+    with open('/proc/{0}/status'.format(pid)) as fh:
+        for line in fh:
+            k, _, v = line.partition(':')
+            ret[k] = v.strip()
+    return ret
+
+
+def rss(pid):
+    '''
+    Return the resident set size of pid in bytes
+    '''
+    # "VmRSS:	  123456 kB"
+    return int(status(pid)['VmRSS'].split()[0]) * 1024
+
+
+def threads(pid):
+    '''
+    Return the number of threads of pid
+    '''
+    return int(status(pid)['Threads'])
+
+
+def open_fds(pid):
+    '''
+    Return the number of file descriptors pid has open
+    '''
+    return len(os.listdir('/proc/{0}/fd'.format(pid)))
+
+
+def cpu_seconds(pid):
+    '''
+    Return the user and system CPU seconds pid has used
+    '''
+    with open('/proc/{0}/stat'.format(pid)) as fh:
+        # the command name may have spaces, the fields after it don't
+        fields = fh.read().rpartition(')')[2].split()
+    # utime and stime are fields 14 and 15 of stat(5), in clock ticks
+    return (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+
+
+def thread_states(pid):
+    '''
+    Return {tid: (name, state)} of every thread of pid, state is the one
+    letter state of stat(5) (R is running)
+    '''
+    ret = {}
+    task_dir = '/proc/{0}/task'.format(pid)
+    for tid in os.listdir(task_dir):
+        try:
+            with open(os.path.join(task_dir, tid, 'stat')) as fh:
+                stat = fh.read()
+        except (IOError, OSError):
+            # the thread exited
+            continue
+        name = stat[stat.index('(') + 1:stat.rindex(')')]
+        ret[int(tid)] = (name, stat.rpartition(')')[2].split()[0])
+    return ret
+
+
+def mapping_kind(path):
+    '''
+    Classify an smaps mapping by its path: heap, stack, anon, file or other
+    '''
+    if not path:
+        return 'anon'
+    if path == '[heap]':
+        return 'heap'
+    if path.startswith('[stack'):
+        return 'stack'
+    if path.startswith('/'):
+        return 'file'
+    return 'other'
+
+
+def smaps(pid):
+    '''
+    Return the memory of pid in bytes from /proc/<pid>/smaps: the total rss,
+    pss and swap plus the rss of each kind of mapping (see mapping_kind())
+    '''
+    ret = dict((field, 0) for field in MEMORY_FIELDS)
+    kind = None
+    with open('/proc/{0}/smaps'.format(pid)) as fh:
+        for line in fh:
+            m = _MAPPING.match(line)
+            if m is not None:
+                kind = mapping_kind(m.group('path').strip())
+                continue
+            # "Rss:                   8 kB"
+            name, _, value = line.partition(':')
+            if name == 'Rss':
+                size = int(value.split()[0]) * 1024
+                ret['rss'] += size
+                ret[kind] += size
+            elif name == 'Pss':
+                ret['pss'] += int(value.split()[0]) * 1024
+            elif name == 'Swap':
+                ret['swap'] += int(value.split()[0]) * 1024
+    return ret
+
+
+def slope(times, values):
+    '''
+    Least squares slope of values over times (units per second)
+    '''
+    points = [(t, v) for t, v in zip(times, values) if v == v]
+    if len(points) < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if not var:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / var
+
+
+class MemoryProfile(object):
+    '''
+    Summary of a MemorySampler series: for each field the peak, the steady
+    state (mean of the last quarter of the samples), the growth from the
+    first to the last sample and the slope in bytes/second
+    '''
+    def __init__(self, series):
+        self.series = series
+
+    def summary(self, field='rss'):
+        if field not in self.series.columns:
+            return {}
+        column = self.series.column(field)
+        values = [v for v in column if v == v]
+        if not values:
+            return {}
+        tail = values[-max(len(values) // 4, 1):]
+        return {'peak': max(values),
+                'steady': sum(tail) / len(tail),
+                'growth': values[-1] - values[0],
+                'slope': slope(self.series.times, column),
+                }
+
+    def report(self):
+        '''
+        Return the summary as a human readable table (in MB)
+        '''
+        lines = ['{0:<6} {1:>10} {2:>10} {3:>10} {4:>10}'.format('', 'peak', 'steady', 'growth', 'MB/s')]
+        for field in MEMORY_FIELDS:
+            summary = self.summary(field)
+            if summary:
+                lines.append('{0:<6} {1:>10.1f} {2:>10.1f} {3:>10.1f} {4:>10.3f}'.format(
+                    field, *[summary[k] / 1048576.0 for k in ('peak', 'steady', 'growth', 'slope')]))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'scenario': 'memory',
+                'samples': len(self.series),
+                'memory': dict((field, self.summary(field)) for field in MEMORY_FIELDS),
+                }
+
+
+class MemorySampler(threading.Thread):
+    '''
+    Sample the memory (see smaps()), threads and open file descriptors of the
+    running traffic_server every interval seconds into a metrics.TimeSeries. The pid is looked up for
+    every sample, so this follows traffic_server across restarts.
+    '''
+    def __init__(self, layout, interval=0.5):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.layout = layout
+        self.interval = interval
+        self.series = metrics.TimeSeries()
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        try:
+            pid = server_pid(self.layout)
+            memory = smaps(pid)
+            memory['threads'] = threads(pid)
+            memory['fds'] = open_fds(pid)
+        except (IOError, OSError, ValueError) as e:
+            # traffic_server is (re)starting
+            log.debug('memory sample failed: {0}'.format(e))
+            return
+        self.series.append(time.time(), memory)
+
+    def run(self):
+        next_sample = time.time()
+        while not self._stop_event.is_set():
+            self.sample()
+            next_sample += self.interval
+            self._stop_event.wait(max(next_sample - time.time(), 0))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        # always have the state at the end of the run
+        self.sample()
@@ -0,0 +1,312 @@
+'''
+Replay squid format access logs against a proxy
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import collections
+import gzip
+import httplib
+import logging
+import math
+import os
+import Queue
+import socket
+import threading
+import time
+import urlparse
+
+import bench
+import origin
+
+log = logging.getLogger(__name__)
+
+# request headers which tell ReplayRoute what to answer
+SIZE_HEADER = 'X-Replay-Size'
+STATUS_HEADER = 'X-Replay-Status'
+
+# bodies are prefixes of one pattern of this size, longer objects are trimmed
+# to it so a multi-GB entry in the log doesn't become a multi-GB string
+MAX_BODY_SIZE = int(os.environ.get('TSQA_REPLAY_MAX_SIZE', 16 * 1024 * 1024))
+
+# what a response's headers add to its body in psql (the bytes sent to the
+# client)
+RESPONSE_HEADER_ESTIMATE = 300
+
+# "%<cqtq> %<ttms> %<chi> %<crc>/%<pssc> %<psql> %<cqhm> %<cquc> %<caun> %<phr>/%<pqsn> %<psct>"
+SquidRecord = collections.namedtuple('SquidRecord', ('timestamp', 'elapsed', 'client', 'cache_code',
+                                                     'status', 'response_bytes', 'method', 'url'))
+
+
+def parse_squid_line(line):
+    '''
+    Return the SquidRecord of a squid.log line, None if it can't be parsed.
+    elapsed is in seconds.
+    '''
+    fields = line.split()
+    if len(fields) < 7:
+        return None
+    try:
+        cache_code, _, status = fields[3].partition('/')
+        return SquidRecord(float(fields[0]),
+                           int(fields[1]) / 1000.0,
+                           fields[2],
+                           cache_code,
+                           int(status),
+                           int(fields[4]),
+                           fields[5],
+                           fields[6],
+                           )
+    except ValueError:
+        return None
+
+
+def body_size(record):
+    '''
+    Estimate the body size of a SquidRecord's response, response_bytes
+    includes the headers
+    '''
+    return max(record.response_bytes - RESPONSE_HEADER_ESTIMATE, 0)
+
+
+def read_squid_log(path):
+    '''
+    Stream the SquidRecords of a (possibly gzipped) squid.log
+    '''
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as fh:
+        for line in fh:
+            record = parse_squid_line(line)
+            if record is not None:
+                yield record
+
+
+def is_hit(cache_code):
+    '''
+    Whether a squid cache code (TCP_HIT, TCP_MEM_HIT, TCP_REFRESH_MISS, ...) was served from cache
+    '''
+    return 'HIT' in cache_code
+
+
+def origin_path(url):
+    '''
+    Path the replayed request for url uses: the host becomes the first path
+    component, so one remap rule sends every host to the origin and objects
+    of different hosts stay apart in the cache
+    '''
+    parts = urlparse.urlsplit(url)
+    path = '/{0}{1}'.format(parts.netloc or 'localhost', parts.path or '/')
+    if parts.query:
+        path += '?' + parts.query
+    return path
+
+
+class ReplayRoute(origin.Route):
+    '''
+    Origin route which answers with the size and status the replayer asks for
+    (in the X-Replay-Size and X-Replay-Status request headers)
+    '''
+    def __init__(self, cache_control='max-age=86400', **kwargs):
+        origin.Route.__init__(self, cache_control=cache_control, **kwargs)
+
+    def body(self, path, conn_requests, request_headers=None):
+        size = int((request_headers or {}).get(SIZE_HEADER.lower(), 0))
+        return origin.body_bytes(MAX_BODY_SIZE)[:size]
+
+    def response_status(self, path, request_headers=None):
+        return int((request_headers or {}).get(STATUS_HEADER.lower(), self.status))
+
+
+class Histogram(object):
+    '''
+    Fixed memory latency histogram with logarithmic buckets (2% wide), so
+    percentiles of logs with billions of requests fit in memory
+    '''
+    BASE = 1.02
+    MIN = 1e-6
+
+    def __init__(self):
+        self.counts = collections.defaultdict(int)
+        self.total = 0
+
+    def add(self, seconds):
+        self.counts[int(math.log(max(seconds, self.MIN) / self.MIN, self.BASE))] += 1
+        self.total += 1
+
+    def percentile(self, pct):
+        if not self.total:
+            return None
+        rank = max(int(math.ceil(pct / 100.0 * self.total)), 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return self.MIN * self.BASE ** (bucket + 0.5)
+
+    def percentiles(self):
+        '''
+        Return a dict of percentile name -> milliseconds, like LoadResult
+        '''
+        ret = {}
+        for pct in bench.PERCENTILES:
+            value = self.percentile(pct)
+            ret[bench.percentile_name(pct)] = value * 1000 if value is not None else None
+        return ret
+
+
+class ReplayResult(object):
+    '''
+    Hit ratio and latency of the replay next to those of the original log
+    '''
+    def __init__(self, speedup):
+        self.speedup = speedup
+        self.requests = 0
+        self.skipped = 0
+        self.errors = 0
+        self.statuses = collections.defaultdict(int)
+        self.original_hits = 0
+        self.original_latency = Histogram()
+        self.latency = Histogram()
+        # how late requests were sent compared to their (sped up) log time
+        self.lag = Histogram()
+        # set by the caller from the origin's request count
+        self.origin_requests = None
+        self.elapsed = 0
+
+    @property
+    def original_hit_ratio(self):
+        return float(self.original_hits) / self.requests if self.requests else None
+
+    @property
+    def hit_ratio(self):
+        if self.origin_requests is None or not self.requests:
+            return None
+        return 1 - float(self.origin_requests) / self.requests
+
+    def to_dict(self):
+        return {'scenario': 'replay',
+                'requests': self.requests,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'elapsed': self.elapsed,
+                'speedup': self.speedup,
+                'statuses': dict((str(k), v) for k, v in self.statuses.iteritems()),
+                'original': {'hit_ratio': self.original_hit_ratio,
+                             'latency_ms': self.original_latency.percentiles(),
+                             },
+                'replay': {'hit_ratio': self.hit_ratio,
+                           'latency_ms': self.latency.percentiles(),
+                           },
+                'lag_ms': self.lag.percentiles(),
+                }
+
+
+class Replayer(object):
+    '''
+    Re-issue the GETs of a squid log against address, preserving the time
+    between requests (divided by speedup)
+
+    Requests are sent by a pool of concurrency keepalive clients fed from a
+    bounded queue, so the log is streamed and never held in memory. If the
+    pool can't keep up requests are sent late, which shows up in the lag
+    percentiles. Only GETs are replayed.
+    '''
+    def __init__(self, address, speedup=1.0, concurrency=64, timeout=30):
+        self.address = address
+        self.speedup = speedup
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def _worker(self, queue, result, lock):
+        conn = None
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            due, record = item
+            headers = {SIZE_HEADER: min(body_size(record), MAX_BODY_SIZE)}
+            # statuses which can't have a body (and aborted requests, logged
+            # as 0) are answered with a 200
+            if record.status >= 200 and record.status not in (200, 204, 206, 304):
+                headers[STATUS_HEADER] = record.status
+            start = time.time()
+            try:
+                if conn is None:
+                    conn = httplib.HTTPConnection(self.address[0], self.address[1], timeout=self.timeout)
+                conn.request('GET', origin_path(record.url), headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+            except (socket.error, httplib.HTTPException) as e:
+                log.debug('replay of {0} failed: {1}'.format(record.url, e))
+                with lock:
+                    result.errors += 1
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                continue
+            end = time.time()
+            with lock:
+                result.latency.add(end - start)
+                result.lag.add(max(start - due, 0))
+                result.statuses[resp.status] += 1
+            if resp.will_close:
+                conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def run(self, records, limit=None):
+        '''
+        Replay records (e.g. from read_squid_log()), at most limit of them,
+        and return a ReplayResult
+        '''
+        result = ReplayResult(self.speedup)
+        lock = threading.Lock()
+        queue = Queue.Queue(maxsize=self.concurrency * 4)
+        threads = [threading.Thread(target=self._worker, args=(queue, result, lock)) for _ in xrange(self.concurrency)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        start = time.time()
+        first = None
+        try:
+            for record in records:
+                if limit is not None and result.requests >= limit:
+                    break
+                if record.method != 'GET':
+                    result.skipped += 1
+                    continue
+                if first is None:
+                    first = record.timestamp
+                due = start + (record.timestamp - first) / self.speedup
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                queue.put((due, record))
+
+                result.requests += 1
+                result.original_latency.add(record.elapsed)
+                if is_hit(record.cache_code):
+                    result.original_hits += 1
+        finally:
+            for _ in threads:
+                queue.put(None)
+            for t in threads:
+                t.join()
+        result.elapsed = time.time() - start
+        return result
@@ -0,0 +1,242 @@
+'''
+Minimal SPDY/3.1 client and load generator for the SPDY benchmarks
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import logging
+import socket
+import struct
+import time
+import zlib
+
+import bench
+
+log = logging.getLogger(__name__)
+
+VERSION = 3
+
+# control frame types
+SYN_STREAM = 1
+SYN_REPLY = 2
+RST_STREAM = 3
+SETTINGS = 4
+PING = 6
+GOAWAY = 7
+HEADERS = 8
+WINDOW_UPDATE = 9
+
+FLAG_FIN = 0x01
+
+SETTINGS_INITIAL_WINDOW_SIZE = 7
+
+# flow control windows we give the proxy, per stream and for the session
+WINDOW = 16 * 1024 * 1024
+
+# control bit + version, type, flags + length
+_CONTROL = struct.Struct('!HHI')
+# stream id, flags + length
+_DATA = struct.Struct('!II')
+
+
+class SpdyError(Exception):
+    pass
+
+
+def control_frame(frame_type, data, flags=0):
+    return _CONTROL.pack(0x8000 | VERSION, frame_type, (flags << 24) | len(data)) + data
+
+
+def header_block(headers):
+    '''
+    Return the (uncompressed) name/value header block of a list of pairs
+    '''
+    parts = [struct.pack('!I', len(headers))]
+    for name, value in headers:
+        parts.append(struct.pack('!I', len(name)) + name + struct.pack('!I', len(value)) + value)
+    return ''.join(parts)
+
+
+class SpdySession(object):
+    '''
+    A SPDY/3.1 client session, enough to send GETs and time their responses
+
+    Response headers are not decoded: SPDY/3 compresses them against a preset
+    zlib dictionary, which python 2's zlib can't be given. Request headers
+    are compressed without one, which every receiver inflates. Streams are
+    reported complete with the number of body bytes received.
+    '''
+    def __init__(self, address, host='127.0.0.1', timeout=10):
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.host = host
+        self._compress = zlib.compressobj()
+        self._next_stream = 1
+        self._inbuf = ''
+        self._consumed = 0
+        # stream id -> body bytes received
+        self.streams = {}
+        self.closed = False
+
+        settings = struct.pack('!III', 1, SETTINGS_INITIAL_WINDOW_SIZE, WINDOW)
+        self.sock.sendall(control_frame(SETTINGS, settings) +
+                          control_frame(WINDOW_UPDATE, struct.pack('!II', 0, WINDOW - 65536)))
+
+    def request(self, path, method='GET'):
+        '''
+        Send a request without a body, return its stream id
+        '''
+        stream_id = self._next_stream
+        self._next_stream += 2
+        headers = header_block([(':method', method),
+                                (':path', path),
+                                (':version', 'HTTP/1.1'),
+                                (':host', self.host),
+                                (':scheme', 'http'),
+                                ])
+        block = self._compress.compress(headers) + self._compress.flush(zlib.Z_SYNC_FLUSH)
+        # stream id, associated stream id, priority (3 bits) and slot
+        self.sock.sendall(control_frame(SYN_STREAM, struct.pack('!IIBB', stream_id, 0, 0, 0) + block, FLAG_FIN))
+        self.streams[stream_id] = 0
+        return stream_id
+
+    def read(self):
+        '''
+        Read what the proxy sent, return [(stream_id, ok, body_bytes)] of the
+        streams which ended: ok is false for reset streams
+        '''
+        data = self.sock.recv(262144)
+        if not data:
+            self.closed = True
+            raise SpdyError('connection closed with {0} streams open'.format(len(self.streams)))
+        self._inbuf += data
+        done = []
+        replies = []
+        while len(self._inbuf) >= 8:
+            first, second = _DATA.unpack_from(self._inbuf)
+            length = second & 0xffffff
+            if len(self._inbuf) < 8 + length:
+                break
+            flags = second >> 24
+            payload = self._inbuf[8:8 + length]
+            self._inbuf = self._inbuf[8 + length:]
+
+            if not first & 0x80000000:
+                stream_id = first
+                if stream_id in self.streams:
+                    self.streams[stream_id] += length
+                self._consumed += length
+                if flags & FLAG_FIN:
+                    done.append((stream_id, True, self.streams.pop(stream_id, 0)))
+                continue
+
+            frame_type = first & 0xffff
+            if frame_type in (SYN_REPLY, HEADERS):
+                stream_id, = struct.unpack_from('!I', payload)
+                if flags & FLAG_FIN:
+                    done.append((stream_id, True, self.streams.pop(stream_id, 0)))
+            elif frame_type == RST_STREAM:
+                stream_id, status = struct.unpack_from('!II', payload)
+                log.debug('stream {0} reset with status {1}'.format(stream_id, status))
+                done.append((stream_id, False, self.streams.pop(stream_id, 0)))
+            elif frame_type == PING:
+                replies.append(control_frame(PING, payload))
+            elif frame_type == GOAWAY:
+                self.closed = True
+        # give back the window once half of it is used
+        if self._consumed >= WINDOW // 2:
+            replies.append(control_frame(WINDOW_UPDATE, struct.pack('!II', 0, self._consumed)))
+            self._consumed = 0
+        if replies:
+            self.sock.sendall(''.join(replies))
+        return done
+
+    def close(self):
+        self.sock.close()
+
+
+class SpdyGenerator(bench.Generator):
+    '''
+    Send GETs for paths (a list or a callable, like LoadGenerator) over
+    concurrency SPDY sessions, each with up to streams requests in flight.
+    Records the latency of every stream. Streams which end with body_size
+    body bytes count as 200 (the origin sends nothing else with that body),
+    others as 'unexpected_size'; reset streams are errors.
+    '''
+    def __init__(self, address, paths, concurrency=4, streams=100, body_size=None, timeout=10):
+        bench.Generator.__init__(self, concurrency)
+        self.address = address
+        self.streams = streams
+        self.body_size = body_size
+        self.timeout = timeout
+
+        if callable(paths):
+            self._next = paths
+        else:
+            cycle = itertools.cycle(paths)
+            self._next = lambda: next(cycle)
+
+    def _worker(self):
+        latencies = []
+        statuses = {}
+        errors = 0
+        session = None
+        inflight = {}
+        more = True
+        while more or inflight:
+            try:
+                if session is None:
+                    session = SpdySession(self.address, timeout=self.timeout)
+                while more and not session.closed and len(inflight) < self.streams:
+                    path = self._take()
+                    if path is None:
+                        more = False
+                        break
+                    inflight[session.request(path)] = time.time()
+                if not inflight:
+                    if session.closed:
+                        # after a GOAWAY, carry on with a new session
+                        session.close()
+                        session = None
+                    continue
+                for stream_id, ok, size in session.read():
+                    start = inflight.pop(stream_id, None)
+                    if start is None:
+                        continue
+                    if not ok:
+                        errors += 1
+                        continue
+                    latencies.append(time.time() - start)
+                    status = 200 if self.body_size is None or size == self.body_size else 'unexpected_size'
+                    statuses[status] = statuses.get(status, 0) + 1
+            except (socket.error, SpdyError) as e:
+                log.debug('SPDY session failed: {0}'.format(e))
+                if inflight:
+                    errors += len(inflight)
+                    inflight = {}
+                elif self._take() is not None:
+                    # the session could not even be opened, that costs a request
+                    errors += 1
+                else:
+                    more = False
+                if session is not None:
+                    session.close()
+                    session = None
+        if session is not None:
+            session.close()
+        self._merge(latencies, statuses, errors)
@@ -0,0 +1,304 @@
+'''
+Fast analysis of squid format access logs with numpy
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import glob
+import logging
+import mmap
+import multiprocessing
+import os
+
+import numpy
+
+import percentiles
+
+log = logging.getLogger(__name__)
+
+# "%<cqtq> %<ttms> %<chi> %<crc>/%<pssc> %<psql> %<cqhm> %<cquc> %<caun> %<phr>/%<pqsn> %<psct>"
+FIELDS = 10
+
+# bytes parsed at a time, and the smallest part of a file given to a process
+CHUNK_SIZE = 16 * 1024 * 1024
+SPLIT_SIZE = 256 * 1024 * 1024
+
+# latencies are counted per millisecond up to this, longer ones in the last bucket
+MAX_LATENCY_MS = 10 * 60 * 1000
+
+
+def log_files(logdir, name='squid.log'):
+    '''
+    Return the current log name in logdir and its rolled (.old) siblings
+    '''
+    return sorted(path for path in glob.glob(os.path.join(logdir, name + '*'))
+                  if not path.endswith('.meta') and os.path.isfile(path))
+
+
+def _valid_tokens(data):
+    '''
+    Tokens of the well formed lines of data, the slow path for chunks with
+    broken lines
+    '''
+    ret = []
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) != FIELDS:
+            continue
+        try:
+            float(fields[0])
+            int(fields[1])
+            int(fields[3].partition('/')[2])
+            int(fields[4])
+        except ValueError:
+            continue
+        ret.extend(fields)
+    return ret
+
+
+def parse_chunk(data):
+    '''
+    Parse whole squid.log lines into a dict of column arrays: timestamp
+    (seconds), elapsed (ms), cache_code, status, bytes, method and host
+    '''
+    tokens = data.split()
+    lines = data.count('\n') + (0 if data.endswith('\n') or not data else 1)
+    columns = None
+    if len(tokens) == FIELDS * lines:
+        try:
+            columns = _columns(tokens)
+        except ValueError:
+            pass
+    if columns is None:
+        columns = _columns(_valid_tokens(data))
+    return columns
+
+
+def url_hosts(urls):
+    '''
+    Return the host part of an array of urls, '-' for urls without a scheme
+    (CONNECT, or paths of badly formed requests)
+    '''
+    # str methods per url beat numpy.char, which copies the whole column for
+    # every call
+    return numpy.array([url.partition('://')[2].partition('/')[0] if '://' in url else '-' for url in urls],
+                       dtype=str)
+
+
+def _columns(tokens):
+    if not tokens:
+        empty = numpy.array([], dtype=str)
+        return {'timestamp': numpy.array([], dtype=numpy.float64),
+                'elapsed': numpy.array([], dtype=numpy.int64),
+                'cache_code': empty,
+                'status': numpy.array([], dtype=numpy.int32),
+                'bytes': numpy.array([], dtype=numpy.int64),
+                'method': empty,
+                'host': empty,
+                }
+    # a log has a handful of distinct "<cache code>/<status>", split those
+    code_status, inverse = numpy.unique(numpy.array(tokens[3::FIELDS], dtype=str), return_inverse=True)
+    code_status = numpy.char.partition(code_status, '/')
+    return {'timestamp': numpy.array(tokens[0::FIELDS], dtype=numpy.float64),
+            'elapsed': numpy.array(tokens[1::FIELDS], dtype=numpy.int64),
+            'cache_code': code_status[:, 0][inverse],
+            'status': code_status[:, 2].astype(numpy.int32)[inverse],
+            'bytes': numpy.array(tokens[4::FIELDS], dtype=numpy.int64),
+            'method': numpy.array(tokens[5::FIELDS], dtype=str),
+            'host': url_hosts(numpy.array(tokens[6::FIELDS], dtype=str)),
+            }
+
+
+def _grouped(keys, **weights):
+    '''
+    Return {key: {'requests': n, name: sum of weights[name]}}
+    '''
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    sums = dict((name, numpy.bincount(inverse, weights=w, minlength=len(unique)))
+                for name, w in weights.iteritems())
+    counts = numpy.bincount(inverse, minlength=len(unique))
+    ret = {}
+    for i, key in enumerate(unique):
+        entry = ret[str(key)] = {'requests': int(counts[i])}
+        for name, values in sums.iteritems():
+            entry[name] = int(values[i])
+    return ret
+
+
+def _merge_groups(into, other):
+    for key, entry in other.iteritems():
+        mine = into.setdefault(key, dict.fromkeys(entry, 0))
+        for name, value in entry.iteritems():
+            mine[name] += value
+
+
+class LogStats(object):
+    '''
+    Aggregates of a squid log: hit ratios, latency histogram (per ms), and
+    requests and bytes per cache code, status and host. LogStats of different
+    parts of a log can be merged.
+    '''
+    def __init__(self):
+        self.requests = 0
+        self.hits = 0
+        self.bytes = 0
+        self.hit_bytes = 0
+        self.first = None
+        self.last = None
+        self.latency = numpy.zeros(MAX_LATENCY_MS + 1, dtype=numpy.int64)
+        self.cache_codes = {}
+        self.statuses = {}
+        self.hosts = {}
+
+    def add(self, columns):
+        '''
+        Add the column arrays from parse_chunk()
+        '''
+        n = len(columns['timestamp'])
+        if not n:
+            return
+        codes, inverse = numpy.unique(columns['cache_code'], return_inverse=True)
+        hit = numpy.char.find(codes, 'HIT')[inverse] >= 0
+        nbytes = columns['bytes']
+
+        self.requests += n
+        self.hits += int(hit.sum())
+        self.bytes += int(nbytes.sum())
+        self.hit_bytes += int(nbytes[hit].sum())
+        first, last = float(columns['timestamp'].min()), float(columns['timestamp'].max())
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+        self.latency += numpy.bincount(numpy.clip(columns['elapsed'], 0, MAX_LATENCY_MS),
+                                       minlength=MAX_LATENCY_MS + 1)
+        _merge_groups(self.cache_codes, _grouped(columns['cache_code'], bytes=nbytes))
+        _merge_groups(self.statuses, _grouped(columns['status'], bytes=nbytes))
+        _merge_groups(self.hosts, _grouped(columns['host'], bytes=nbytes, hits=hit))
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.hits += other.hits
+        self.bytes += other.bytes
+        self.hit_bytes += other.hit_bytes
+        for attr, pick in (('first', min), ('last', max)):
+            values = [v for v in (getattr(self, attr), getattr(other, attr)) if v is not None]
+            setattr(self, attr, pick(values) if values else None)
+        self.latency += other.latency
+        _merge_groups(self.cache_codes, other.cache_codes)
+        _merge_groups(self.statuses, other.statuses)
+        _merge_groups(self.hosts, other.hosts)
+        return self
+
+    @property
+    def hit_ratio(self):
+        return float(self.hits) / self.requests if self.requests else None
+
+    @property
+    def byte_hit_ratio(self):
+        return float(self.hit_bytes) / self.bytes if self.bytes else None
+
+    def percentiles(self):
+        '''
+        Return a dict of percentile name -> milliseconds, like LoadResult
+        '''
+        ret = {}
+        cumulative = numpy.cumsum(self.latency)
+        for pct in percentiles.PERCENTILES:
+            if not self.requests:
+                ret[percentiles.percentile_name(pct)] = None
+                continue
+            rank = max(int(numpy.ceil(pct / 100.0 * self.requests)), 1)
+            ret[percentiles.percentile_name(pct)] = int(numpy.searchsorted(cumulative, rank))
+        return ret
+
+    def to_dict(self):
+        return {'scenario': 'squid_log',
+                'requests': self.requests,
+                'hit_ratio': self.hit_ratio,
+                'byte_hit_ratio': self.byte_hit_ratio,
+                'bytes': self.bytes,
+                'first': self.first,
+                'last': self.last,
+                'latency_ms': self.percentiles(),
+                'cache_codes': self.cache_codes,
+                'statuses': dict((str(k), v) for k, v in self.statuses.iteritems()),
+                'hosts': self.hosts,
+                }
+
+
+def chunks(data, start, end, chunk_size=CHUNK_SIZE):
+    '''
+    Yield the lines starting in [start, end) of data (a string or mmap) in
+    pieces of about chunk_size bytes, cut at line ends
+    '''
+    size = len(data)
+    if start > 0 and data[start - 1:start] != '\n':
+        # the line containing start belongs to the previous range
+        newline = data.find('\n', start)
+        start = size if newline < 0 else newline + 1
+    while start < end:
+        stop = min(start + chunk_size, end)
+        newline = data.find('\n', stop - 1) if stop < size else -1
+        stop = size if newline < 0 else newline + 1
+        yield data[start:stop]
+        start = stop
+
+
+def analyze_range(path, start=0, end=None):
+    '''
+    Return the LogStats of the lines of path starting in [start, end)
+    '''
+    stats = LogStats()
+    with open(path, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if not size:
+            return stats
+        data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for chunk in chunks(data, start, size if end is None else min(end, size)):
+                stats.add(parse_chunk(chunk))
+        finally:
+            data.close()
+    return stats
+
+
+def _analyze_range(args):
+    return analyze_range(*args)
+
+
+def analyze(paths, processes=None, split_size=SPLIT_SIZE):
+    '''
+    Return the merged LogStats of paths (a log and its rolled siblings, see
+    log_files()). Files are cut in split_size parts which are analyzed by a
+    pool of processes (default one per cpu).
+    '''
+    if isinstance(paths, basestring):
+        paths = [paths]
+    ranges = []
+    for path in paths:
+        size = os.path.getsize(path)
+        ranges.extend((path, start, start + split_size) for start in xrange(0, max(size, 1), split_size))
+
+    if len(ranges) == 1 or processes == 1:
+        parts = map(_analyze_range, ranges)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            parts = pool.map(_analyze_range, ranges)
+        finally:
+            pool.close()
+            pool.join()
+    return reduce(LogStats.merge, parts, LogStats())
@@ -0,0 +1,207 @@
+'''
+Break traffic_server start-up time down into phases
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import re
+import time
+
+import waiters
+
+# "[Oct 18 17:28:09.123] Server {0x7f0c5e0a8800} NOTE: traffic server running"
+DIAGS_LINE = re.compile(r'^\[(?P<month>\w{3}) +(?P<day>\d+) (?P<clock>\d\d:\d\d:\d\d)\.(?P<msec>\d{3})\] '
+                        r'\S+ \{[^}]*\} (?P<level>[A-Z]+): (?P<message>.*)$')
+
+# start-up Notes traffic_server logs, in the order main() reaches them
+CONFIG_DONE = re.compile(r'^cache clustering (enabled|disabled)$')
+PLUGIN_LOAD = re.compile(r"^loading plugin '(?P<path>.*)'$")
+SSL_LOAD = re.compile(r'^loading SSL certificate configuration from ')
+MAIN_DONE = re.compile(r'^traffic server running$')
+CACHE_DONE = re.compile(r'^cache (enabled|disabled)$')
+
+
+def diags_log(layout):
+    return os.path.join(layout.logdir, 'diags.log')
+
+
+def log_offset(layout):
+    '''
+    Return the current size of diags.log, pass it to read_notes() to only see
+    what was logged after this point
+    '''
+    try:
+        return os.stat(diags_log(layout)).st_size
+    except OSError:
+        return 0
+
+
+def parse_timestamp(month, day, clock, msec, now=None):
+    '''
+    Turn a diags timestamp (local time without a year) into epoch seconds
+    '''
+    now = now or time.time()
+    year = time.localtime(now).tm_year
+    ret = time.mktime(time.strptime('{0} {1} {2} {3}'.format(year, month, day, clock), '%Y %b %d %H:%M:%S'))
+    # a log line from December read in January
+    if ret > now + 86400:
+        ret = time.mktime(time.strptime('{0} {1} {2} {3}'.format(year - 1, month, day, clock), '%Y %b %d %H:%M:%S'))
+    return ret + int(msec) / 1000.0
+
+
+def read_notes(layout, offset=0):
+    '''
+    Return [(timestamp, message)] of the NOTE lines in diags.log past offset
+    '''
+    ret = []
+    now = time.time()
+    try:
+        fh = open(diags_log(layout))
+    except IOError:
+        return ret
+    with fh:
+        # diags.log was rolled since offset was taken
+        if offset > os.fstat(fh.fileno()).st_size:
+            offset = 0
+        fh.seek(offset)
+        for line in fh:
+            m = DIAGS_LINE.match(line.rstrip('\n'))
+            if m is None or m.group('level') != 'NOTE':
+                continue
+            ts = parse_timestamp(m.group('month'), m.group('day'), m.group('clock'), m.group('msec'), now)
+            ret.append((ts, m.group('message')))
+    return ret
+
+
+def wait_for_notes(layout, offset=0, timeout=waiters.DEFAULT_TIMEOUT):
+    '''
+    Like read_notes(), but wait until the end of start-up has been logged
+    (traffic_server may accept connections before it gets there)
+    '''
+    notes = []
+
+    def done():
+        notes[:] = read_notes(layout, offset)
+        return any(MAIN_DONE.match(message) for _, message in notes)
+    waiters.wait_for(done, timeout=timeout)
+    return notes
+
+
+def exec_time(pid):
+    '''
+    Return the (epoch) time pid was exec'd
+    '''
+    # field 22 of /proc/<pid>/stat is the start time in clock ticks since
+    # boot, the same clock as /proc/uptime. Fields are counted after the
+    # command name, which may contain spaces.
+    with open('/proc/{0}/stat'.format(pid)) as fh:
+        fields = fh.read().rsplit(')', 1)[1].split()
+    started = int(fields[19]) / float(os.sysconf('SC_CLK_TCK'))
+    with open('/proc/uptime') as fh:
+        uptime = float(fh.read().split()[0])
+    return time.time() - (uptime - started)
+
+
+def plugin_entries(plugin_config):
+    '''
+    Return the active lines of plugin.config, in load order
+    '''
+    ret = []
+    for line in plugin_config.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            ret.append(line)
+    return ret
+
+
+class StartupProfile(object):
+    '''
+    Where the time from exec to the first accepted connection went
+
+    Phases are the intervals between the Notes traffic_server logs on the way
+    up, so they have the millisecond resolution of diags.log:
+        config            exec until records and config files are loaded
+        core              event system, net, dns, hostdb, remap and logging
+        plugin <entry>    each plugin.config entry's dlopen and TSPluginInit
+        ssl_certificates  loading ssl_multicert.config until the next Note
+        cache             remaining cache/storage initialization (it starts
+                          right after the certificates and runs in the
+                          background, so this is 0 if it finished first)
+        listen            until the http port accepted a connection (may be
+                          negative, the port opens just before main() logs
+                          that it is done)
+    '''
+    def __init__(self, exec_time, accept_time, notes, plugins=()):
+        self.exec_time = exec_time
+        self.accept_time = accept_time
+        self.notes = notes
+        self.plugins = list(plugins)
+
+    def _find(self, pattern, after=0):
+        for ts, message in self.notes:
+            if ts >= after and pattern.match(message):
+                return ts
+        return None
+
+    @property
+    def total(self):
+        return self.accept_time - self.exec_time
+
+    def phases(self):
+        '''
+        Return [(name, seconds)] in start-up order
+        '''
+        ret = []
+        config_done = self._find(CONFIG_DONE)
+        ssl_start = self._find(SSL_LOAD)
+        if config_done is None or ssl_start is None:
+            return ret
+        main_done = self._find(MAIN_DONE, ssl_start) or self.accept_time
+        cache_done = self._find(CACHE_DONE, ssl_start) or main_done
+
+        plugin_loads = [ts for ts, message in self.notes if config_done <= ts <= ssl_start and PLUGIN_LOAD.match(message)]
+        ret.append(('config', config_done - self.exec_time))
+        ret.append(('core', (plugin_loads or [ssl_start])[0] - config_done))
+        for i, start in enumerate(plugin_loads):
+            end = plugin_loads[i + 1] if i + 1 < len(plugin_loads) else ssl_start
+            entry = self.plugins[i] if i < len(self.plugins) else str(i)
+            ret.append(('plugin {0}'.format(entry), end - start))
+        ssl_done = min(main_done, cache_done)
+        ret.append(('ssl_certificates', ssl_done - ssl_start))
+        ret.append(('cache', cache_done - ssl_done))
+        # without proxy.config.http.wait_for_cache the port opens before the
+        # cache is ready
+        listen_start = max(main_done, cache_done) if cache_done <= self.accept_time else main_done
+        ret.append(('listen', self.accept_time - listen_start))
+        return ret
+
+    def report(self):
+        '''
+        Return the phases as a human readable table
+        '''
+        lines = ['{0:<60} {1:>9}'.format('phase', 'ms')]
+        for name, seconds in self.phases():
+            lines.append('{0:<60} {1:>9.1f}'.format(name[:60], seconds * 1000))
+        lines.append('{0:<60} {1:>9.1f}'.format('total', self.total * 1000))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'scenario': 'startup',
+                'startup_seconds': self.total,
+                'phases': [{'name': name, 'seconds': seconds} for name, seconds in self.phases()],
+                }
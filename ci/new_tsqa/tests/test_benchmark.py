@@ -0,0 +1,103 @@
+'''
+Throughput and latency benchmarks of the basic proxy paths
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+
+import bench
+import metrics
+import origin
+import waiters
+
+log = logging.getLogger(__name__)
+
+# number of distinct cacheable objects used in the cache hit scenarios
+HIT_OBJECTS = 100
+
+
+class TestProxyBenchmark(bench.BenchmarkCase):
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        # paths under /hit/ are cacheable, everything else is a guaranteed miss
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=1024, cache_control='no-store'))
+        cls.origin.add_route('/hit/', body_size=1024, cache_control='max-age=3600')
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/\n'.format(cls.origin.port))
+
+        cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_in'] = 1
+        cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_out'] = 1
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    def _assert_clean(self, result):
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.statuses.keys(), [200])
+
+    def _warm(self, paths):
+        '''
+        Fetch every path once so the following run is served from cache
+        '''
+        result = bench.LoadGenerator(self.proxy_address, paths, concurrency=1).run('warm', requests=len(paths))
+        self._assert_clean(result)
+
+    def test_cache_miss_keepalive(self):
+        result = self.run_load('cache_miss_keepalive', bench.unique_paths('/miss/ka/'), keepalive=True)
+        self._assert_clean(result)
+
+    def test_cache_miss_no_keepalive(self):
+        result = self.run_load('cache_miss_no_keepalive', bench.unique_paths('/miss/noka/'), keepalive=False)
+        self._assert_clean(result)
+
+    def _run_hits(self, scenario, paths, keepalive):
+        '''
+        Warm paths, then run scenario against them: the origin must not see
+        any of its requests
+        '''
+        self._warm(paths)
+        origin_requests = self.origin.requests
+        result = self.run_load(scenario, paths,
+                               keepalive=keepalive,
+                               extra=lambda result: {'origin_requests': self.origin.requests - origin_requests},
+                               )
+        self._assert_clean(result)
+        self.assertEqual(self.origin.requests, origin_requests)
+
+    def test_cache_hit_keepalive(self):
+        self._run_hits('cache_hit_keepalive', ['/hit/ka/{0}'.format(x) for x in xrange(HIT_OBJECTS)], True)
+
+    def test_cache_hit_no_keepalive(self):
+        self._run_hits('cache_hit_no_keepalive', ['/hit/noka/{0}'.format(x) for x in xrange(HIT_OBJECTS)], False)
+
+    def test_cache_miss_metrics(self):
+        '''
+        Sample the proxy's counters during a run, they should account for
+        every request
+        '''
+        name = 'proxy.process.http.incoming_requests'
+        with self.sample_metrics() as series:
+            result = self.run_load('cache_miss_metrics', bench.unique_paths('/miss/metrics/'))
+            # the last requests show up in the next stats sync
+            self.assertTrue(waiters.wait_for(lambda: name in series.columns and series.delta(name) >= result.requests,
+                                             timeout=10))
+        self._assert_clean(result)
+        log.info('{0}: {1} samples, peak {2:.1f}/s'.format(name, len(series), max(series.rates(name))))
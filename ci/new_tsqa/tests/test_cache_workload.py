@@ -0,0 +1,154 @@
+'''
+Object and byte hit ratios of a Zipf workload for different cache sizes
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+
+import bench
+import helpers
+import metrics
+import origin
+import workload
+
+log = logging.getLogger(__name__)
+
+# the workload, see workload.Workload
+WORKLOAD_OBJECTS = int(os.environ.get('TSQA_WORKLOAD_OBJECTS', 20000))
+WORKLOAD_ALPHA = float(os.environ.get('TSQA_WORKLOAD_ALPHA', 0.8))
+WORKLOAD_CACHEABLE = float(os.environ.get('TSQA_WORKLOAD_CACHEABLE', 0.9))
+WORKLOAD_REQUESTS = int(os.environ.get('TSQA_WORKLOAD_REQUESTS', 20000))
+# sizes of the 200 responses of this squid.log instead of lognormal ones
+WORKLOAD_SIZES_LOG = os.environ.get('TSQA_WORKLOAD_SIZES_LOG')
+
+# cache sizes to run, limit with TSQA_CACHE_SIZES=256M
+CACHE_SIZES = os.environ.get('TSQA_CACHE_SIZES', '256M,1G').split(',')
+
+
+def storage_config(contents, size):
+    '''
+    Return storage.config contents with the size of every span set to size
+    '''
+    lines = []
+    for line in contents.splitlines():
+        fields = line.split()
+        if fields and not fields[0].startswith('#'):
+            line = ' '.join([fields[0], size] + fields[2:])
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def make_workload():
+    sizes = None
+    if WORKLOAD_SIZES_LOG:
+        sizes = workload.EmpiricalSizes.from_squid_log(WORKLOAD_SIZES_LOG)
+    return workload.Workload(objects=WORKLOAD_OBJECTS,
+                             alpha=WORKLOAD_ALPHA,
+                             sizes=sizes,
+                             cacheable=WORKLOAD_CACHEABLE,
+                             # long enough that nothing expires during the run, and some that do
+                             ttls=(60, 3600, 86400),
+                             )
+
+
+class CacheWorkloadMixin(object):
+    '''
+    Run the workload twice through a cache of cache_size with a RAM cache of
+    ram_cache_size (-1 is traffic_server's default): once to fill the cache,
+    then measure the object and byte hit ratios and throughput
+    '''
+    cache_size = '256M'
+    ram_cache_size = -1
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.cache_size not in CACHE_SIZES:
+            raise helpers.unittest.SkipTest('{0} not in TSQA_CACHE_SIZES'.format(cls.cache_size))
+        super(CacheWorkloadMixin, cls).setUpClass()
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.workload = make_workload()
+        cls.route = workload.WorkloadRoute()
+        cls.origin = origin.OriginDaemon()
+        cls.origin.add_route('/{0}/'.format(cls.workload.prefix), cls.route)
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+
+        storage = cls.configs['storage.config']
+        storage.contents = storage_config(storage.contents, cls.cache_size)
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+            'proxy.config.cache.ram_cache.size': cls.ram_cache_size,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    @property
+    def scenario(self):
+        return 'cache_workload_{0}_ram{1}'.format(self.cache_size, self.ram_cache_size)
+
+    def _run(self, scenario, seed):
+        self.workload.reset()
+        self.route.reset()
+        return self.run_load(scenario,
+                             self.workload.paths(seed=seed),
+                             requests=WORKLOAD_REQUESTS,
+                             extra=lambda result: dict(workload.cache_stats(self.workload, self.route, result.elapsed),
+                                                       cache_size=self.cache_size,
+                                                       ram_cache_size=self.ram_cache_size,
+                                                       request_seed=seed,
+                                                       ),
+                             )
+
+    def test_workload(self):
+        warm = self._run(self.scenario + '_warm', self.workload.seed + 1)
+        self.assertEqual(warm.errors, 0)
+
+        # the same popularity distribution, but not a replay of the warm run's
+        # requests
+        result = self._run(self.scenario, self.workload.seed + 2)
+        stats = workload.cache_stats(self.workload, self.route, result.elapsed)
+        log.info('{0}: hit ratio {1:.3f}, byte hit ratio {2:.3f}, {3:.1f}MB/s'.format(
+            self.scenario, stats['hit_ratio'], stats['byte_hit_ratio'], stats['bytes_per_second'] / 1048576))
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.statuses.keys(), [200])
+
+
+class TestCacheWorkload256M(CacheWorkloadMixin, bench.BenchmarkCase):
+    cache_size = '256M'
+
+
+class TestCacheWorkload256MNoRam(CacheWorkloadMixin, bench.BenchmarkCase):
+    cache_size = '256M'
+    ram_cache_size = 0
+
+
+class TestCacheWorkload1G(CacheWorkloadMixin, bench.BenchmarkCase):
+    cache_size = '1G'
+
+
+class TestCacheWorkload1GSmallRam(CacheWorkloadMixin, bench.BenchmarkCase):
+    cache_size = '1G'
+    ram_cache_size = 16 * 1024 * 1024
@@ -20,10 +20,13 @@ Some example tests of the new tsqa
 
 import os
 import requests
-import time
 import subprocess
 
 import helpers
+import logbuffer
+import metrics
+import squidlog
+import waiters
 
 import tsqa.test_cases
 import tsqa.utils
@@ -119,9 +122,31 @@ class TestBootstrap(helpers.EnvironmentCase):
             r_val = self.configs['records.config']['CONFIG'][k]
             self.assertEqual(type(r_val)(v), self.configs['records.config']['CONFIG'][k])
 
+    def test_mgmt_api(self):
+        '''
+        Same as test_trafficline, but over a management API connection
+        '''
+        client = metrics.MgmtClient(self.environment.layout)
+        try:
+            records = client.match('proxy.config')
+        finally:
+            client.close()
+        self.assertTrue(records)
+        for k, _, v in records:
+            if k not in self.configs['records.config']['CONFIG']:
+                continue
+            r_val = self.configs['records.config']['CONFIG'][k]
+            if isinstance(r_val, float):
+                # floats are sent as single precision
+                self.assertAlmostEqual(v, r_val, places=5)
+            else:
+                self.assertEqual(type(r_val)(v), r_val)
+
 
 class TestServerIntercept(helpers.EnvironmentCase, tsqa.test_cases.DynamicHTTPEndpointCase):
     endpoint_port = 60000
+    # intercept.so always relays to it, see runtests.py
+    fixed_ports = (endpoint_port,)
     @classmethod
     def setUpEnv(cls, env):
         cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}'.format(cls.endpoint_port))
@@ -162,13 +187,35 @@ class TestLogs(helpers.EnvironmentCase):
             self.assertEqual(ret.status_code, 404)
             self.assertIn('ATS', ret.headers['server'])
 
-        # TODO: some better way to know when the logs where syncd
-        time.sleep(10)  # wait for logs to hit disk
-
-        # verify that the log files exist
+        # verify that the log files exist (waiting for them to hit disk)
         for logfile in ('diags.log', 'error.log', 'squid.blog', 'traffic.out', 'manager.log'):
             logfile_path = os.path.join(self.environment.layout.logdir, logfile)
-            self.assertTrue(os.path.isfile(logfile_path), logfile_path)
+            self.assertTrue(waiters.wait_for_file(logfile_path), logfile_path)
+
+    def test_binary_log(self):
+        for x in xrange(0, 10):
+            ret = requests.get('http://127.0.0.1:{0}/binary'.format(self.configs['records.config']['CONFIG']['proxy.config.http.server_ports']))
+            self.assertEqual(ret.status_code, 404)
+
+        logfile_path = os.path.join(self.environment.layout.logdir, 'squid.blog')
+
+        def condition():
+            if not os.path.exists(logfile_path):
+                return None
+            with logbuffer.BinaryLog(logfile_path) as blog:
+                records = [r for r in blog.records() if r['cquc'].endswith('/binary')]
+            return records if len(records) >= 10 else None
+        records = waiters.wait_for(condition)
+        self.assertTrue(records)
+        for record in records:
+            self.assertEqual(record['pssc'], 404)
+            self.assertEqual(record['cqhm'], 'GET')
+            self.assertEqual(record['chi'], '127.0.0.1')
+            self.assertIn(record['crc'], logbuffer.CACHE_CODES.values())
+
+        columns = logbuffer.squid_columns(logfile_path)
+        self.assertEqual(len(columns['status']), len(columns['timestamp']))
+        self.assertIn(404, columns['status'])
 
 
 class TestLogRefCounting(tsqa.test_cases.DynamicHTTPEndpointCase, helpers.EnvironmentCase):
@@ -207,11 +254,27 @@ class TestLogRefCounting(tsqa.test_cases.DynamicHTTPEndpointCase, helpers.Enviro
             self.assertEqual(ret.status_code, 404)
             self.assertIn('ATS', ret.headers['server'])
 
-        # TODO: some better way to know when the logs where syncd
-        time.sleep(10)  # wait for logs to hit disk
-
+        # wait for the logs to hit disk
         logfile_path = os.path.join(self.environment.layout.logdir, 'squid.log')
-        self.assertTrue(os.path.isfile(logfile_path), logfile_path)
+        self.assertTrue(waiters.wait_for_file(logfile_path), logfile_path)
+
+    def test_log_stats(self):
+        for x in xrange(0, 10):
+            ret = requests.get('http://127.0.0.1:{0}/stats'.format(self.configs['records.config']['CONFIG']['proxy.config.http.server_ports']))
+            self.assertEqual(ret.status_code, 404)
+
+        # buffers are flushed every second, and the log may have been rolled
+        def condition():
+            paths = squidlog.log_files(self.environment.layout.logdir)
+            stats = squidlog.analyze(paths, processes=1) if paths else None
+            if stats is not None and stats.statuses.get('404', {}).get('requests', 0) >= 10:
+                return stats
+        stats = waiters.wait_for(condition)
+        self.assertTrue(stats)
+        self.assertEqual(stats.statuses.keys(), ['404'])
+        self.assertEqual(stats.hits, 0)
+        self.assertEqual(sum(entry['requests'] for entry in stats.hosts.itervalues()), stats.requests)
+        self.assertIsNotNone(stats.percentiles()['p99'])
 
 
 class TestDynamicHTTPEndpointCase(tsqa.test_cases.DynamicHTTPEndpointCase, helpers.EnvironmentCase):
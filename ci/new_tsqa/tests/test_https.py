@@ -18,7 +18,9 @@ import logging
 from OpenSSL import SSL
 import socket
 
+import bench
 import helpers
+import tlsbench
 import tsqa.utils
 
 
@@ -93,3 +95,58 @@ class TestSSL(helpers.EnvironmentCase):
 
         cert = self._get_cert(addr, sni_name='www.example.com')
         self.assertEqual(cert.get_subject().commonName.decode(), 'www.example.com')
+
+
+class TestSSLHandshakeBenchmark(bench.BenchmarkCase):
+    '''
+    Full and resumed (session ID and ticket) handshake rates and latency
+    against the ssl server port, with and without SNI
+    '''
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.ssl_port = tsqa.utils.bind_unused_port()[1]
+        cls.configs['records.config']['CONFIG']['proxy.config.http.server_ports'] += ' {0}:ssl'.format(cls.ssl_port)
+
+        cls.configs['ssl_multicert.config'].add_line('dest_ip=* ssl_cert_name={0}'.format(helpers.tests_file_path('rsa_keys/www.example.com.pem')))
+        cls.configs['ssl_multicert.config'].add_line('dest_ip=* ssl_cert_name={0}'.format(helpers.tests_file_path('rsa_keys/www.test.com.pem')))
+
+    def _handshakes(self, scenario, sni_name=None, resume=tlsbench.RESUME_NONE):
+        gen = tlsbench.HandshakeGenerator(('127.0.0.1', self.ssl_port),
+                                          concurrency=self.concurrency,
+                                          sni_name=sni_name,
+                                          resume=resume,
+                                          )
+        result = gen.run(scenario, requests=self.requests)
+        self.record_result(result,
+                           concurrency=gen.concurrency,
+                           sni=sni_name is not None,
+                           resume=resume,
+                           )
+        self.assertEqual(result.errors, 0)
+        if resume is tlsbench.RESUME_NONE:
+            self.assertEqual(result.statuses.keys(), ['full'])
+        else:
+            self.assertEqual(result.statuses.keys(), ['resumed'])
+        return result
+
+    def test_full(self):
+        self._handshakes('tls_full')
+
+    def test_full_sni(self):
+        self._handshakes('tls_full_sni', sni_name='www.test.com')
+
+    def test_resume_session_id(self):
+        self._handshakes('tls_resume_session_id', resume=tlsbench.RESUME_SESSION_ID)
+
+    def test_resume_session_id_sni(self):
+        self._handshakes('tls_resume_session_id_sni', sni_name='www.test.com', resume=tlsbench.RESUME_SESSION_ID)
+
+    def test_resume_ticket(self):
+        self._handshakes('tls_resume_ticket', resume=tlsbench.RESUME_TICKET)
+
+    def test_resume_ticket_sni(self):
+        self._handshakes('tls_resume_ticket_sni', sni_name='www.test.com', resume=tlsbench.RESUME_TICKET)
@@ -0,0 +1,95 @@
+'''
+Cost of the server intercept path (intercept.so) against the normal origin
+path under concurrent load
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+
+import bench
+import metrics
+import origin
+
+log = logging.getLogger(__name__)
+
+# intercept.so always relays to this port (like TestServerIntercept's endpoint),
+# the fixed_ports of both keep runtests.py from running them at the same time
+INTERCEPT_PORT = 60000
+
+# concurrent clients, the intercept path is only interesting under load
+INTERCEPT_CONCURRENCY = int(os.environ.get('TSQA_INTERCEPT_CONCURRENCY', 64))
+
+
+class InterceptBenchMixin(object):
+    '''
+    Run uncacheable load (every request is a miss, which intercept.so
+    intercepts) with and without keepalive. Records requests/sec, latency
+    percentiles and traffic_server CPU per request (see run_load()).
+    '''
+    intercept = False
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon(port=INTERCEPT_PORT if cls.intercept else 0,
+                                         default_route=origin.Route(body_size=1024, cache_control='no-store'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+        if cls.intercept:
+            cls.configs['plugin.config'].add_line('intercept.so')
+
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    @property
+    def path_name(self):
+        return 'intercept' if self.intercept else 'origin'
+
+    def _run(self, keepalive):
+        scenario = '{0}_path_{1}'.format(self.path_name, 'keepalive' if keepalive else 'no_keepalive')
+        result = self.run_load(scenario,
+                               bench.unique_paths('/{0}/'.format(scenario)),
+                               concurrency=INTERCEPT_CONCURRENCY,
+                               keepalive=keepalive,
+                               extra={'intercept': self.intercept},
+                               )
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.statuses.keys(), [200])
+
+    def test_keepalive(self):
+        self._run(True)
+
+    def test_no_keepalive(self):
+        self._run(False)
+
+
+class TestInterceptPathBenchmark(InterceptBenchMixin, bench.BenchmarkCase):
+    intercept = True
+    fixed_ports = (INTERCEPT_PORT,)
+
+
+class TestOriginPathBenchmark(InterceptBenchMixin, bench.BenchmarkCase):
+    pass
@@ -19,7 +19,9 @@ import requests
 import time
 import logging
 
+import bench
 import helpers
+import origin
 
 import tsqa.test_cases
 import tsqa.utils
@@ -54,7 +56,7 @@ class KeepaliveTCPHandler(SocketServer.BaseRequestHandler):
                     '{body}'.format(content_length=len(body), body=body))
             self.request.sendall(resp)
 
-# TODO: test timeouts
+# origin timeouts are tested against misbehaving origins in test_origin_faults.py
 # https://issues.apache.org/jira/browse/TS-3312
 # https://issues.apache.org/jira/browse/TS-242
 
@@ -66,8 +68,8 @@ class TestKeepAliveOutHTTP(helpers.EnvironmentCase):
         This function is responsible for setting up the environment for this fixture
         This includes everything pre-daemon start
         '''
-        # create a socket server
-        cls.socket_server = tsqa.endpoint.SocketServerDaemon(KeepaliveTCPHandler)
+        # create an origin which counts the requests on each connection
+        cls.socket_server = origin.OriginDaemon()
         cls.socket_server.start()
         cls.socket_server.ready.wait()
         cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/\n'.format(cls.socket_server.port))
@@ -75,7 +77,7 @@ class TestKeepAliveOutHTTP(helpers.EnvironmentCase):
         # only add server headers when there weren't any
         cls.configs['records.config']['CONFIG']['proxy.config.http.response_server_enabled'] = 2
         cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_out'] = 1
-        cls.configs['records.config']['CONFIG']['share_server_session'] = 2
+        cls.configs['records.config']['CONFIG']['proxy.config.http.share_server_sessions'] = 2
 
         # set only one ET_NET thread (so we don't have to worry about the per-thread pools causing issues)
         cls.configs['records.config']['CONFIG']['proxy.config.exec_thread.limit'] = 1
@@ -121,7 +123,7 @@ class TestKeepAliveOutHTTPS(helpers.EnvironmentCase):
         # only add server headers when there weren't any
         cls.configs['records.config']['CONFIG']['proxy.config.http.response_server_enabled'] = 2
         cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_out'] = 1
-        cls.configs['records.config']['CONFIG']['share_server_session'] = 2
+        cls.configs['records.config']['CONFIG']['proxy.config.http.share_server_sessions'] = 2
 
         # set only one ET_NET thread (so we don't have to worry about the per-thread pools causing issues)
         cls.configs['records.config']['CONFIG']['proxy.config.exec_thread.limit'] = 1
@@ -150,3 +152,65 @@ class TestKeepAliveOutHTTPS(helpers.EnvironmentCase):
             ret = requests.get(url)
             self.assertEqual(ret.status_code, 200)
             self.assertEqual(ret.text.strip(), str(x))
+
+
+class ServerSessionReuseMixin(object):
+    '''
+    Measure how well ATS reuses origin connections with many concurrent
+    clients and several ET_NET threads, using the origin's connection ledger.
+    Subclasses pick the share_server_sessions mode.
+    '''
+    share_server_sessions = 2
+    exec_threads = int(os.environ.get('TSQA_BENCH_THREADS', 4))
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        # nothing is cacheable, so every request goes to the origin
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=1024, cache_control='no-store'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/\n'.format(cls.origin.port))
+
+        cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_out'] = 1
+        cls.configs['records.config']['CONFIG']['proxy.config.http.share_server_sessions'] = cls.share_server_sessions
+        cls.configs['records.config']['CONFIG']['proxy.config.exec_thread.limit'] = cls.exec_threads
+        cls.configs['records.config']['CONFIG']['proxy.config.exec_thread.autoconfig'] = 0
+
+    def test_reuse(self):
+        self.origin.ledger.mark()
+        result = self.run_load('server_session_reuse',
+                               bench.unique_paths('/reuse/'),
+                               keepalive=True,
+                               extra=lambda result: {'share_server_sessions': self.share_server_sessions,
+                                                     'exec_threads': self.exec_threads,
+                                                     'origin': self.origin.ledger.summary(),
+                                                     },
+                               )
+        summary = self.origin.ledger.summary()
+        log.info('share_server_sessions={0}: {1}'.format(self.share_server_sessions, summary))
+
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(summary['requests'], result.requests)
+        if self.share_server_sessions == 0:
+            # origin connections stay attached to their keepalive client
+            # session, but no client session can use another one's
+            self.assertGreaterEqual(summary['connections_opened'], min(self.concurrency, result.requests))
+            self.assertLessEqual(summary['connections_opened'], summary['requests'])
+        else:
+            self.assertGreater(summary['reuse_ratio'], 0)
+
+
+class TestServerSessionReuseNone(ServerSessionReuseMixin, bench.BenchmarkCase):
+    share_server_sessions = 0
+
+
+class TestServerSessionReuseGlobal(ServerSessionReuseMixin, bench.BenchmarkCase):
+    share_server_sessions = 1
+
+
+class TestServerSessionReuseThread(ServerSessionReuseMixin, bench.BenchmarkCase):
+    share_server_sessions = 2
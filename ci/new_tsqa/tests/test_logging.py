@@ -0,0 +1,216 @@
+'''
+Throughput of the logging pipeline, and what logging costs request handling
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import time
+
+import bench
+import helpers
+import logtail
+import metrics
+import origin
+import waiters
+
+log = logging.getLogger(__name__)
+
+# log object counts to run, limit with TSQA_LOG_OBJECTS=1,4
+LOG_OBJECT_COUNTS = [int(n) for n in os.environ.get('TSQA_LOG_OBJECTS', '1,4,16').split(',')]
+
+# entries which never made it to disk, by the stats of proxy/logging
+DROPPED_STATS = ('proxy.process.log.event_log_access_full',
+                 'proxy.process.log.event_log_access_fail',
+                 'proxy.process.log.num_lost_before_flush_to_disk',
+                 )
+
+
+def log_object(index, mode):
+    '''
+    Return the logs_xml.config lines of the index'th benchmark log object
+    '''
+    return ['<LogObject>',
+            '  <Format = "squid"/>',
+            '  <Filename = "bench{0}"/>'.format(index),
+            '  <Mode = "{0}"/>'.format(mode),
+            '</LogObject>',
+            ]
+
+
+class LoggingBenchMixin(object):
+    '''
+    Run uncacheable load with log_objects squid format log objects in mode
+    (ascii or binary) and with the log settings in log_config, and once with
+    logging disabled. Records entries written per second, entries dropped,
+    the time from logging an entry until it is on disk and the throughput
+    lost to logging.
+    '''
+    log_objects = 1
+    mode = 'ascii'
+    log_config = {}
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.log_objects not in LOG_OBJECT_COUNTS:
+            raise helpers.unittest.SkipTest('{0} log objects not in TSQA_LOG_OBJECTS'.format(cls.log_objects))
+        super(LoggingBenchMixin, cls).setUpClass()
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=1024, cache_control='no-store'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+
+        for i in xrange(cls.log_objects):
+            cls.configs['logs_xml.config'].add_lines(log_object(i, cls.mode))
+
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+            'proxy.config.log.logging_enabled': 3,
+            # only the benchmark's own log objects
+            'proxy.config.log.squid_log_enabled': 0,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+        cls.configs['records.config']['CONFIG'].update(cls.log_config)
+
+    @property
+    def scenario(self):
+        settings = ''.join('_{0}{1}'.format(k.rpartition('.')[2], v) for k, v in sorted(self.log_config.iteritems()))
+        return 'logging_{0}_{1}{2}'.format(self.mode, self.log_objects, settings)
+
+    def _restart_with_logging(self, logging_enabled):
+        self.configs['records.config']['CONFIG']['proxy.config.log.logging_enabled'] = logging_enabled
+        self.configs['records.config'].write()
+        self.timed_restart()
+
+    def _flush_stats(self, tail, series, result):
+        '''
+        Wait for every entry of the load run to be written, return what the
+        logging pipeline did
+        '''
+        expected = result.requests * self.log_objects
+        max_secs = int(self.configs['records.config']['CONFIG'].get('proxy.config.log.max_secs_per_buffer', 5))
+        waiters.wait_for(lambda: tail.entries >= expected, timeout=max_secs + 30)
+        # the stats are published every 100ms
+        time.sleep(0.5)
+
+        latencies = tail.sorted_latencies()
+        ret = {'log_objects': self.log_objects,
+               'log_mode': self.mode,
+               'log_config': self.log_config,
+               'log_entries': len(latencies),
+               'log_entries_expected': expected,
+               'flush_latency_ms': dict((bench.percentile_name(p), bench.percentile(latencies, p) * 1000 if latencies else None)
+                                        for p in bench.PERCENTILES),
+               }
+        names = series.names
+        if 'proxy.process.log.event_log_access_ok' in names:
+            ret['log_entries_per_second'] = series.delta('proxy.process.log.event_log_access_ok') / result.elapsed
+        if 'proxy.process.log.bytes_written_to_disk' in names:
+            ret['log_bytes_per_second'] = series.delta('proxy.process.log.bytes_written_to_disk') / result.elapsed
+        ret['log_dropped'] = sum(series.delta(name) for name in DROPPED_STATS if name in names)
+        return ret
+
+    def test_logging(self):
+        self._restart_with_logging(0)
+        off = self.run_load('logging_off', bench.unique_paths('/off/'), extra={'baseline_for': self.scenario})
+        self.assertEqual(off.errors, 0)
+
+        self._restart_with_logging(3)
+        extension = 'blog' if self.mode == 'binary' else 'log'
+        tail = logtail.LogTail(os.path.join(self.environment.layout.logdir, 'bench*.{0}'.format(extension)),
+                               binary=self.mode == 'binary')
+        tail.start()
+        stats = {}
+
+        def extra(result):
+            stats.update(self._flush_stats(tail, series, result))
+            stats['baseline_rps'] = off.rps
+            stats['throughput_cost'] = 1 - result.rps / off.rps if off.rps else None
+            return stats
+        try:
+            with self.sample_metrics() as series:
+                result = self.run_load(self.scenario, bench.unique_paths('/on/'), extra=extra)
+        finally:
+            tail.stop()
+
+        log.info('{0}: {1} entries, {2} dropped, {3:.0f} entries/s, flush latency {4}, throughput cost {5:.1%}'.format(
+            self.scenario, stats['log_entries'], stats['log_dropped'], stats.get('log_entries_per_second', 0),
+            stats['flush_latency_ms'], stats['throughput_cost'] or 0))
+        self.assertEqual(result.errors, 0)
+        # dropping entries is a result (logging is the bottleneck), not a failure
+        self.assertGreater(stats['log_entries'], 0)
+        self.assertLessEqual(stats['log_entries'], stats['log_entries_expected'])
+
+
+class TestLoggingAscii1(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 1
+
+
+class TestLoggingAscii4(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 4
+
+
+class TestLoggingAscii16(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 16
+
+
+class TestLoggingBinary1(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 1
+    mode = 'binary'
+
+
+class TestLoggingBinary4(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 4
+    mode = 'binary'
+
+
+class TestLoggingBinary16(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 16
+    mode = 'binary'
+
+
+# buffer and rolling sweep, on 4 ASCII log objects (the TestLogRefCounting setup)
+
+class TestLoggingSmallBuffers(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 4
+    log_config = {'proxy.config.log.log_buffer_size': 2048}
+
+
+class TestLoggingLargeBuffers(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 4
+    log_config = {'proxy.config.log.log_buffer_size': 65536}
+
+
+class TestLoggingFastFlush(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 4
+    log_config = {'proxy.config.log.max_secs_per_buffer': 1}
+
+
+class TestLoggingSizeRolling(LoggingBenchMixin, bench.BenchmarkCase):
+    log_objects = 4
+    log_config = {'proxy.config.log.rolling_enabled': 2,
+                  'proxy.config.log.rolling_size_mb': 1,
+                  }
@@ -0,0 +1,211 @@
+'''
+How long traffic_server holds connections, memory and threads for slow and
+broken origins, and how quickly its timeouts release them
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import time
+
+import bench
+import helpers
+import metrics
+import origin
+import waiters
+
+log = logging.getLogger(__name__)
+
+# faults to run, limit with TSQA_ORIGIN_FAULTS=silent,no_end
+ORIGIN_FAULTS = os.environ.get('TSQA_ORIGIN_FAULTS', ','.join(origin.FAULTS)).split(',')
+
+# requests stuck on the origin at the same time
+FAULT_CONNECTIONS = int(os.environ.get('TSQA_FAULT_CONNECTIONS', 100))
+
+# short server side timeouts, so a run takes seconds rather than minutes
+NO_ACTIVITY_TIMEOUT = 4
+ACTIVE_TIMEOUT = 12
+TIMEOUTS = {'proxy.config.http.transaction_no_activity_timeout_out': NO_ACTIVITY_TIMEOUT,
+            'proxy.config.http.transaction_active_timeout_out': ACTIVE_TIMEOUT,
+            'proxy.config.http.keep_alive_no_activity_timeout_out': NO_ACTIVITY_TIMEOUT,
+            'proxy.config.http.connect_attempts_timeout': NO_ACTIVITY_TIMEOUT,
+            'proxy.config.http.connect_attempts_max_retries': 0,
+            'proxy.config.http.connect_attempts_max_retries_dead_server': 0,
+            }
+
+# how late (in seconds) a timeout may fire before the test fails
+SLACK = 2
+
+
+def samples(series, name, since):
+    '''
+    Return the samples of name in series taken at or after since
+    '''
+    if name not in series.columns:
+        return []
+    return [v for t, v in zip(series.times, series.column(name)) if t >= since and v == v]
+
+
+def peak(series, name, since):
+    '''
+    Return the largest sample of name in series taken after since
+    '''
+    values = samples(series, name, since)
+    return max(values) if values else None
+
+
+class OriginFaultMixin(object):
+    '''
+    Send FAULT_CONNECTIONS concurrent requests to an origin which misbehaves
+    (see origin.FaultRoute), wait until traffic_server has closed every
+    origin connection and record how long that took, along with the peak
+    threads, file descriptors, rss and server connections of traffic_server.
+    Fails if a connection outlived max_lifetime (the timeout which should
+    have closed it) by more than SLACK.
+    '''
+    fault = None
+    route = {}
+    max_lifetime = None
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.fault not in ORIGIN_FAULTS:
+            raise helpers.unittest.SkipTest('{0} not in TSQA_ORIGIN_FAULTS'.format(cls.fault))
+        super(OriginFaultMixin, cls).setUpClass()
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon(default_route=origin.FaultRoute(cls.fault, cache_control='no-store', **cls.route))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+
+        cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_out'] = 1
+        cls.configs['records.config']['CONFIG'].update(TIMEOUTS)
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    def _released(self, start):
+        '''
+        Wait until traffic_server closed every origin connection, return how
+        long that took and what it held meanwhile
+        '''
+        ledger = self.origin.ledger
+        released = waiters.wait_for(lambda: self.origin.connections == 0,
+                                    timeout=self.max_lifetime + SLACK * 2)
+        summary = ledger.summary()
+        release_times = ledger.release_times()
+        # one last sample with everything released
+        self.memory.sample()
+        rss = samples(self.memory.series, 'rss', start)
+        ret = {'fault': self.fault,
+               'route': self.route,
+               'released': bool(released),
+               'release_seconds': time.time() - start,
+               'origin_connections': summary['connections_opened'],
+               'origin_lifetime_p50': summary['lifetime_p50'],
+               'origin_lifetime_max': summary['lifetime_max'],
+               'held_release_p50': bench.percentile(release_times, 50),
+               'held_release_max': release_times[-1] if release_times else None,
+               'peak_threads': peak(self.memory.series, 'threads', start),
+               'peak_fds': peak(self.memory.series, 'fds', start),
+               'peak_rss_growth': max(rss) - rss[0] if rss else None,
+               'rss_retained': rss[-1] - rss[0] if rss else None,
+               }
+        return ret
+
+    def test_fault(self):
+        self.origin.ledger.mark()
+        start = self.memory_mark()
+        stats = {}
+
+        def extra(result):
+            stats.update(self._released(start))
+            stats['peak_server_connections'] = peak(series, 'proxy.process.http.current_server_connections', start)
+            return stats
+        with self.sample_metrics() as series:
+            result = self.run_load('origin_fault_{0}'.format(self.fault),
+                                   bench.unique_paths('/{0}/'.format(self.fault)),
+                                   requests=FAULT_CONNECTIONS,
+                                   concurrency=FAULT_CONNECTIONS,
+                                   keepalive=False,
+                                   # longer than any server side timeout, so traffic_server gives up first
+                                   timeout=ACTIVE_TIMEOUT * 2,
+                                   extra=extra,
+                                   )
+
+        log.info('{0}: {1} origin connections released in {2:.1f}s (lifetime max {3}), peak threads {4}, fds {5}'.format(
+            self.fault, stats['origin_connections'], stats['release_seconds'], stats['origin_lifetime_max'],
+            stats['peak_threads'], stats['peak_fds']))
+        self.assertTrue(stats['released'])
+        if stats['origin_lifetime_max'] is not None:
+            self.assertLessEqual(stats['origin_lifetime_max'], self.max_lifetime + SLACK)
+        return result
+
+
+class TestFaultFirstByte(OriginFaultMixin, bench.BenchmarkCase):
+    '''
+    Slow first byte, below the timeouts: every request succeeds late
+    '''
+    fault = 'first_byte'
+    route = {'delay': NO_ACTIVITY_TIMEOUT / 2.0}
+    # the idle server session is closed by keep_alive_no_activity_timeout_out
+    max_lifetime = NO_ACTIVITY_TIMEOUT / 2.0 + NO_ACTIVITY_TIMEOUT
+
+    def test_fault(self):
+        result = super(TestFaultFirstByte, self).test_fault()
+        self.assertEqual(result.statuses.get(200, 0), FAULT_CONNECTIONS)
+
+
+class TestFaultTrickle(OriginFaultMixin, bench.BenchmarkCase):
+    '''
+    A body which takes longer than the active timeout, but never stalls for
+    the no activity timeout
+    '''
+    fault = 'trickle'
+    route = {'body_size': 4096, 'trickle_size': 64, 'interval': 1}
+    max_lifetime = ACTIVE_TIMEOUT
+
+
+class TestFaultReset(OriginFaultMixin, bench.BenchmarkCase):
+    '''
+    Connection reset half way through the body
+    '''
+    fault = 'reset'
+    route = {'body_size': 4096, 'reset_after': 2048}
+    max_lifetime = 0
+
+
+class TestFaultNoEnd(OriginFaultMixin, bench.BenchmarkCase):
+    '''
+    A keepalive response whose body never ends, on a connection the origin
+    never closes
+    '''
+    fault = 'no_end'
+    max_lifetime = NO_ACTIVITY_TIMEOUT
+
+
+class TestFaultSilent(OriginFaultMixin, bench.BenchmarkCase):
+    '''
+    An origin which accepts the connection and never answers (half open)
+    '''
+    fault = 'silent'
+    max_lifetime = NO_ACTIVITY_TIMEOUT
@@ -0,0 +1,119 @@
+'''
+What each plugin.config entry, and each hook of it, costs in throughput,
+latency and proxy CPU
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+
+import bench
+import metrics
+import origin
+import pluginbench
+import test_startup
+
+log = logging.getLogger(__name__)
+
+# the plugin.config to profile, by default the tcpinfo stack of TestLogRefCounting.
+# Its plugins have to be in the build under test.
+PLUGIN_CONFIG = os.environ.get('TSQA_PLUGIN_CONFIG')
+# runs per plugin set, the median of each measure is used
+PLUGIN_REPEAT = int(os.environ.get('TSQA_PLUGIN_REPEAT', 3))
+# without keepalive every request is a new session, so session hooks cost
+# as much as transaction hooks
+PLUGIN_KEEPALIVE = bool(int(os.environ.get('TSQA_PLUGIN_KEEPALIVE', 0)))
+# how much cheaper than without plugins a run with them may measure
+COST_NOISE = 0.1
+
+
+class TestPluginCosts(bench.BenchmarkCase):
+    '''
+    Run the same uncacheable load with every pluginbench.variants() plugin
+    set (restarting traffic_server with it) and record every run, then the
+    cost of each entry and hook (see pluginbench.PluginCosts)
+    '''
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        if PLUGIN_CONFIG:
+            cls.plugins = pluginbench.read_plugin_config(PLUGIN_CONFIG)
+        else:
+            cls.plugins = test_startup.TCPINFO_PLUGINS
+
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=1024, cache_control='no-store'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+        cls.configs['plugin.config'].add_lines(cls.plugins)
+
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    def _load_plugins(self, entries):
+        '''
+        Restart traffic_server with only entries in plugin.config
+        '''
+        with open(os.path.join(self.environment.layout.sysconfdir, 'plugin.config'), 'w') as fh:
+            fh.write(''.join(entry + '\n' for entry in entries))
+        self.timed_restart()
+
+    def _run(self, index, name):
+        samples = []
+        for repeat in xrange(PLUGIN_REPEAT):
+            result = self.run_load('plugin_costs_variant',
+                                   bench.unique_paths('/plugins/{0}/{1}/'.format(index, repeat)),
+                                   keepalive=PLUGIN_KEEPALIVE,
+                                   extra={'plugin_variant': name, 'repeat': repeat},
+                                   )
+            self.assertEqual(result.errors, 0, name)
+            self.assertEqual(result.statuses.keys(), [200], name)
+            samples.append(pluginbench.measure(result))
+        return pluginbench.median(samples)
+
+    def test_plugin_costs(self):
+        variants = pluginbench.variants(self.plugins)
+        results = {}
+        try:
+            for index, (name, entries) in enumerate(variants):
+                self._load_plugins(entries)
+                results[name] = self._run(index, name)
+        finally:
+            self._load_plugins(self.plugins)
+
+        costs = pluginbench.PluginCosts(self.plugins, results)
+        self.record_result(costs)
+        log.info('plugin costs:\n{0}'.format(costs.report()))
+        # every entry has a cost against the full set
+        entry_costs = dict((plugin, c) for plugin, hook, c in costs.costs() if hook is None)
+        for i, entry in enumerate(self.plugins):
+            name = pluginbench.entry_name(i, entry)
+            self.assertIn(name, entry_costs)
+            self.assertIsNotNone(entry_costs[name]['proxy_cpu_us_per_request'], name)
+
+        # plugins don't make traffic_server cheaper
+        full, none = results['all'], results['none']
+        self.assertIsNotNone(none['proxy_cpu_us_per_request'])
+        self.assertGreaterEqual(full['proxy_cpu_us_per_request'],
+                                none['proxy_cpu_us_per_request'] * (1 - COST_NOISE))
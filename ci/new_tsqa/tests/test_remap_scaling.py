@@ -0,0 +1,160 @@
+'''
+How remap.config scales with the number of rules
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import random
+import requests
+import subprocess
+import time
+
+import bench
+import helpers
+import origin
+import procstats
+import waiters
+
+import tsqa.utils
+
+log = logging.getLogger(__name__)
+
+# rule counts to run, limit with TSQA_REMAP_COUNTS=100,1000
+REMAP_COUNTS = [int(n) for n in os.environ.get('TSQA_REMAP_COUNTS', '100,1000,10000,100000').split(',')]
+
+# generated rules cycle through these kinds
+KINDS = ('exact', 'wildcard', 'prefix', 'regex')
+
+
+def remap_rule(index, origin_port):
+    '''
+    Return the remap.config line for the index'th generated rule
+    '''
+    kind = KINDS[index % len(KINDS)]
+    target = 'http://127.0.0.1:{0}/'.format(origin_port)
+    if kind == 'exact':
+        return 'map http://exact{0}.remap.test/ {1}'.format(index, target)
+    elif kind == 'wildcard':
+        return r'regex_map http://[^.]+\.wild{0}\.remap\.test/ {1}'.format(index, target)
+    elif kind == 'prefix':
+        return 'map http://prefix.remap.test/p{0}/ {1}p{0}/'.format(index, target)
+    else:
+        return r'regex_map http://re{0}-[0-9]+\.remap\.test/ {1}'.format(index, target)
+
+
+def remap_url(index):
+    '''
+    Return a URL matched by the index'th generated rule (and no other)
+    '''
+    kind = KINDS[index % len(KINDS)]
+    if kind == 'exact':
+        return 'http://exact{0}.remap.test/'.format(index)
+    elif kind == 'wildcard':
+        return 'http://h{0}.wild{1}.remap.test/'.format(random.randrange(1000), index)
+    elif kind == 'prefix':
+        return 'http://prefix.remap.test/p{0}/obj'.format(index)
+    else:
+        return 'http://re{0}-{1}.remap.test/'.format(index, random.randrange(1000))
+
+
+class RemapScalingMixin(object):
+    '''
+    Load rule_count generated remap rules and measure start-up time,
+    resident memory, traffic_line -x reload time and per-request latency for
+    each kind of rule. Responses are uncacheable, so every request pays for
+    the remap lookup and nothing else varies between rule counts.
+    '''
+    rule_count = None
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.rule_count not in REMAP_COUNTS:
+            raise helpers.unittest.SkipTest('{0} rules not in TSQA_REMAP_COUNTS'.format(cls.rule_count))
+        super(RemapScalingMixin, cls).setUpClass()
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=128, cache_control='no-store'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+
+        cls.configs['remap.config'].add_lines([remap_rule(i, cls.origin.port) for i in xrange(cls.rule_count)])
+        cls.configs['records.config']['CONFIG']['proxy.config.url_remap.remap_required'] = 1
+
+    def _urls(self, kind):
+        indexes = [i for i in xrange(KINDS.index(kind), self.rule_count, len(KINDS))]
+        return lambda: remap_url(random.choice(indexes))
+
+    def _reload_time(self, timeout=600):
+        '''
+        Add a canary rule, run traffic_line -x and time until the canary maps
+        '''
+        canary = 'http://reload{0}.remap.test/'.format(int(time.time() * 1000))
+        self.configs['remap.config'].add_line('map {0} http://127.0.0.1:{1}/'.format(canary, self.origin.port))
+        self.configs['remap.config'].write()
+
+        start = time.time()
+        tsqa.utils.run_sync_command([os.path.join(self.environment.layout.bindir, 'traffic_line'), '-x'],
+                                    stdout=subprocess.PIPE)
+
+        def mapped():
+            try:
+                return requests.get(canary, proxies=self.proxies).status_code == 200
+            except requests.RequestException:
+                return False
+        self.assertTrue(waiters.wait_for(mapped, timeout=timeout, interval=0.01))
+        return time.time() - start
+
+    def test_scaling(self):
+        startup = self.timed_restart()
+        rss = procstats.rss(procstats.server_pid(self.environment.layout))
+        reload_time = self._reload_time()
+        log.info('{0} rules: start-up {1:.2f}s, reload {2:.2f}s, rss {3}'.format(self.rule_count, startup, reload_time, rss))
+
+        for kind in KINDS:
+            result = self.run_load('remap_{0}'.format(kind),
+                                   self._urls(kind),
+                                   extra={'rule_count': self.rule_count,
+                                          'startup_seconds': startup,
+                                          'reload_seconds': reload_time,
+                                          'rss_bytes': rss,
+                                          },
+                                   )
+            self.assertEqual(result.errors, 0)
+            self.assertEqual(result.statuses.keys(), [200])
+
+
+class TestRemapScaling100(RemapScalingMixin, bench.BenchmarkCase):
+    rule_count = 100
+
+
+class TestRemapScaling1000(RemapScalingMixin, bench.BenchmarkCase):
+    rule_count = 1000
+
+
+class TestRemapScaling10000(RemapScalingMixin, bench.BenchmarkCase):
+    rule_count = 10000
+
+
+class TestRemapScaling100000(RemapScalingMixin, bench.BenchmarkCase):
+    rule_count = 100000
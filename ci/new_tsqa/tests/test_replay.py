@@ -0,0 +1,117 @@
+'''
+Replay access logs through traffic_server
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import random
+
+import bench
+import helpers
+import origin
+import replay
+
+log = logging.getLogger(__name__)
+
+# squid.log to replay in TestReplayLog, and how to replay it
+REPLAY_LOG = os.environ.get('TSQA_REPLAY_LOG')
+REPLAY_SPEEDUP = float(os.environ.get('TSQA_REPLAY_SPEEDUP', 1))
+REPLAY_LIMIT = int(os.environ['TSQA_REPLAY_LIMIT']) if 'TSQA_REPLAY_LIMIT' in os.environ else None
+
+
+def synthetic_log(path, requests=2000, objects=200, rate=200.0, seed=0):
+    '''
+    Write a squid.log of requests over objects (a few popular, most not)
+    arriving at rate per second, with the hits and misses an infinite cache
+    would have had
+    '''
+    rng = random.Random(seed)
+    seen = set()
+    timestamp = 1400000000.0
+    with open(path, 'w') as fh:
+        for _ in xrange(requests):
+            timestamp += rng.expovariate(rate)
+            obj = min(int(rng.paretovariate(1.2)) - 1, objects - 1)
+            method = 'POST' if rng.random() < 0.01 else 'GET'
+            code = 'TCP_HIT' if obj in seen else 'TCP_MISS'
+            if method == 'GET':
+                seen.add(obj)
+            fh.write('{0:.3f} {1} 127.0.0.1 {2}/200 {3} {4} http://host{5}.example.com/obj/{6} - DIRECT/127.0.0.1 text/plain\n'.format(
+                timestamp, 1 if code == 'TCP_HIT' else 20, code, 512 + obj, method, obj % 4, obj))
+
+
+class ReplayMixin(object):
+    '''
+    Everything the proxy gets is sent to a ReplayRoute origin
+    '''
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon(default_route=replay.ReplayRoute())
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+
+        cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_in'] = 1
+        cls.configs['records.config']['CONFIG']['proxy.config.http.keep_alive_enabled_out'] = 1
+
+    def replay(self, scenario, path, speedup, limit=None):
+        '''
+        Replay the squid.log at path, record and return the replay.ReplayResult
+        '''
+        replayer = replay.Replayer(self.proxy_address, speedup=speedup, concurrency=self.concurrency)
+        origin_requests = self.origin.requests
+        mark = self.memory_mark()
+        result = replayer.run(replay.read_squid_log(path), limit=limit)
+        result.origin_requests = self.origin.requests - origin_requests
+        growth = self.memory_growth(mark)
+        self.record_result(result, replay_scenario=scenario, concurrency=replayer.concurrency, rss_growth=growth)
+        log.info('{0}: hit ratio {1} (originally {2}), latency {3}, lag {4}'.format(
+            scenario, result.hit_ratio, result.original_hit_ratio,
+            result.latency.percentiles(), result.lag.percentiles()))
+        self.assertMemoryGrowth(growth, requests=result.requests, connections=replayer.concurrency)
+        return result
+
+
+class TestReplaySynthetic(ReplayMixin, bench.BenchmarkCase):
+    def test_replay(self):
+        path = os.path.join(helpers.TMP_DIR, 'replay_squid.log')
+        if not os.path.isdir(helpers.TMP_DIR):
+            os.makedirs(helpers.TMP_DIR)
+        synthetic_log(path)
+
+        result = self.replay('synthetic', path, speedup=4)
+        self.assertEqual(result.errors, 0)
+        self.assertGreater(result.skipped, 0)
+        self.assertEqual(result.statuses.keys(), [200])
+        self.assertEqual(sum(result.statuses.values()), result.requests)
+        # the log was written for an infinite cache, the replay sees the same hits
+        self.assertAlmostEqual(result.hit_ratio, result.original_hit_ratio, delta=0.05)
+        # 2000 requests at 800/s take 2.5s
+        self.assertLess(result.elapsed, 10)
+
+
+class TestReplayLog(ReplayMixin, bench.BenchmarkCase):
+    def test_replay(self):
+        if not REPLAY_LOG:
+            self.skipTest('set TSQA_REPLAY_LOG to the squid.log to replay')
+        self.replay(os.path.basename(REPLAY_LOG), REPLAY_LOG, speedup=REPLAY_SPEEDUP, limit=REPLAY_LIMIT)
@@ -0,0 +1,109 @@
+'''
+Throughput, latency and proxy CPU of multiplexed SPDY sessions against the
+same workload over HTTP/1.1 keepalive
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+
+import bench
+import metrics
+import origin
+import spdybench
+
+import tsqa.utils
+
+log = logging.getLogger(__name__)
+
+# SPDY sessions, and streams in flight on each of them
+SPDY_SESSIONS = int(os.environ.get('TSQA_SPDY_SESSIONS', 4))
+SPDY_STREAMS = int(os.environ.get('TSQA_SPDY_STREAMS', 100))
+
+# size of the (cached) objects requested
+BODY_SIZE = 4096
+OBJECTS = 100
+
+
+class TestSpdyMultiplexing(bench.BenchmarkCase):
+    '''
+    Request the same cached objects over SPDY_SESSIONS SPDY sessions with
+    SPDY_STREAMS streams each, over as many HTTP/1.1 keepalive connections as
+    there are streams in flight, and over as many as there are sessions.
+    Records traffic_server's CPU seconds per request for each.
+    '''
+    environment_factory = {
+        'configure': {'enable-spdy': None},
+    }
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=BODY_SIZE, cache_control='max-age=3600'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+
+        # plain text SPDY goes through the protocol probe
+        cls.spdy_port = tsqa.utils.bind_unused_port()[1]
+        cls.configs['records.config']['CONFIG']['proxy.config.http.server_ports'] += ' {0}:proto=spdy'.format(cls.spdy_port)
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+            'proxy.config.spdy.max_concurrent_streams_in': SPDY_STREAMS,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    def _assert_clean(self, result):
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.statuses.keys(), [200])
+
+    def _http11(self, scenario, paths, connections):
+        result = self.run_load(scenario, paths,
+                               concurrency=connections,
+                               keepalive=True,
+                               extra={'spdy_sessions': SPDY_SESSIONS, 'spdy_streams': SPDY_STREAMS},
+                               )
+        self._assert_clean(result)
+        return result
+
+    def test_multiplexing(self):
+        paths = ['/spdy/{0}'.format(i) for i in xrange(OBJECTS)]
+        warm = bench.LoadGenerator(self.proxy_address, paths, concurrency=1).run('warm', requests=len(paths))
+        self._assert_clean(warm)
+
+        cpu_start = self.proxy_cpu_seconds()
+        gen = spdybench.SpdyGenerator(('127.0.0.1', self.spdy_port), paths,
+                                      concurrency=SPDY_SESSIONS,
+                                      streams=SPDY_STREAMS,
+                                      body_size=BODY_SIZE,
+                                      )
+        spdy = gen.run('spdy_multiplexed', requests=self.requests)
+        self.record_result(spdy,
+                           spdy_sessions=SPDY_SESSIONS,
+                           spdy_streams=SPDY_STREAMS,
+                           **self.cpu_stats(cpu_start, spdy)
+                           )
+        self._assert_clean(spdy)
+
+        # the same requests in flight, and the same number of connections
+        self._http11('spdy_http11_per_stream', paths, SPDY_SESSIONS * SPDY_STREAMS)
+        self._http11('spdy_http11_per_session', paths, SPDY_SESSIONS)
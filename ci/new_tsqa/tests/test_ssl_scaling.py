@@ -0,0 +1,130 @@
+'''
+How ssl_multicert.config scales with the number of certificates
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import random
+import time
+
+import bench
+import helpers
+import procstats
+import tlsbench
+
+import tsqa.utils
+
+log = logging.getLogger(__name__)
+
+# certificate counts to run, the large ones take a while to generate (once)
+# and load, so they can be limited with TSQA_CERT_COUNTS=10,100
+CERT_COUNTS = [int(n) for n in os.environ.get('TSQA_CERT_COUNTS', '10,100,1000,10000,50000').split(',')]
+
+
+class MulticertScalingMixin(object):
+    '''
+    Load cert_count generated certificates, each bound to its own loopback
+    address and indexed by its name, then measure start-up time, resident
+    memory and the handshake latency when looking certificates up by SNI
+    and by address
+    '''
+    cert_count = None
+
+    @classmethod
+    def setUpClass(cls):
+        if cls.cert_count not in CERT_COUNTS:
+            raise helpers.unittest.SkipTest('{0} certificates not in TSQA_CERT_COUNTS'.format(cls.cert_count))
+        super(MulticertScalingMixin, cls).setUpClass()
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.ssl_port = tsqa.utils.bind_unused_port()[1]
+        cls.configs['records.config']['CONFIG']['proxy.config.http.server_ports'] += ' {0}:ssl'.format(cls.ssl_port)
+
+        cert_dir = os.path.join(helpers.TMP_DIR, 'certs', str(cls.cert_count))
+        start = time.time()
+        cls.cert_paths = tlsbench.generate_certs(cert_dir, cls.cert_count)
+        log.info('{0} certificates ready in {1:.1f}s'.format(cls.cert_count, time.time() - start))
+
+        cls.configs['ssl_multicert.config'].add_line('dest_ip=* ssl_cert_name={0}'.format(cls.cert_paths[0]))
+        cls.configs['ssl_multicert.config'].add_lines(['dest_ip={0} ssl_cert_name={1}'.format(tlsbench.cert_ip(i), path)
+                                                       for i, path in enumerate(cls.cert_paths)])
+
+    def _assert_lookups(self):
+        '''
+        Spot check that both lookups serve the right certificate
+        '''
+        for i in random.sample(xrange(self.cert_count), min(self.cert_count, 10)):
+            cert = tlsbench.get_cert(('127.0.0.1', self.ssl_port), sni_name=tlsbench.cert_name(i))
+            self.assertEqual(cert.get_subject().commonName.decode(), tlsbench.cert_name(i))
+
+            cert = tlsbench.get_cert((tlsbench.cert_ip(i), self.ssl_port))
+            self.assertEqual(cert.get_subject().commonName.decode(), tlsbench.cert_name(i))
+
+    def _handshakes(self, scenario, **kwargs):
+        gen = tlsbench.HandshakeGenerator(concurrency=self.concurrency, **kwargs)
+        result = gen.run(scenario, requests=self.requests)
+        self.assertEqual(result.errors, 0)
+        return result
+
+    def test_scaling(self):
+        # restart so we time start-up on its own
+        startup = self.timed_restart(('127.0.0.1', self.ssl_port))
+        rss = procstats.rss(procstats.server_pid(self.environment.layout))
+
+        self._assert_lookups()
+
+        pick = lambda: random.randrange(self.cert_count)
+        sni = self._handshakes('multicert_sni',
+                               address=('127.0.0.1', self.ssl_port),
+                               sni_name=lambda: tlsbench.cert_name(pick()),
+                               )
+        ip = self._handshakes('multicert_ip',
+                              address=lambda: (tlsbench.cert_ip(pick()), self.ssl_port),
+                              )
+        for result in (sni, ip):
+            self.record_result(result,
+                               cert_count=self.cert_count,
+                               startup_seconds=startup,
+                               rss_bytes=rss,
+                               )
+
+
+class TestMulticertScaling10(MulticertScalingMixin, bench.BenchmarkCase):
+    cert_count = 10
+
+
+class TestMulticertScaling100(MulticertScalingMixin, bench.BenchmarkCase):
+    cert_count = 100
+
+
+class TestMulticertScaling1000(MulticertScalingMixin, bench.BenchmarkCase):
+    cert_count = 1000
+
+
+class TestMulticertScaling10000(MulticertScalingMixin, bench.BenchmarkCase):
+    cert_count = 10000
+
+
+class TestMulticertScaling50000(MulticertScalingMixin, bench.BenchmarkCase):
+    cert_count = 50000
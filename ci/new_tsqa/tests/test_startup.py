@@ -0,0 +1,67 @@
+'''
+Where traffic_server start-up time goes
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import bench
+import origin
+
+# the same plugin stack as TestLogRefCounting
+TCPINFO_PLUGINS = ['tcpinfo.so --log-file=tcpinfo{0} --hooks=ssn_start,txn_start,send_resp_hdr,ssn_close,txn_close --log-level=2'.format(i)
+                   for i in xrange(1, 5)]
+
+
+class StartupProfileMixin(object):
+    '''
+    Restart traffic_server and check (and record) the start-up profile
+    '''
+    plugins = []
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        cls.origin = origin.OriginDaemon()
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+        if cls.plugins:
+            cls.configs['plugin.config'].add_lines(cls.plugins)
+
+    def test_startup(self):
+        profile = self.profile_restart()
+        phases = profile.phases()
+        names = [name for name, _ in phases]
+
+        self.assertEqual(names[:2], ['config', 'core'])
+        self.assertEqual(names[-3:], ['ssl_certificates', 'cache', 'listen'])
+        self.assertEqual(names[2:-3], ['plugin {0}'.format(p) for p in self.plugins])
+        # everything up to the end of main() happens one after the other
+        for name, seconds in phases[:-1]:
+            self.assertGreaterEqual(seconds, 0, name)
+        self.assertGreater(profile.total, 0)
+
+
+class TestStartupProfile(StartupProfileMixin, bench.BenchmarkCase):
+    pass
+
+
+class TestStartupProfilePlugins(StartupProfileMixin, bench.BenchmarkCase):
+    plugins = TCPINFO_PLUGINS
@@ -0,0 +1,186 @@
+'''
+How throughput, latency, CPU and server session reuse scale with the number
+of ET_NET threads
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import multiprocessing
+import os
+
+import bench
+import metrics
+import origin
+import procstats
+import startup
+
+log = logging.getLogger(__name__)
+
+
+def default_thread_counts(cores):
+    '''
+    Return 1, 2, 4 ... below cores, cores and 'auto' (autoconfig)
+    '''
+    ret = []
+    threads = 1
+    while threads < cores:
+        ret.append(str(threads))
+        threads *= 2
+    return ret + [str(cores), 'auto']
+
+
+# exec_thread.limit values to run, 'auto' is exec_thread.autoconfig. Limit with
+# TSQA_THREAD_COUNTS=1,2,auto
+THREAD_COUNTS = os.environ.get('TSQA_THREAD_COUNTS',
+                               ','.join(default_thread_counts(multiprocessing.cpu_count()))).split(',')
+# concurrent keepalive clients, enough to keep the most threads busy
+THREAD_CONCURRENCY = int(os.environ.get('TSQA_THREAD_CONCURRENCY', 16 * multiprocessing.cpu_count()))
+
+
+def net_threads(pid):
+    '''
+    Return how many ET_NET threads pid runs
+    '''
+    return sum(1 for name, _ in procstats.thread_states(pid).itervalues() if name.startswith('[ET_NET '))
+
+
+class ThreadScalingCurve(object):
+    '''
+    Throughput, p99 latency, CPU utilization (cores busy) and server session
+    reuse ratio for each thread count, in the order they ran. Efficiency is
+    the throughput against the first point's scaled linearly by threads.
+    '''
+    def __init__(self):
+        self.points = []
+
+    def add(self, thread_count, **measures):
+        self.points.append(dict(measures, thread_count=thread_count))
+
+    def efficiency(self, point):
+        first = self.points[0]
+        if not point['net_threads'] or not first['net_threads'] or not first['rps']:
+            return None
+        return point['rps'] / (first['rps'] * point['net_threads'] / first['net_threads'])
+
+    def report(self):
+        '''
+        Return the curve as a human readable table
+        '''
+        def fmt(value, width, precision, scale=1):
+            if value is None:
+                return '{0:>{1}}'.format('-', width)
+            return '{0:>{1}.{2}f}'.format(value * scale, width, precision)
+
+        lines = ['{0:<8} {1:>7} {2:>10} {3:>9} {4:>7} {5:>10} {6:>7} {7:>10}'.format(
+            'limit', 'ET_NET', 'rps', 'p99 ms', 'cores', 'cpu us/req', 'reuse', 'efficiency')]
+        for point in self.points:
+            lines.append(' '.join(['{0:<8}'.format(point['thread_count']),
+                                   '{0:>7}'.format(point['net_threads']),
+                                   fmt(point['rps'], 10, 1),
+                                   fmt(point['p99'], 9, 2, 1000),
+                                   fmt(point['cpu_utilization'], 7, 2),
+                                   fmt(point['proxy_cpu_us_per_request'], 10, 1),
+                                   fmt(point['reuse_ratio'], 7, 3),
+                                   fmt(self.efficiency(point), 10, 2),
+                                   ]))
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'scenario': 'thread_scaling',
+                'points': [dict(point, efficiency=self.efficiency(point)) for point in self.points],
+                }
+
+
+class TestThreadScaling(bench.BenchmarkCase):
+    '''
+    Restart traffic_server with every THREAD_COUNTS exec_thread setting and
+    run the same uncacheable keepalive load (THREAD_CONCURRENCY clients,
+    per-thread server session pools). Records every run and the
+    ThreadScalingCurve.
+    '''
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        # nothing is cacheable, so every request needs a server session
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=1024, cache_control='no-store'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+            'proxy.config.http.share_server_sessions': 2,
+            'proxy.config.exec_thread.limit': 1,
+            'proxy.config.exec_thread.autoconfig': 0,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+
+    def _restart_with_threads(self, thread_count):
+        records = self.configs['records.config']['CONFIG']
+        if thread_count == 'auto':
+            records['proxy.config.exec_thread.autoconfig'] = 1
+        else:
+            records['proxy.config.exec_thread.autoconfig'] = 0
+            records['proxy.config.exec_thread.limit'] = int(thread_count)
+        self.configs['records.config'].write()
+        layout = self.environment.layout
+        offset = startup.log_offset(layout)
+        self.timed_restart()
+        # the main thread becomes ET_NET 0 after the port opens, at the end
+        # of start-up
+        startup.wait_for_notes(layout, offset)
+        return net_threads(procstats.server_pid(layout))
+
+    def test_thread_scaling(self):
+        curve = ThreadScalingCurve()
+        for thread_count in THREAD_COUNTS:
+            threads = self._restart_with_threads(thread_count)
+            self.origin.ledger.mark()
+            result = self.run_load('thread_scaling_{0}'.format(thread_count),
+                                   bench.unique_paths('/threads/{0}/'.format(thread_count)),
+                                   concurrency=THREAD_CONCURRENCY,
+                                   keepalive=True,
+                                   extra=lambda result: {'thread_count': thread_count,
+                                                         'net_threads': threads,
+                                                         'origin': self.origin.ledger.summary(),
+                                                         },
+                                   )
+            cpu = result.proxy_cpu
+            utilization = None
+            if cpu['proxy_cpu_seconds'] is not None and result.elapsed:
+                utilization = cpu['proxy_cpu_seconds'] / result.elapsed
+            self.assertEqual(result.errors, 0, thread_count)
+            self.assertEqual(result.statuses.keys(), [200], thread_count)
+
+            curve.add(thread_count,
+                      net_threads=threads,
+                      rps=result.rps,
+                      p99=bench.percentile(result.latencies, 99),
+                      cpu_utilization=utilization,
+                      proxy_cpu_us_per_request=cpu['proxy_cpu_us_per_request'],
+                      reuse_ratio=self.origin.ledger.summary()['reuse_ratio'],
+                      )
+            if thread_count != 'auto':
+                self.assertEqual(threads, int(thread_count))
+
+        self.record_result(curve)
+        log.info('thread scaling:\n{0}'.format(curve.report()))
@@ -0,0 +1,153 @@
+'''
+A burst of simultaneous misses for one slow object: how many reach the
+origin, and what the clients wait, with and without collapsed forwarding
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+
+import bench
+import metrics
+import origin
+
+log = logging.getLogger(__name__)
+
+# simultaneous requests per burst, and bursts (each for a new object) per test
+HERD_SIZE = int(os.environ.get('TSQA_HERD_SIZE', 1000))
+HERD_ROUNDS = int(os.environ.get('TSQA_HERD_ROUNDS', 3))
+
+# how long the origin takes to generate the object, below collapsed_connection's
+# default max_lock_retry_timeout (2s) after which waiting requests go forward
+ORIGIN_LATENCY = float(os.environ.get('TSQA_HERD_ORIGIN_LATENCY', 1))
+
+# share of a burst which may reach the origin when misses are collapsed, and
+# which must without collapsing (or the baseline shows no stampede to collapse)
+COLLAPSED_MAX_SHARE = float(os.environ.get('TSQA_HERD_COLLAPSED_MAX_SHARE', 0.05))
+STAMPEDE_MIN_SHARE = 0.5
+
+# let requests wait for the cache write lock for longer than the origin takes
+READ_WHILE_WRITER = {'proxy.config.cache.enable_read_while_writer': 1,
+                     'proxy.config.http.cache.max_open_read_retries': int(ORIGIN_LATENCY * 1000 / 10) * 2,
+                     'proxy.config.http.cache.open_read_retry_time': 10,
+                     }
+
+
+class ThunderingHerdMixin(object):
+    '''
+    Send HERD_SIZE simultaneous requests for an object which isn't cached
+    yet and takes the origin ORIGIN_LATENCY to generate. Records the origin
+    fetches (from the origin ledger) and client latency of every burst.
+    records are added to records.config, plugins to plugin.config.
+    '''
+    name = None
+    records = {}
+    plugins = []
+    # whether concurrent misses are expected to be collapsed
+    collapses = False
+
+    @classmethod
+    def setUpEnv(cls, env):
+        '''
+        This function is responsible for setting up the environment for this fixture
+        This includes everything pre-daemon start
+        '''
+        # collapsed_connection only collapses "public" cacheable responses
+        cls.origin = origin.OriginDaemon(default_route=origin.Route(body_size=16384,
+                                                                    latency=ORIGIN_LATENCY,
+                                                                    cache_control='public, max-age=3600'))
+        cls.origin.start()
+        cls.origin.ready.wait()
+        cls.configs['remap.config'].add_line('map / http://127.0.0.1:{0}/'.format(cls.origin.port))
+        if cls.plugins:
+            cls.configs['plugin.config'].add_lines(cls.plugins)
+
+        cls.configs['records.config']['CONFIG'].update({
+            'proxy.config.http.keep_alive_enabled_in': 1,
+            'proxy.config.http.keep_alive_enabled_out': 1,
+            'proxy.config.cache.enable_read_while_writer': 0,
+        })
+        cls.configs['records.config']['CONFIG'].update(metrics.SYNC_CONFIG)
+        cls.configs['records.config']['CONFIG'].update(cls.records)
+
+    @property
+    def scenario(self):
+        return 'thundering_herd_{0}'.format(self.name)
+
+    def test_herd(self):
+        for burst in xrange(HERD_ROUNDS):
+            self.origin.ledger.mark()
+            result = self.run_load(self.scenario,
+                                   ['/herd/{0}/{1}'.format(self.scenario, burst)],
+                                   requests=HERD_SIZE,
+                                   concurrency=HERD_SIZE,
+                                   # waiting collapsed requests can take a few origin round trips
+                                   timeout=ORIGIN_LATENCY * 10,
+                                   extra=lambda result: {'herd_size': HERD_SIZE,
+                                                         'burst': burst,
+                                                         'origin_latency': ORIGIN_LATENCY,
+                                                         'origin_fetches': self.origin.ledger.summary()['requests'],
+                                                         },
+                                   )
+            fetches = self.origin.ledger.summary()['requests']
+            log.info('{0} burst {1}: {2} origin fetches for {3} requests, {4}'.format(
+                self.scenario, burst, fetches, result.requests, result.percentiles()))
+
+            self.assertEqual(result.errors, 0)
+            self.assertEqual(result.statuses.keys(), [200])
+            self.assertGreaterEqual(fetches, 1)
+            if self.collapses:
+                self.assertLessEqual(fetches, HERD_SIZE * COLLAPSED_MAX_SHARE)
+            else:
+                self.assertGreaterEqual(fetches, HERD_SIZE * STAMPEDE_MIN_SHARE)
+
+
+class TestHerdBaseline(ThunderingHerdMixin, bench.BenchmarkCase):
+    '''
+    Every miss goes to the origin, the stampede the other classes collapse
+    '''
+    name = 'baseline'
+
+
+class TestHerdReadWhileWriter(ThunderingHerdMixin, bench.BenchmarkCase):
+    name = 'read_while_writer'
+    records = READ_WHILE_WRITER
+    collapses = True
+
+
+class TestHerdCollapsed(ThunderingHerdMixin, bench.BenchmarkCase):
+    name = 'collapsed'
+    environment_factory = {
+        'configure': {'enable-experimental-plugins': None},
+    }
+    plugins = ['collapsed_connection.so']
+    collapses = True
+
+
+class TestHerdCollapsedReadWhileWriter(ThunderingHerdMixin, bench.BenchmarkCase):
+    '''
+    collapsed_connection releases waiting requests as soon as the response
+    headers are in, and read while writer serves them the rest
+    '''
+    name = 'collapsed_read_while_writer'
+    environment_factory = {
+        'configure': {'enable-experimental-plugins': None},
+    }
+    plugins = ['collapsed_connection.so']
+    records = READ_WHILE_WRITER
+    collapses = True
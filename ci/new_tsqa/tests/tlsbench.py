@@ -0,0 +1,201 @@
+'''
+TLS benchmark helpers: handshake load generation and certificate fixtures
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import socket
+import struct
+import time
+
+from OpenSSL import SSL, crypto
+
+import bench
+
+log = logging.getLogger(__name__)
+
+# how handshakes are resumed
+RESUME_NONE = None
+RESUME_SESSION_ID = 'session_id'
+RESUME_TICKET = 'ticket'
+
+
+def session_reused(conn):
+    '''
+    Return whether the handshake on conn resumed a session
+    '''
+    if hasattr(conn, 'session_reused'):
+        return bool(conn.session_reused())
+    # older pyOpenSSL releases don't wrap SSL_session_reused()
+    from OpenSSL._util import lib
+    return bool(lib.SSL_session_reused(conn._ssl))
+
+
+def cert_name(index):
+    '''
+    Common name of the index'th generated certificate
+    '''
+    return 'host{0}.multicert.test'.format(index)
+
+
+def cert_ip(index):
+    '''
+    Loopback address that the index'th generated certificate is bound to
+    '''
+    n = index + 1
+    return '127.{0}.{1}.{2}'.format(1 + (n >> 16), (n >> 8) & 0xff, n & 0xff)
+
+
+def generate_certs(directory, count, bits=2048):
+    '''
+    Generate count self-signed certificates (sharing one key, which is by far
+    the most expensive part) into directory and return their paths. Each file
+    holds the certificate and key, as ssl_multicert.config's ssl_cert_name
+    expects. The set is reused if it was already generated.
+    '''
+    paths = [os.path.join(directory, str(i // 1000), '{0}.pem'.format(cert_name(i))) for i in xrange(count)]
+    done_marker = os.path.join(directory, 'complete')
+    if os.path.isfile(done_marker):
+        return paths
+
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, bits)
+    key_pem = crypto.dump_privatekey(crypto.FILETYPE_PEM, key)
+    for i, path in enumerate(paths):
+        cert = crypto.X509()
+        cert.get_subject().CN = cert_name(i)
+        cert.set_serial_number(i + 1)
+        cert.gmtime_adj_notBefore(0)
+        cert.gmtime_adj_notAfter(10 * 365 * 24 * 60 * 60)
+        cert.set_issuer(cert.get_subject())
+        cert.set_pubkey(key)
+        cert.sign(key, 'sha256')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fh:
+            fh.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+            fh.write(key_pem)
+    open(done_marker, 'w').close()
+    return paths
+
+
+def get_cert(address, sni_name=None):
+    '''
+    Return the certificate served on address, optionally sending sni_name
+    '''
+    sock = SSL.Connection(SSL.Context(SSL.SSLv23_METHOD), socket.create_connection(address))
+    try:
+        sock.set_connect_state()
+        if sni_name is not None:
+            sock.set_tlsext_host_name(sni_name)
+        sock.do_handshake()
+        return sock.get_peer_certificate()
+    finally:
+        sock.close()
+
+
+class HandshakeGenerator(bench.Generator):
+    '''
+    Run TLS handshakes against address from concurrent clients
+
+    resume selects full handshakes (None), session ID resumption or session
+    ticket resumption. address and sni_name may be callables, which are
+    called for every handshake. Results count 'full' and 'resumed' handshakes in
+    LoadResult.statuses and record the handshake (not TCP connect) latency.
+    '''
+    def __init__(self, address, concurrency=4, sni_name=None, resume=RESUME_NONE, timeout=10):
+        bench.Generator.__init__(self, concurrency)
+        self.address = address
+        self.sni_name = sni_name
+        self.resume = resume
+        self.timeout = timeout
+
+    def context(self):
+        ctx = SSL.Context(SSL.SSLv23_METHOD)
+        # TLSv1.3 has no session ID resumption and sends tickets after the
+        # handshake, stick to the protocols traffic_server negotiates
+        ctx.set_options(getattr(SSL, 'OP_NO_TLSv1_3', 0))
+        if self.resume == RESUME_SESSION_ID:
+            # without tickets the server has to resume from its session cache
+            ctx.set_options(SSL.OP_NO_TICKET)
+        return ctx
+
+    def handshake(self, ctx, session=None):
+        '''
+        Do one handshake, return (latency, reused, session)
+        '''
+        address = self.address() if callable(self.address) else self.address
+        sni_name = self.sni_name() if callable(self.sni_name) else self.sni_name
+        sock = socket.create_connection(address, timeout=self.timeout)
+        # pyOpenSSL needs a blocking socket, so enforce the timeout in the kernel
+        sock.settimeout(None)
+        timeval = struct.pack('ll', int(self.timeout), 0)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeval)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+        try:
+            conn = SSL.Connection(ctx, sock)
+            conn.set_connect_state()
+            if sni_name is not None:
+                conn.set_tlsext_host_name(sni_name)
+            if session is not None:
+                conn.set_session(session)
+            start = time.time()
+            conn.do_handshake()
+            latency = time.time() - start
+            reused = session_reused(conn)
+            session = conn.get_session()
+            # send close_notify, otherwise OpenSSL marks the session as not resumable
+            try:
+                conn.shutdown()
+            except SSL.Error:
+                pass
+            return latency, reused, session
+        finally:
+            sock.close()
+
+    def _worker(self):
+        latencies = []
+        statuses = {}
+        errors = 0
+        session = None
+        if self.resume is not RESUME_NONE:
+            session = self._sessions.pop()
+        while self._take() is not None:
+            try:
+                latency, reused, new_session = self.handshake(self._ctx, session)
+            except (socket.error, SSL.Error) as e:
+                log.debug('handshake failed: {0}'.format(e))
+                errors += 1
+                continue
+            latencies.append(latency)
+            kind = 'resumed' if reused else 'full'
+            statuses[kind] = statuses.get(kind, 0) + 1
+            if self.resume is not RESUME_NONE:
+                # tickets may be reissued, always resume the latest one
+                session = new_session
+        self._merge(latencies, statuses, errors)
+
+    def run(self, scenario, requests=None, duration=None):
+        self._ctx = self.context()
+        # get a session for every client before the clock starts
+        self._sessions = []
+        if self.resume is not RESUME_NONE:
+            for _ in xrange(self.concurrency):
+                self._sessions.append(self.handshake(self._ctx)[2])
+        return bench.Generator.run(self, scenario, requests=requests, duration=duration)
@@ -0,0 +1,191 @@
+'''
+Wait for real conditions (files, metrics, ports) instead of sleeping
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import socket
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30
+
+# inotify events which mean a file in a watched directory appeared or changed
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = os.O_NONBLOCK
+
+
+class Inotify(object):
+    '''
+    Minimal ctypes wrapper around the linux inotify API
+    '''
+    _libc = None
+
+    def __init__(self):
+        if Inotify._libc is None:
+            Inotify._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def watch(self, path, mask=_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE):
+        if self._libc.inotify_add_watch(self.fd, path, mask) < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+
+    def wait(self, timeout):
+        '''
+        Block until an event arrives or timeout passes, return if there was one
+        '''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # we only care that something happened, drain the queue
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def wait_for(condition, timeout=DEFAULT_TIMEOUT, interval=0.1):
+    '''
+    Poll condition() every interval seconds until it returns something true.
+    Returns the last value of condition() (so false on timeout)
+    '''
+    deadline = time.time() + timeout
+    while True:
+        ret = condition()
+        if ret or time.time() >= deadline:
+            return ret
+        time.sleep(min(interval, max(deadline - time.time(), 0)))
+
+
+def _file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def wait_for_file(path, min_size=0, timeout=DEFAULT_TIMEOUT):
+    '''
+    Wait until path exists and is at least min_size bytes. Pass the current
+    size + 1 as min_size to wait for a file to grow.
+
+    Uses inotify on the parent directory where available, so it returns as
+    soon as the file is written; otherwise it falls back to polling.
+    '''
+    def condition():
+        size = _file_size(path)
+        return size is not None and size >= min_size
+
+    try:
+        inotify = Inotify()
+        inotify.watch(os.path.dirname(os.path.abspath(path)))
+    except (OSError, AttributeError) as e:
+        log.debug('inotify unavailable ({0}), polling for {1}'.format(e, path))
+        return wait_for(condition, timeout=timeout)
+
+    deadline = time.time() + timeout
+    try:
+        while not condition():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            # wake up once in a while in case we raced the event
+            inotify.wait(min(remaining, 1))
+        return True
+    finally:
+        inotify.close()
+
+
+def read_metric(layout, name, client=None):
+    '''
+    Return the value of a record over the management API (None if unavailable)
+    '''
+    try:
+        if client is not None:
+            return client.get(name)
+        client = metrics.MgmtClient(layout)
+        try:
+            return client.get(name)
+        finally:
+            client.close()
+    except (socket.error, metrics.MgmtError):
+        return None
+
+
+def wait_for_metric(layout, name, value, timeout=DEFAULT_TIMEOUT, interval=0.25):
+    '''
+    Wait until the numeric record name is at least value
+    '''
+    clients = []
+
+    def condition():
+        # reuse one connection for every poll, reconnecting if it breaks
+        if not clients:
+            try:
+                clients.append(metrics.MgmtClient(layout))
+            except socket.error:
+                return False
+        current = read_metric(layout, name, clients[0])
+        if current is None:
+            clients.pop().close()
+            return False
+        try:
+            return float(current) >= value
+        except ValueError:
+            return False
+    try:
+        return wait_for(condition, timeout=timeout, interval=interval)
+    finally:
+        for client in clients:
+            client.close()
+
+
+def wait_for_port(address, timeout=DEFAULT_TIMEOUT, interval=0.05):
+    '''
+    Wait until something accepts TCP connections on address (host, port)
+    '''
+    def condition():
+        try:
+            socket.create_connection(address, timeout=interval).close()
+        except socket.error:
+            return False
+        return True
+    return wait_for(condition, timeout=timeout, interval=interval)
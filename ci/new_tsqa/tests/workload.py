@@ -0,0 +1,225 @@
+'''
+Synthetic cache workloads: Zipf popularity, object size distributions, a
+cacheable/uncacheable mix and TTLs, and the origin route which serves them
+'''
+
+#  Licensed to the Apache Software Foundation (ASF) under one
+#  or more contributor license agreements.  See the NOTICE file
+#  distributed with this work for additional information
+#  regarding copyright ownership.  The ASF licenses this file
+#  to you under the Apache License, Version 2.0 (the
+#  "License"); you may not use this file except in compliance
+#  with the License.  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import bisect
+import itertools
+import logging
+import math
+import random
+import threading
+
+import origin
+import replay
+
+log = logging.getLogger(__name__)
+
+# paths of workload objects: /<prefix>/<object>/<size>/<ttl>, ttl 0 is uncacheable
+PATH_FORMAT = '/{0}/{1}/{2}/{3}'
+
+# bodies are cut from one pattern of this size, larger objects are capped
+MAX_SIZE = 4 * 1024 * 1024
+
+
+class LognormalSizes(object):
+    '''
+    Object sizes with a lognormal distribution: median bytes, sigma is the
+    standard deviation of the log of the size
+    '''
+    def __init__(self, median=8192, sigma=1.5, max_size=MAX_SIZE):
+        self.mu = math.log(median)
+        self.sigma = sigma
+        self.max_size = max_size
+
+    def __call__(self, rng):
+        return max(min(int(rng.lognormvariate(self.mu, self.sigma)), self.max_size), 0)
+
+
+class EmpiricalSizes(object):
+    '''
+    Object sizes drawn from a list of observed sizes
+    '''
+    def __init__(self, sizes, max_size=MAX_SIZE):
+        if not sizes:
+            raise ValueError('No sizes to draw from')
+        self.sizes = [min(size, max_size) for size in sizes]
+
+    @classmethod
+    def from_squid_log(cls, path, limit=None, **kwargs):
+        '''
+        Sizes of the 200 responses in a squid.log
+        '''
+        records = (r for r in replay.read_squid_log(path) if r.status == 200)
+        return cls([replay.body_size(r) for r in itertools.islice(records, limit)], **kwargs)
+
+    def __call__(self, rng):
+        return rng.choice(self.sizes)
+
+
+class Zipf(object):
+    '''
+    Draw ranks 0..n-1 where rank k has probability proportional to
+    1 / (k + 1) ** alpha
+    '''
+    def __init__(self, n, alpha=0.8):
+        self.n = n
+        self.alpha = alpha
+        total = 0.0
+        self.cdf = []
+        for k in xrange(1, n + 1):
+            total += 1.0 / k ** alpha
+            self.cdf.append(total)
+        self.total = total
+
+    def __call__(self, rng):
+        return min(bisect.bisect_left(self.cdf, rng.random() * self.total), self.n - 1)
+
+
+class Workload(object):
+    '''
+    objects distinct objects requested with Zipf(alpha) popularity. Each
+    object gets a size from sizes (LognormalSizes by default), is cacheable
+    with probability cacheable and then has a TTL (seconds) drawn from ttls.
+    Everything is derived from seed, so runs are repeatable.
+    '''
+    def __init__(self, objects=10000, alpha=0.8, sizes=None, cacheable=0.9, ttls=(3600,),
+                 prefix='workload', seed=0):
+        self.objects = objects
+        self.alpha = alpha
+        self.cacheable = cacheable
+        self.prefix = prefix
+        self.seed = seed
+        self.zipf = Zipf(objects, alpha)
+        sizes = sizes or LognormalSizes()
+
+        rng = random.Random(seed)
+        self.sizes = [sizes(rng) for _ in xrange(objects)]
+        self.ttls = [rng.choice(ttls) if rng.random() < cacheable else 0 for _ in xrange(objects)]
+        # popularity rank -> object, so popularity doesn't follow the object numbers
+        self.ranks = range(objects)
+        rng.shuffle(self.ranks)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def path(self, obj):
+        return PATH_FORMAT.format(self.prefix, obj, self.sizes[obj], self.ttls[obj])
+
+    @property
+    def total_bytes(self):
+        '''
+        Size of every object, what a cache would need to hold them all
+        '''
+        return sum(self.sizes)
+
+    @property
+    def cacheable_bytes(self):
+        return sum(size for size, ttl in zip(self.sizes, self.ttls) if ttl)
+
+    def paths(self, seed=None):
+        '''
+        Return a callable which draws the path of the next request (for
+        bench.LoadGenerator) and counts the requests and bytes asked for.
+        The same seed draws the same sequence of requests, the default one is
+        derived from the workload's seed.
+        '''
+        rng = random.Random(self.seed + 1 if seed is None else seed)
+
+        def draw():
+            obj = self.ranks[self.zipf(rng)]
+            with self._lock:
+                self.requests += 1
+                self.bytes += self.sizes[obj]
+            return self.path(obj)
+        return draw
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes = 0
+
+    def to_dict(self):
+        return {'objects': self.objects,
+                'alpha': self.alpha,
+                'cacheable': self.cacheable,
+                'total_bytes': self.total_bytes,
+                'cacheable_bytes': self.cacheable_bytes,
+                'seed': self.seed,
+                }
+
+
+def parse_path(path):
+    '''
+    Return (size, ttl) of a workload path, None if it isn't one
+    '''
+    parts = path.split('?', 1)[0].split('/')
+    if len(parts) != 5:
+        return None
+    try:
+        return int(parts[3]), int(parts[4])
+    except ValueError:
+        return None
+
+
+class WorkloadRoute(origin.Route):
+    '''
+    Origin route serving workload objects: size deterministic bytes, cacheable
+    for ttl seconds or not at all. Counts the requests and body bytes it
+    served, which is what the proxy didn't serve from cache.
+    '''
+    def __init__(self, **kwargs):
+        origin.Route.__init__(self, **kwargs)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def body(self, path, conn_requests, request_headers=None):
+        size, _ = parse_path(path) or (0, 0)
+        # every body is a prefix of the same pattern, see origin.body_bytes()
+        body = origin.body_bytes(max(size, MAX_SIZE))[:size]
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(body)
+        return body
+
+    def response_cache_control(self, path, request_headers=None):
+        _, ttl = parse_path(path) or (0, 0)
+        return 'max-age={0}'.format(ttl) if ttl else 'no-store'
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes = 0
+
+
+def cache_stats(workload, route, elapsed):
+    '''
+    Object and byte hit ratios and throughput of a workload run since both
+    were reset: whatever the origin didn't serve came from the cache
+    '''
+    return {'workload': workload.to_dict(),
+            'requested_bytes': workload.bytes,
+            'origin_requests': route.requests,
+            'origin_bytes': route.bytes,
+            'hit_ratio': 1 - float(route.requests) / workload.requests if workload.requests else None,
+            'byte_hit_ratio': 1 - float(route.bytes) / workload.bytes if workload.bytes else None,
+            'bytes_per_second': workload.bytes / elapsed if elapsed else 0.0,
+            }